@@ -0,0 +1,122 @@
+"""
+Calibrate the face match threshold of an embedding model.
+
+Input is a labelled set of embeddings, either an .npz file with
+`embeddings` (N, D) and `labels` (N,) arrays (and optionally
+`model_version`), or a directory of face crops with one sub-directory per
+person, embedded here with the configured model.
+
+Examples:
+    python ai/scripts/calibrate_threshold.py --embeddings eval.npz --curve roc.csv
+    python ai/scripts/calibrate_threshold.py --images data/faces --target-far 1e-5 --save
+    python ai/scripts/calibrate_threshold.py --embeddings eval.npz --model-version 5 --save --plot roc.png
+
+--save writes the threshold for the model version to the thresholds file
+(FACE_THRESHOLDS_PATH, ai/model/match_thresholds.json by default); running
+servers pick it up within seconds.
+"""
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+from pathlib import Path
+
+import numpy as np
+
+# Add the backend root to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.services.embedding_rollout import rollout
+from app.services.match_threshold import match_thresholds
+from app.services.model_export import load_face_crops
+from app.services.threshold_calibration import distance_histograms, recommend_threshold, roc_curve
+
+
+def embed_directory(image_dir, per_identity, batch_size=64):
+    """Embed <dir>/<person>/<crop> with the serving model; returns (embeddings, labels, model version)."""
+    from app.services.face_recognition_service import FaceRecognitionService
+    service = FaceRecognitionService()
+
+    embeddings, labels = [], []
+    for label, person in enumerate(sorted(p for p in Path(image_dir).iterdir() if p.is_dir())):
+        crops = load_face_crops(str(person), limit=per_identity)
+        for start in range(0, len(crops), batch_size):
+            embeddings.append(service.embed_faces(crops[start:start + batch_size]))
+        labels.extend([label] * len(crops))
+    return np.concatenate(embeddings), np.array(labels), service.model_version
+
+def write_curve(path, roc):
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["threshold", "far", "frr"])
+        writer.writerows(roc.rows())
+
+def plot_curve(path, roc, threshold):
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, (rates, det) = plt.subplots(1, 2, figsize=(11, 4.5))
+    rates.plot(roc.thresholds, roc.far, label="FAR")
+    rates.plot(roc.thresholds, roc.frr, label="FRR")
+    rates.axvline(threshold, color="gray", linestyle="--", label=f"threshold {threshold:.3f}")
+    rates.set_yscale("log")
+    rates.set_xlabel("distance threshold")
+    rates.legend()
+    det.plot(roc.far, 1.0 - roc.frr)
+    det.set_xscale("log")
+    det.set_xlabel("false accept rate")
+    det.set_ylabel("true accept rate")
+    fig.tight_layout()
+    fig.savefig(path, dpi=120)
+
+def main():
+    parser = argparse.ArgumentParser(description="Calibrate the face match threshold from labelled embeddings")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--embeddings", help=".npz file with embeddings and labels arrays")
+    source.add_argument("--images", help="Directory of face crops, one sub-directory per person")
+    parser.add_argument("--per-identity", type=int, default=20, help="Crops embedded per person with --images")
+    parser.add_argument("--model-version", type=int, help="Model the embeddings come from (defaults to the serving model)")
+    parser.add_argument("--target-far", type=float, default=1e-5, help="Allowed false accept rate per comparison")
+    parser.add_argument("--block-size", type=int, default=4096, help="Rows per distance tile")
+    parser.add_argument("--bins", type=int, default=4000, help="Histogram resolution")
+    parser.add_argument("--curve", help="Write threshold/FAR/FRR rows to this CSV file")
+    parser.add_argument("--plot", help="Write FAR/FRR and ROC plots to this image (needs matplotlib)")
+    parser.add_argument("--save", action="store_true", help="Persist the threshold for the model version")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    if args.embeddings:
+        data = np.load(args.embeddings)
+        embeddings, labels = data["embeddings"], data["labels"]
+        model_version = int(data["model_version"]) if "model_version" in data else rollout.serving_version
+    else:
+        embeddings, labels, model_version = embed_directory(args.images, args.per_identity)
+    if args.model_version is not None:
+        model_version = args.model_version
+
+    print(f"{len(embeddings)} embeddings of {len(np.unique(labels))} people, model v{model_version}")
+    histograms = distance_histograms(
+        embeddings, labels, block_size=args.block_size, bins=args.bins,
+        progress=lambda done, total: print(f"  row block {done}/{total}", end="\r")
+    )
+    roc = roc_curve(histograms)
+    try:
+        recommendation = recommend_threshold(roc, args.target_far)
+    except ValueError as e:
+        # Nothing to save: no threshold meets the requested FAR
+        sys.exit(f"Error: {e}")
+    print(json.dumps(recommendation, indent=2))
+
+    if args.curve:
+        write_curve(args.curve, roc)
+    if args.plot:
+        plot_curve(args.plot, roc, recommendation["threshold"])
+    if args.save:
+        path = match_thresholds.save(model_version, **recommendation)
+        print(f"Threshold {recommendation['threshold']:.4f} saved for model v{model_version} in {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Bulk face enrollment from registrar ID photos.
+
+Examples:
+    python ai/scripts/enroll_faces.py --dir photos/            # files named <user_id>.jpg or <email>.jpg
+    python ai/scripts/enroll_faces.py --manifest photos.csv --workers 8 --report failures.csv
+
+The manifest is a CSV with a `path` column and a `user_id` or `email`
+column. Failures (unknown student, no face, quality, unreadable file) are
+written to the report. Afterwards the campus face index is rebuilt; run the
+script while the API is stopped, or restart it afterwards, so the server
+does not keep serving its old in-memory index.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+
+# Add the backend root to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.database import SessionLocal
+from app.services.ann_index import campus_index
+from app.services.bulk_enrollment import enroll, read_manifest, scan_directory, write_report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Enroll student faces from a directory or CSV manifest of photos")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--dir", help="Directory of photos named after the student (user_id or email)")
+    source.add_argument("--manifest", help="CSV with path and user_id or email columns")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4, help="Worker processes")
+    parser.add_argument("--chunk-size", type=int, default=32, help="Photos per worker task (one model batch)")
+    parser.add_argument("--commit-every", type=int, default=500, help="Embeddings per database transaction")
+    parser.add_argument("--report", default="enrollment_failures.csv", help="CSV report of failed photos")
+    parser.add_argument("--no-quality-check", action="store_true", help="Accept blurred, dark or small faces")
+    parser.add_argument("--no-index-rebuild", action="store_true", help="Skip rebuilding the campus face index")
+    parser.add_argument("--dry-run", action="store_true", help="Run detection and embedding without writing")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    items = scan_directory(args.dir) if args.dir else read_manifest(args.manifest)
+    print(f"Enrolling {len(items)} photos with {args.workers} workers")
+
+    def progress(done, total):
+        if done % 500 < args.chunk_size or done == total:
+            elapsed = time.perf_counter() - start
+            print(f"  {done}/{total} photos ({done / elapsed:.1f}/s)")
+
+    db = SessionLocal()
+    try:
+        start = time.perf_counter()
+        enrolled, failures = enroll(
+            db,
+            items,
+            workers=args.workers,
+            chunk_size=args.chunk_size,
+            commit_every=args.commit_every,
+            check_quality=not args.no_quality_check,
+            dry_run=args.dry_run,
+            progress=progress
+        )
+        elapsed = time.perf_counter() - start
+
+        if not args.dry_run and not args.no_index_rebuild:
+            campus_index.rebuild(db)
+    finally:
+        db.close()
+
+    write_report(args.report, failures)
+    print(f"Enrolled {enrolled} students in {elapsed:.1f}s; {len(failures)} failures written to {args.report}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""
+Export the Keras face embedding model for the TFLite or ONNX backend.
+
+Examples:
+    python ai/scripts/export_model.py --format tflite
+    python ai/scripts/export_model.py --format tflite --quantize int8 --calibration-dir data/faces
+    python ai/scripts/export_model.py --format onnx --quantize dynamic
+
+Then run the API with FACE_INFERENCE_BACKEND=tflite (or onnx).
+"""
+import argparse
+import logging
+import os
+import sys
+
+# Add the backend root to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.services.inference_backend import default_model_path
+from app.services.model_export import export_onnx, export_tflite, load_face_crops, preprocess_crops
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export the face embedding model to TFLite or ONNX")
+    parser.add_argument("--format", choices=["tflite", "onnx"], required=True)
+    parser.add_argument("--model", default=str(default_model_path("keras")), help="Source .keras model")
+    parser.add_argument("--output", help="Destination file (defaults to ai/model/<stem>.<format>)")
+    parser.add_argument(
+        "--quantize",
+        choices=["none", "float16", "dynamic", "int8"],
+        default="none",
+        help="float16 and int8 are TFLite only; dynamic quantizes weights to int8"
+    )
+    parser.add_argument("--calibration-dir", help="Directory of face crops used to calibrate int8")
+    parser.add_argument("--calibration-samples", type=int, default=200)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    output = args.output or str(default_model_path(args.format))
+
+    if args.format == "tflite":
+        calibration = None
+        if args.quantize == "int8":
+            if not args.calibration_dir:
+                parser.error("--quantize int8 requires --calibration-dir")
+            calibration = preprocess_crops(load_face_crops(args.calibration_dir, args.calibration_samples))
+        export_tflite(args.model, output, quantize=args.quantize, calibration_faces=calibration)
+    else:
+        if args.quantize not in ("none", "dynamic"):
+            parser.error("ONNX export supports --quantize none or dynamic")
+        export_onnx(args.model, output, quantize=args.quantize)
+
+    print(f"Model exported to {output}")
+
+if __name__ == "__main__":
+    main()
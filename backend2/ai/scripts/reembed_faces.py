@@ -0,0 +1,82 @@
+"""
+Re-embed stored enrollment crops for an embedding model upgrade.
+
+Rollout:
+    1. Set FACE_NEXT_MODEL_VERSION and FACE_NEXT_MODEL_PATH on every server
+       and here. Servers keep matching with the current model.
+    2. python ai/scripts/reembed_faces.py            # resumable, throttled
+       Servers switch to the new model on their own once nothing is left.
+    3. Raise FACE_EMBEDDING_MODEL_VERSION / FACE_MODEL_PATH to the new model,
+       unset the FACE_NEXT_* settings, then
+       python ai/scripts/reembed_faces.py --promote 5
+
+Examples:
+    python ai/scripts/reembed_faces.py --status
+    python ai/scripts/reembed_faces.py --batch-size 64 --sleep 0.5 --checkpoint reembed.json
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Add the backend root to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.services.embedding_rollout import rollout
+from app.services.reembedding import reembed_all
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-embed enrollment crops with the next embedding model")
+    parser.add_argument("--status", action="store_true", help="Print the rollout status and exit")
+    parser.add_argument("--promote", type=int, metavar="VERSION",
+                        help="Move embeddings of a fully rolled out version into face_embedding")
+    parser.add_argument("--checkpoint", default="reembed_checkpoint.json", help="JSON checkpoint file")
+    parser.add_argument("--batch-size", type=int, default=64, help="Users per batch and transaction")
+    parser.add_argument("--sleep", type=float, default=0.5, help="Seconds to pause between batches")
+    parser.add_argument("--max-batches", type=int, help="Stop after this many batches")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        if args.status:
+            print(json.dumps(rollout.status(db), indent=2))
+            return
+        if args.promote is not None:
+            updated = rollout.promote(db, args.promote)
+            print(f"Promoted {updated} embeddings of model v{args.promote}")
+            return
+        if rollout.next_version is None:
+            parser.error("FACE_NEXT_MODEL_VERSION is not set")
+
+        from app.services.face_recognition_service import FaceRecognitionService
+        service = FaceRecognitionService(
+            model_version=rollout.next_version,
+            model_path=settings.FACE_NEXT_MODEL_PATH
+        )
+
+        def progress(checkpoint):
+            print(f"  up to user {checkpoint.last_user_id}: {checkpoint.reembedded} re-embedded, "
+                  f"{checkpoint.failed} unreadable crops")
+
+        checkpoint = reembed_all(
+            db,
+            service,
+            rollout,
+            args.checkpoint,
+            batch_size=args.batch_size,
+            sleep_seconds=args.sleep,
+            max_batches=args.max_batches,
+            progress=progress
+        )
+        print(f"Re-embedded {checkpoint.reembedded} users with model v{rollout.next_version}; "
+              f"{rollout.remaining(db)} left")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Train or fine-tune the face embedding model on campus photos (CPU only).
+
+The dataset is a directory of face crops, one sub-directory per person:
+    data/faces/<student id>/<photo>.jpg
+
+Examples:
+    python ai/scripts/train_model.py --data data/faces --output ai/model/face_model_v5.keras
+    python ai/scripts/train_model.py --data data/faces --output ai/model/face_model_v5.keras \\
+        --init-model ai/model/trained_embedding_model_retrainedv4.keras --trainable-layers 30 \\
+        --schedule 32x4:10 --learning-rate 1e-4
+    python ai/scripts/train_model.py --data data/faces --output ai/model/face_model_v5.keras \\
+        --loss both --imagenet-weights --cache-dir /var/tmp/face-cache --max-hours 9
+
+Roll the result out with FACE_NEXT_MODEL_PATH / FACE_NEXT_MODEL_VERSION and
+ai/scripts/reembed_faces.py; export it for TFLite/ONNX with export_model.py.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+
+# Add the backend root to the path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+
+from app.services.model_training import TrainingConfig, parse_batch_schedule, train
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Train the face embedding model")
+    parser.add_argument("--data", required=True, help="Directory of face crops, one sub-directory per person")
+    parser.add_argument("--output", required=True, help="Destination .keras file (best held-out checkpoint)")
+    parser.add_argument("--init-model", help="Fine-tune this .keras model instead of training from scratch")
+    parser.add_argument("--trainable-layers", type=int, help="With --init-model, only train the last N layers")
+    parser.add_argument("--embedding-dim", type=int, default=128)
+    parser.add_argument("--width", type=float, default=0.5, help="MobileNetV2 width multiplier")
+    parser.add_argument("--imagenet-weights", action="store_true", help="Start the backbone from ImageNet weights")
+    parser.add_argument("--loss", choices=["triplet", "arcface", "both"], default="triplet")
+    parser.add_argument("--margin", type=float, default=0.2, help="Triplet margin (euclidean distance)")
+    parser.add_argument("--schedule", default="16x4:10,32x4:20",
+                        help="Batch phases as IDENTITIESxPHOTOS:EPOCHS, comma separated")
+    parser.add_argument("--learning-rate", type=float, default=1e-3)
+    parser.add_argument("--min-images", type=int, default=2, help="Skip people with fewer photos")
+    parser.add_argument("--validation-fraction", type=float, default=0.1, help="Share of people held out")
+    parser.add_argument("--cache-dir", help="Cache decoded crops on disk here (clear it when the photos change)")
+    parser.add_argument("--threads", type=int, help="TensorFlow intra-op threads")
+    parser.add_argument("--max-hours", type=float, help="Stop after this many hours and keep the best checkpoint")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if not args.output.endswith(".keras"):
+        parser.error("--output must be a .keras file")
+
+    logging.basicConfig(level=logging.INFO)
+    scores = train(TrainingConfig(
+        data_dir=args.data,
+        output_path=args.output,
+        init_model=args.init_model,
+        trainable_layers=args.trainable_layers,
+        embedding_dim=args.embedding_dim,
+        width=args.width,
+        imagenet_weights=args.imagenet_weights,
+        loss=args.loss,
+        triplet_margin=args.margin,
+        phases=parse_batch_schedule(args.schedule),
+        learning_rate=args.learning_rate,
+        min_images=args.min_images,
+        validation_fraction=args.validation_fraction,
+        cache_dir=args.cache_dir,
+        threads=args.threads,
+        max_hours=args.max_hours,
+        seed=args.seed
+    ))
+    print(f"Model saved to {args.output}")
+    if scores:
+        print(json.dumps(scores, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""Convert users.face_embedding from JSON to binary float32
+
+Revision ID: a1c4e7f2b9d0
+Revises: ec775bfeb433
+Create Date: 2026-10-18 09:12:41.302114
+
+"""
+from typing import Sequence, Union
+import json
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a1c4e7f2b9d0'
+down_revision: Union[str, None] = 'ec775bfeb433'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the format in app/services/embedding_codec.py (format version 1)
+MAGIC = b'AEMB'
+HEADER = struct.Struct('<4sBBHII')
+FLOAT32 = 1
+MODEL_VERSION = 4  # trained_embedding_model_retrainedv4
+BATCH_SIZE = 500
+
+users = sa.table(
+    'users',
+    sa.column('user_id', sa.Integer),
+    sa.column('face_embedding', sa.LargeBinary),
+)
+
+
+def _to_binary(blob: bytes) -> bytes:
+    values = json.loads(bytes(blob).decode('utf-8'))
+    header = HEADER.pack(MAGIC, 1, FLOAT32, len(values), MODEL_VERSION, 0)
+    return header + struct.pack(f'<{len(values)}f', *values)
+
+
+def _to_json(blob: bytes) -> bytes:
+    blob = bytes(blob)
+    _, _, dtype_code, dimension, _, _ = HEADER.unpack_from(blob)
+    fmt = f'<{dimension}f' if dtype_code == FLOAT32 else f'<{dimension}e'
+    values = struct.unpack_from(fmt, blob, HEADER.size)
+    return json.dumps(list(values)).encode('utf-8')
+
+
+def _convert(convert, needs_conversion) -> None:
+    """Rewrite every stored embedding in keyset-paginated batches."""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(users.c.user_id, users.c.face_embedding)
+            .where(users.c.face_embedding.isnot(None), users.c.user_id > last_id)
+            .order_by(users.c.user_id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].user_id
+
+        updates = [
+            {'uid': row.user_id, 'embedding': convert(row.face_embedding)}
+            for row in rows if needs_conversion(bytes(row.face_embedding))
+        ]
+        if updates:
+            bind.execute(
+                users.update()
+                .where(users.c.user_id == sa.bindparam('uid'))
+                .values(face_embedding=sa.bindparam('embedding')),
+                updates
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    _convert(_to_binary, lambda blob: blob[:1] == b'[')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    _convert(_to_json, lambda blob: blob[:4] == MAGIC)
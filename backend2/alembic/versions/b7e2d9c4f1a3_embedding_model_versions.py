@@ -0,0 +1,83 @@
+"""Tag face embeddings with their model version and keep enrollment crops
+
+Revision ID: b7e2d9c4f1a3
+Revises: a1c4e7f2b9d0
+Create Date: 2026-10-18 14:03:27.518920
+
+"""
+from typing import Sequence, Union
+import struct
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b7e2d9c4f1a3'
+down_revision: Union[str, None] = 'a1c4e7f2b9d0'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the format in app/services/embedding_codec.py (format version 1)
+MAGIC = b'AEMB'
+HEADER = struct.Struct('<4sBBHII')
+BATCH_SIZE = 500
+
+users = sa.table(
+    'users',
+    sa.column('user_id', sa.Integer),
+    sa.column('face_embedding', sa.LargeBinary),
+    sa.column('face_embedding_version', sa.Integer),
+)
+
+
+def _backfill_versions() -> None:
+    """Copy the model version out of each embedding header, in keyset-paginated batches."""
+    bind = op.get_bind()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(users.c.user_id, users.c.face_embedding)
+            .where(users.c.face_embedding.isnot(None), users.c.user_id > last_id)
+            .order_by(users.c.user_id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].user_id
+
+        updates = []
+        for row in rows:
+            blob = bytes(row.face_embedding)
+            if blob[:4] == MAGIC and len(blob) >= HEADER.size:
+                updates.append({'uid': row.user_id, 'version': HEADER.unpack_from(blob)[4]})
+        if updates:
+            bind.execute(
+                users.update()
+                .where(users.c.user_id == sa.bindparam('uid'))
+                .values(face_embedding_version=sa.bindparam('version')),
+                updates
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.add_column(sa.Column('face_embedding_version', sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column('face_crop', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('face_embedding_next', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('face_embedding_next_version', sa.Integer(), nullable=True))
+        batch_op.create_index('ix_users_face_embedding_version', ['face_embedding_version'])
+        batch_op.create_index('ix_users_face_embedding_next_version', ['face_embedding_next_version'])
+    _backfill_versions()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_index('ix_users_face_embedding_next_version')
+        batch_op.drop_index('ix_users_face_embedding_version')
+        batch_op.drop_column('face_embedding_next_version')
+        batch_op.drop_column('face_embedding_next')
+        batch_op.drop_column('face_crop')
+        batch_op.drop_column('face_embedding_version')
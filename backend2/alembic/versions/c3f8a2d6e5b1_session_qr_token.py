@@ -0,0 +1,105 @@
+"""Store the QR token of a session in an indexed column
+
+Revision ID: c3f8a2d6e5b1
+Revises: b7e2d9c4f1a3
+Create Date: 2026-10-18 16:41:09.224617
+
+"""
+from datetime import datetime
+from typing import Optional, Sequence, Union
+import base64
+import logging
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c3f8a2d6e5b1'
+down_revision: Union[str, None] = 'b7e2d9c4f1a3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Frozen copy of the legacy payload in app/services/qr_tokens.py
+LEGACY_PAYLOAD = re.compile(
+    r"\{'session_id': \d+, 'token': '([A-Za-z0-9_-]{1,128})', 'expires_at': '[0-9T:.+-]{1,40}'\}"
+)
+BATCH_SIZE = 100
+
+logger = logging.getLogger('alembic.runtime.migration')
+
+sessions = sa.table(
+    'sessions',
+    sa.column('session_id', sa.Integer),
+    sa.column('qr_code', sa.Text),
+    sa.column('qr_token', sa.String),
+    sa.column('qr_expires_at', sa.TIMESTAMP(timezone=True)),
+)
+
+
+def _read_token(qr_code: str) -> Optional[str]:
+    """The token in a stored base64 PNG QR code, None if it cannot be read."""
+    import cv2
+    import numpy as np
+    try:
+        image = cv2.imdecode(np.frombuffer(base64.b64decode(qr_code), np.uint8), cv2.IMREAD_GRAYSCALE)
+    except (ValueError, TypeError):
+        return None
+    if image is None:
+        return None
+    text, _, _ = cv2.QRCodeDetector().detectAndDecode(image)
+    match = LEGACY_PAYLOAD.fullmatch(text or '')
+    return match.group(1) if match else None
+
+
+def _backfill_tokens() -> None:
+    """Read the token of every unexpired QR code, so codes on screen keep working."""
+    bind = op.get_bind()
+    now = datetime.utcnow()
+    last_id = 0
+    while True:
+        rows = bind.execute(
+            sa.select(sessions.c.session_id, sessions.c.qr_code)
+            .where(
+                sessions.c.qr_code.isnot(None),
+                sessions.c.qr_expires_at > now,
+                sessions.c.session_id > last_id
+            )
+            .order_by(sessions.c.session_id)
+            .limit(BATCH_SIZE)
+        ).fetchall()
+        if not rows:
+            break
+        last_id = rows[-1].session_id
+
+        updates = []
+        for row in rows:
+            token = _read_token(row.qr_code)
+            if token is not None:
+                updates.append({'sid': row.session_id, 'token': token})
+            else:
+                logger.warning(f"QR code of session {row.session_id} is unreadable; it gets a token on its next refresh")
+        if updates:
+            bind.execute(
+                sessions.update()
+                .where(sessions.c.session_id == sa.bindparam('sid'))
+                .values(qr_token=sa.bindparam('token')),
+                updates
+            )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.add_column(sa.Column('qr_token', sa.String(length=64), nullable=True))
+        batch_op.create_index('ix_sessions_qr_token', ['qr_token'], unique=True)
+    # The token of existing codes is only inside their PNG image
+    _backfill_tokens()
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.batch_alter_table('sessions') as batch_op:
+        batch_op.drop_index('ix_sessions_qr_token')
+        batch_op.drop_column('qr_token')
@@ -1,5 +1,6 @@
 from pydantic_settings import BaseSettings
 from pathlib import Path
+from typing import Optional
 
 class Settings(BaseSettings):
     # Database settings
@@ -11,8 +12,75 @@ class Settings(BaseSettings):
     ACCESS_TOKEN_EXPIRE_MINUTES: int = 30
     
     # Face recognition settings
-    FACE_RECOGNITION_THRESHOLD: float = 0.6
+    FACE_RECOGNITION_THRESHOLD: float = 0.6  # used for models without a calibrated threshold
+    FACE_THRESHOLDS_PATH: Optional[str] = None  # defaults to ai/model/match_thresholds.json
     FACE_DETECTION_CONFIDENCE: float = 0.5
+    FACE_DETECTOR: str = "haar"  # haar, yunet or ssd
+    FACE_DETECTOR_MODEL_PATH: Optional[str] = None
+    FACE_DETECTOR_CONFIG_PATH: Optional[str] = None  # ssd prototxt
+    FACE_DETECTOR_MAX_SIDE: int = 640  # frames are downscaled to this before detection, 0 disables
+    EMBEDDING_INDEX_TTL_SECONDS: float = 300.0  # 0 disables expiry
+    FACE_EMBEDDING_MODEL_VERSION: int = 4  # trained_embedding_model_retrainedv4
+    FACE_EMBEDDING_DTYPE: str = "float32"  # float32 or float16
+    FACE_NEXT_MODEL_VERSION: Optional[int] = None  # model being rolled out (see services/embedding_rollout.py)
+    FACE_NEXT_MODEL_PATH: Optional[str] = None
+    FACE_ROLLOUT_CHECK_SECONDS: float = 60.0  # how often servers check whether the new index is complete
+    FACE_ROLLOUT_ALLOW_MISSING_CROPS: bool = False  # switch models even though users without a crop then go unrecognised
+    FACE_CROP_JPEG_QUALITY: int = 90  # enrollment crops kept for re-embedding
+    EMBEDDING_BATCH_MAX_SIZE: int = 32
+    EMBEDDING_BATCH_MAX_WAIT_MS: float = 5.0
+    FACE_EXECUTOR: str = "thread"  # thread or process
+    FACE_EXECUTOR_WORKERS: int = 2
+    DB_EXECUTOR_WORKERS: int = 8
+    FACE_INFERENCE_BACKEND: str = "keras"  # keras, tflite or onnx
+    FACE_MODEL_PATH: Optional[str] = None  # defaults to ai/model/<model>.<backend extension>
+    FACE_INFERENCE_THREADS: int = 1
+    ENABLE_FACE_RECOGNITION: bool = True  # False for auth/classroom-only workers
+    FACE_WARMUP_ON_STARTUP: bool = False
+    FACE_QUALITY_ENABLED: bool = True
+    FACE_QUALITY_MIN_SIZE: int = 48  # pixels, shorter side of the face crop
+    FACE_QUALITY_MIN_SHARPNESS: float = 40.0  # variance of the Laplacian at model input size
+    FACE_QUALITY_MIN_BRIGHTNESS: float = 40.0  # mean gray level (0-255)
+    FACE_QUALITY_MAX_BRIGHTNESS: float = 220.0
+    FACE_QUALITY_MIN_ASPECT: float = 0.6  # width / height of the face box, outside means a turned head
+    FACE_QUALITY_MAX_ASPECT: float = 1.4
+    FACE_TRACKING_ENABLED: bool = True
+    FACE_TRACK_IOU_THRESHOLD: float = 0.3
+    FACE_TRACK_MAX_IDLE_SECONDS: float = 2.0  # a track survives this long without being seen
+    FACE_TRACK_CONFIDENT_DISTANCE: float = 0.45  # tracks matched closer than this are not re-embedded
+    FACE_TRACK_REVERIFY_FRAMES: int = 30  # re-embed a confident track every N frames anyway
+    FACE_TRACK_SCENE_CHANGE_THRESHOLD: float = 12.0  # frame signature difference that forces a re-embedding
+    CROWD_MAX_FACES: int = 50  # faces identified per frame in crowd mode
+
+    # Campus-wide approximate nearest neighbour index
+    ANN_INDEX_BACKEND: str = "numpy"  # numpy or faiss
+    ANN_INDEX_PATH: Optional[str] = None  # defaults to ai/model/campus_face_index
+    ANN_NLIST: int = 0  # 0 picks sqrt(N) lists
+    ANN_NPROBE: int = 8
+    ANN_SYNC_SECONDS: float = 60.0  # how often the campus index picks up enrollments made by other workers
+
+    # Frame transport limits negotiated with kiosks
+    FRAME_MAX_WIDTH: int = 640
+    FRAME_MAX_HEIGHT: int = 480
+    FRAME_MIN_SIDE: int = 160
+    FRAME_JPEG_QUALITY: float = 0.7
+    FRAME_GATE_ENABLED: bool = True
+    FRAME_GATE_DIFF_THRESHOLD: float = 6.0  # mean abs difference of 16x16 gray thumbnails (0-255)
+    FRAME_GATE_HOLD_SECONDS: float = 3.0  # how long a result may be replayed for an unchanged scene
+
+    # QR code attendance
+    QR_TOKEN_CACHE_SECONDS: float = 30.0  # how long a resolved token is trusted before re-checking the database
+    QR_ROTATION_SECONDS: int = 10  # lifetime of a signed rotating QR token
+    QR_TOKEN_SKEW_WINDOWS: int = 1  # older windows still accepted, for slow scans and clock skew
+    QR_ROTATION_ENABLED: bool = True  # push a fresh code to projector screens every rotation
+    QR_RENDER_WORKERS: int = 2  # processes rendering QR images
+    QR_RENDER_CACHE_SIZE: int = 512  # rendered QR codes kept per process, by token and format
+
+    # Attendance write buffer
+    ATTENDANCE_BUFFER_ENABLED: bool = True  # acknowledge marks once journaled, insert them in batches
+    ATTENDANCE_FLUSH_INTERVAL: float = 0.3  # seconds between batched attendance inserts
+    ATTENDANCE_JOURNAL_DIR: Optional[str] = None  # defaults to backend2/attendance_journal
+    ATTENDANCE_JOURNAL_FSYNC: bool = True  # fsync each mark, so it also survives a power loss
 
     # Recovery code settings
     RECOVERY_CODE_EXPIRY_MINUTES: int = 15
@@ -1,7 +1,3 @@
-import secrets
-import qrcode
-from io import BytesIO
-import base64
 from datetime import datetime, date, time, timedelta
 from typing import List, Optional, Tuple
 
@@ -10,32 +6,31 @@ from sqlalchemy import and_, or_, func
 
 from app import models, schemas
 from app.models.session import QRCodeStatus
+from app.services.attendance_buffer import attendance_buffer
+from app.services.qr_rendering import render_qr_png
+from app.services.qr_tokens import active_qr_tokens, extract_qr_token, new_random_token, qr_signer
 
-def generate_qr_code(session_id: int, expiration_minutes: int = 15) -> Tuple[str, datetime]:
-    """Generate a QR code for a session"""
-    # Generate a unique token
-    token = secrets.token_urlsafe(32)
+def generate_qr_code(session_id: int, expiration_minutes: int = 15) -> Tuple[str, str, datetime]:
+    """Generate a QR code for a session; returns (base64 PNG, token, expiry)"""
+    # Generate a unique token; the code holds only the token, the session
+    # and expiry are looked up by it
+    token = new_random_token()
     expires_at = datetime.utcnow() + timedelta(minutes=expiration_minutes)
     
-    # Create QR code data
-    qr_data = {
-        "session_id": session_id,
-        "token": token,
-        "expires_at": expires_at.isoformat()
-    }
-    
-    # Generate QR code image
-    qr = qrcode.QRCode(version=1, box_size=10, border=5)
-    qr.add_data(str(qr_data))
-    qr.make(fit=True)
-    
-    # Convert to base64
-    img = qr.make_image(fill_color="black", back_color="white")
-    buffered = BytesIO()
-    img.save(buffered, format="PNG")
-    qr_code_base64 = base64.b64encode(buffered.getvalue()).decode('utf-8')
-    
-    return qr_code_base64, expires_at
+    return render_qr_png(token), token, expires_at
+
+def _set_qr_code(db_session: models.Session, expiration_minutes: int = 15) -> Tuple[str, datetime]:
+    """Issue a new QR code for a flushed session; returns (token, expiry) to register after commit"""
+    qr_code, token, expires_at = generate_qr_code(
+        session_id=db_session.session_id,
+        expiration_minutes=expiration_minutes
+    )
+    db_session.qr_code = qr_code
+    db_session.qr_token = token
+    db_session.qr_status = QRCodeStatus.ACTIVE
+    db_session.qr_expires_at = expires_at
+    db_session.qr_last_updated_at = datetime.utcnow()
+    return token, expires_at
 
 def create_session(db: Session, session_data: schemas.SessionCreate, creator_id: int):
     """Create a new session with a QR code"""
@@ -49,21 +44,12 @@ def create_session(db: Session, session_data: schemas.SessionCreate, creator_id:
         qr_status=QRCodeStatus.ACTIVE
     )
     
-    # Generate and set QR code
-    qr_code, expires_at = generate_qr_code(
-        session_id=db_session.session_id,  # Will be set after flush
-        expiration_minutes=15
-    )
-    
     db.add(db_session)
-    db.flush()  # Get the session_id
-    
-    # Update with QR code data
-    db_session.qr_code = qr_code
-    db_session.qr_expires_at = expires_at
-    db_session.qr_last_updated_at = datetime.utcnow()
+    db.flush()  # Get the session_id encoded in the QR code
+    token, expires_at = _set_qr_code(db_session)
     
     db.commit()
+    active_qr_tokens.register(token, db_session.session_id, expires_at)
     db.refresh(db_session)
     return db_session
 
@@ -85,8 +71,12 @@ def end_session(db: Session, session_id: int):
     if not db_session:
         return None
         
+    # Write the last buffered marks before the session is reported on
+    attendance_buffer.flush(db)
     db_session.end_time = datetime.utcnow().time()
+    db_session.qr_status = QRCodeStatus.EXPIRED  # no more scans once the session is over
     db.commit()
+    active_qr_tokens.revoke_session(session_id)
     db.refresh(db_session)
     return db_session
 
@@ -110,38 +100,28 @@ def mark_attendance(
     qr_code: str, 
     user_id: int
 ) -> models.Attendance:
-    """Mark attendance using a QR code"""
-    # Find session with active QR code
-    session = db.query(models.Session).filter(
-        models.Session.qr_code == qr_code,
-        models.Session.qr_status == QRCodeStatus.ACTIVE,
-        models.Session.qr_expires_at > datetime.utcnow()
-    ).first()
-    
-    if not session:
+    """Mark attendance using the scanned text of a QR code"""
+    token = extract_qr_token(qr_code)
+    if qr_signer.is_signed(token):
+        # Rotating code: verified by its signature alone, no session lookup
+        session_id = qr_signer.verify(token)
+        if session_id is not None and active_qr_tokens.is_ended(session_id):
+            return None
+    else:
+        # Long-lived code: active-token map backed by the qr_token index
+        session_id = active_qr_tokens.resolve(db, token)
+    if session_id is None:
         return None
     
-    # Check if attendance already marked
-    existing_attendance = db.query(models.Attendance).filter(
-        models.Attendance.session_id == session.session_id,
-        models.Attendance.user_id == user_id
-    ).first()
-    
-    if existing_attendance:
-        return existing_attendance
+    # Journaled right away, inserted with the other marks of the next flush
+    attendance_buffer.mark(db, session_id, [user_id])
     
-    # Create new attendance record
-    attendance = models.Attendance(
-        session_id=session.session_id,
+    return models.Attendance(
+        session_id=session_id,
         user_id=user_id,
-        status=models.AttendanceStatus.present
+        status=models.AttendanceStatus.present,
+        marked_at=attendance_buffer.marked_at(session_id, user_id)
     )
-    
-    db.add(attendance)
-    db.commit()
-    db.refresh(attendance)
-    
-    return attendance
 
 def refresh_qr_code(db: Session, session_id: int) -> models.Session:
     """Generate a new QR code for a session"""
@@ -152,19 +132,11 @@ def refresh_qr_code(db: Session, session_id: int) -> models.Session:
     if not session:
         return None
     
-    # Generate new QR code
-    qr_code, expires_at = generate_qr_code(
-        session_id=session_id,
-        expiration_minutes=15
-    )
-    
-    # Update session with new QR code
-    session.qr_code = qr_code
-    session.qr_status = QRCodeStatus.ACTIVE
-    session.qr_expires_at = expires_at
-    session.qr_last_updated_at = datetime.utcnow()
+    # Generate new QR code; the previous token stops resolving
+    token, expires_at = _set_qr_code(session)
     
     db.commit()
+    active_qr_tokens.register(token, session_id, expires_at)
     db.refresh(session)
     
     return session
@@ -8,9 +8,23 @@ from app.routers.classroom_router import router as classroom_router
 from app.routers.group_router import router as group_router
 from app.routers.user_router import router as user_router
 from app.routers.session_router import router as session_router
+from app.routers.metrics_router import router as metrics_router
+from app.routers.health_router import router as health_router
 from app.socketio.face_recognition import register_face_recognition_handlers
 from app.socketio.attendance import register_attendance_handlers
+from app.socketio.frame_transport import register_frame_transport_handlers, forget_frame_format
+from app.socketio.qr_rotation import register_qr_rotation_handlers
+from app.services.executor import shutdown_executors
+from app.services.frame_gate import frame_gate
+from app.services.face_tracker import forget_face_tracker
+from app.services.metrics import monitor_event_loop_lag
+from app.services.model_registry import model_registry
+from app.services.ann_index import campus_index
+from app.services.qr_rotation import qr_rotation
+from app.services.attendance_buffer import attendance_buffer
+from app.core.config import settings
 import socketio
+import asyncio
 import logging
 
 # Configure logging
@@ -59,6 +73,42 @@ app.include_router(classroom_router, prefix="/api/v1/classes", tags=["Classrooms
 app.include_router(group_router, prefix="/api/v1/groups", tags=["Groups"])
 app.include_router(user_router, tags=["Users"])
 app.include_router(session_router, tags=["Sessions"])
+app.include_router(metrics_router, tags=["Metrics"])
+app.include_router(health_router, tags=["Health"])
+
+# Background tasks tied to the application lifetime
+background_tasks = set()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    task = asyncio.create_task(monitor_event_loop_lag())
+    background_tasks.add(task)
+
+    if settings.QR_ROTATION_ENABLED:
+        task = asyncio.create_task(qr_rotation.run())
+        background_tasks.add(task)
+
+    # Replays journals of crashed workers, then inserts buffered marks
+    task = asyncio.create_task(attendance_buffer.run())
+    background_tasks.add(task)
+
+    # Models load lazily on the first face request unless warm-up is enabled
+    if settings.ENABLE_FACE_RECOGNITION and settings.FACE_WARMUP_ON_STARTUP:
+        task = asyncio.create_task(model_registry.warm_up())
+        background_tasks.add(task)
+        task.add_done_callback(background_tasks.discard)
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    for task in background_tasks:
+        task.cancel()
+    background_tasks.clear()
+    try:
+        attendance_buffer.close()
+    except Exception as e:
+        logger.error(f"Attendance marks left in the journal for the next start: {str(e)}")
+    shutdown_executors()
+    campus_index.save_if_dirty()
 
 # Custom OpenAPI with security
 def custom_openapi():
@@ -101,8 +151,11 @@ sio = socketio.AsyncServer(
 )
 
 # Register Socket.IO event handlers
-register_face_recognition_handlers(sio)
-register_attendance_handlers(sio)
+if settings.ENABLE_FACE_RECOGNITION:
+    register_frame_transport_handlers(sio)
+    register_face_recognition_handlers(sio)
+    register_attendance_handlers(sio)
+register_qr_rotation_handlers(sio)
 
 # Basic Socket.IO event handlers
 @sio.event
@@ -112,6 +165,10 @@ async def connect(sid, environ):
 @sio.event
 async def disconnect(sid):
     logger.info(f"Client disconnected: {sid}")
+    forget_frame_format(sid)
+    frame_gate.forget(sid)
+    forget_face_tracker(sid)
+    qr_rotation.forget(sid)
 
 @sio.event
 async def message(sid, data):
@@ -19,7 +19,8 @@ class Session(Base):
     start_time = Column(Time)
     end_time = Column(Time)
     created_by = Column(Integer, ForeignKey("users.user_id"))
-    qr_code = Column(Text)
+    qr_code = Column(Text)  # Base64 PNG shown to students
+    qr_token = Column(String(64), unique=True, index=True, nullable=True)  # Token encoded in qr_code, used to resolve scans
     share_token = Column(String(255), unique=True, nullable=True)
     qr_status = Column(
         Enum(QRCodeStatus, name="qr_code_status"),
@@ -51,7 +51,11 @@ class User(Base):
     last_login = Column(TIMESTAMP(timezone=True), nullable=True)
     
     # Face Recognition
-    face_embedding = Column(LargeBinary, nullable=True)  # Store face embedding as JSON string
+    face_embedding = Column(LargeBinary, nullable=True)  # Versioned binary vector, see services/embedding_codec.py
+    face_embedding_version = Column(Integer, nullable=True, index=True)  # Model version that produced face_embedding
+    face_crop = Column(LargeBinary, nullable=True)  # JPEG enrollment crop, re-embedded on model upgrades
+    face_embedding_next = Column(LargeBinary, nullable=True)  # Embedding from the model being rolled out
+    face_embedding_next_version = Column(Integer, nullable=True, index=True)
     
     # Authentication & Status
     is_active = Column(Boolean, default=True, nullable=False)
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Response, status
+
+from app.core.config import settings
+from app.services.model_registry import model_registry
+
+router = APIRouter(prefix="/api/v1/health", tags=["Health"])
+
+@router.get("/live")
+def liveness():
+    """The process is up and serving HTTP"""
+    return {"status": "ok"}
+
+@router.get("/ready")
+def readiness(response: Response):
+    """
+    Ready to take traffic.
+
+    With FACE_WARMUP_ON_STARTUP the worker only reports ready once the face
+    models are loaded; otherwise they load lazily and the model state is
+    informational.
+    """
+    if not settings.ENABLE_FACE_RECOGNITION:
+        return {"status": "ready", "face_recognition": "disabled"}
+
+    models = model_registry.status()
+    if settings.FACE_WARMUP_ON_STARTUP and not model_registry.is_ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+        return {"status": "not_ready", "face_recognition": models}
+    return {"status": "ready", "face_recognition": models}
@@ -0,0 +1,10 @@
+from fastapi import APIRouter
+
+from app.services.metrics import metrics
+
+router = APIRouter(prefix="/api/v1/metrics", tags=["Metrics"])
+
+@router.get("/")
+def get_metrics():
+    """Handler latency and event-loop lag of this worker process"""
+    return metrics.snapshot()
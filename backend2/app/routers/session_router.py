@@ -6,6 +6,11 @@ from app.database import get_db
 from app import crud, schemas, models
 from app.auth.oauth2 import get_current_user
 from app.schemas.session import AttendanceMarkRequest
+from app.crud.session import get_session_by_id
+from app.models.session import QRCodeStatus
+from app.services.executor import run_in_db_executor
+from app.services.qr_rendering import QR_FORMATS
+from app.services.qr_rotation import qr_rotation
 
 router = APIRouter(prefix="/api/v1/sessions", tags=["Sessions"])
 
@@ -48,6 +53,36 @@ def mark_attendance(
     
     return attendance
 
+@router.get("/sessions/{session_id}/qr", response_model=schemas.SessionRotatingQRCode)
+async def get_rotating_qr_code(
+    session_id: int,
+    fmt: str = Query("png", alias="format", description="png (base64), svg or matrix"),
+    db: Session = Depends(get_db),
+    current_user: schemas.UserOut = Depends(get_current_user)
+):
+    """
+    Current rotating QR code of a session.
+
+    Projector screens should subscribe with the 'watch_session_qr' Socket.IO
+    event instead of polling this.
+    """
+    if current_user.role not in ["teacher", "admin"]:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Only teachers and admins can display session QR codes"
+        )
+    if fmt not in QR_FORMATS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Format must be one of {', '.join(QR_FORMATS)}"
+        )
+    session = await run_in_db_executor(get_session_by_id, db, session_id)
+    if not session or session.qr_status != QRCodeStatus.ACTIVE:
+        raise HTTPException(status_code=404, detail="No active session found")
+
+    # Rendered in the QR process pool, not on this worker
+    return await qr_rotation.current_payload(session_id, fmt)
+
 @router.get("/sessions/group/{group_id}/active", response_model=schemas.SessionOut)
 def get_active_session(
     group_id: int,
@@ -6,6 +6,7 @@ from .session import (
     SessionCreate, 
     SessionOut,
     SessionQRCode,
+    SessionRotatingQRCode,
     QRCodeStatus,
     AttendanceMarkRequest,
     SessionShareLink
@@ -42,6 +43,7 @@ __all__ = [
     "SessionCreate",
     "SessionOut",
     "SessionQRCode",
+    "SessionRotatingQRCode",
     "SessionShareLink",
     "QRCodeStatus",
     "AttendanceMarkRequest",
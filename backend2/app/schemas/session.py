@@ -28,6 +28,14 @@ class SessionQRCode(BaseModel):
     expires_at: datetime
     status: QRCodeStatus = Field(default=QRCodeStatus.ACTIVE, description="QR code status")
 
+class SessionRotatingQRCode(BaseModel):
+    session_id: int
+    token: str = Field(..., description="Signed token encoded in the QR code")
+    format: str = Field("png", description="png, svg or matrix")
+    qr_code: str = Field(..., description="Base64 PNG, SVG markup or '0'/'1' module rows, per format")
+    rotates_at: datetime = Field(..., description="When the next code replaces this one")
+    rotation_seconds: int
+
 class SessionOut(SessionBase):
     session_id: int
     class_id: int
@@ -0,0 +1,435 @@
+"""
+Approximate nearest neighbour search over every enrolled face.
+
+Class-restricted matching stays exact (see embedding_index.py); this index
+serves campus-wide "who is this" lookups across tens of thousands of
+students, where a linear scan per query is too slow.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import List, Optional, Sequence, Tuple
+
+import numpy as np
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.user import User
+from app.services.embedding_codec import decode_embedding
+from app.services.embedding_rollout import rollout
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INDEX_PATH = Path(__file__).parent.parent.parent / "ai" / "model" / "campus_face_index"
+
+# Below this many vectors a single exact list is faster than clustering
+MIN_VECTORS_PER_LIST = 39
+# Catch-up queries look this far before the last sync, for clock skew between app and database
+SYNC_MARGIN_SECONDS = 300
+
+
+def _squared_distances(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """(N, K) squared euclidean distances via one matrix product."""
+    return (
+        np.einsum('ij,ij->i', vectors, vectors)[:, np.newaxis]
+        - 2.0 * (vectors @ centroids.T)
+        + np.einsum('ij,ij->i', centroids, centroids)[np.newaxis, :]
+    )
+
+def _nearest_centroid(vectors: np.ndarray, centroids: np.ndarray, block_size: int = 8192) -> np.ndarray:
+    """Assign vectors to centroids in blocks so memory stays bounded."""
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + block_size] = np.argmin(_squared_distances(block, centroids), axis=1)
+    return assignments
+
+def kmeans(vectors: np.ndarray, k: int, iterations: int = 20, seed: int = 0) -> np.ndarray:
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), size=k, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = _nearest_centroid(vectors, centroids)
+        counts = np.bincount(assignments, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, np.newaxis]
+        if empty.any():
+            centroids[empty] = vectors[rng.choice(len(vectors), size=int(empty.sum()), replace=False)]
+    return centroids.astype(np.float32)
+
+
+class IVFFlatIndex:
+    """
+    Inverted-file index with exact (flat) vectors in each list, in NumPy.
+
+    Vectors are bucketed by their nearest k-means centroid; a query scans
+    only the `nprobe` closest buckets. Inserts and removals are
+    incremental; retrain (rebuild) when the distribution drifts a lot.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = 8):
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.dim = self.centroids.shape[1]
+        self.nprobe = nprobe
+        nlist = len(self.centroids)
+        self._ids: List[np.ndarray] = [np.empty(0, dtype=np.int64) for _ in range(nlist)]
+        self._vectors: List[np.ndarray] = [np.empty((0, self.dim), dtype=np.float32) for _ in range(nlist)]
+        self._where = {}  # id -> list number
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(
+        cls,
+        ids: Sequence[int],
+        vectors: np.ndarray,
+        nlist: Optional[int] = None,
+        nprobe: int = 8,
+        train_size: int = 50000,
+        seed: int = 0
+    ) -> "IVFFlatIndex":
+        """Train centroids on (a sample of) the vectors and add them all."""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if nlist is None or nlist <= 0:
+            nlist = int(np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors) // MIN_VECTORS_PER_LIST))
+
+        if nlist == 1:
+            centroids = vectors.mean(axis=0, keepdims=True) if len(vectors) else np.zeros((1, vectors.shape[1]), np.float32)
+        else:
+            rng = np.random.default_rng(seed)
+            sample = vectors if len(vectors) <= train_size else vectors[rng.choice(len(vectors), train_size, replace=False)]
+            centroids = kmeans(sample, nlist, seed=seed)
+
+        index = cls(centroids, nprobe=nprobe)
+        index.add(ids, vectors)
+        return index
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+    def add(self, ids: Sequence[int], vectors: np.ndarray) -> None:
+        """Insert vectors; an id that is already present is replaced."""
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), self.dim)
+        assignments = _nearest_centroid(vectors, self.centroids)
+        with self._lock:
+            for vector_id in ids:
+                self._remove_locked(int(vector_id))
+            for list_no in np.unique(assignments):
+                mask = assignments == list_no
+                self._ids[list_no] = np.concatenate([self._ids[list_no], ids[mask]])
+                self._vectors[list_no] = np.concatenate([self._vectors[list_no], vectors[mask]])
+                for vector_id in ids[mask]:
+                    self._where[int(vector_id)] = int(list_no)
+
+    def remove(self, vector_id: int) -> bool:
+        with self._lock:
+            return self._remove_locked(vector_id)
+
+    def _remove_locked(self, vector_id: int) -> bool:
+        list_no = self._where.pop(vector_id, None)
+        if list_no is None:
+            return False
+        keep = self._ids[list_no] != vector_id
+        self._ids[list_no] = self._ids[list_no][keep]
+        self._vectors[list_no] = self._vectors[list_no][keep]
+        return True
+
+    def search(self, query: np.ndarray, k: int = 5, nprobe: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns:
+            Tuple of (ids, euclidean distances), closest first, at most k each
+        """
+        query = np.asarray(query, dtype=np.float32).reshape(1, self.dim)
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probe = np.argsort(_squared_distances(query, self.centroids)[0])[:nprobe]
+        with self._lock:
+            ids = np.concatenate([self._ids[p] for p in probe])
+            vectors = np.concatenate([self._vectors[p] for p in probe])
+        if len(ids) == 0:
+            return ids, np.empty(0, dtype=np.float32)
+
+        sq_dist = _squared_distances(query, vectors)[0]
+        k = min(k, len(ids))
+        top = np.argpartition(sq_dist, k - 1)[:k]
+        top = top[np.argsort(sq_dist[top])]
+        return ids[top], np.sqrt(np.maximum(sq_dist[top], 0.0))
+
+    def save(self, path: str) -> Path:
+        path = Path(path).with_suffix(".npz")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            sizes = np.array([len(ids) for ids in self._ids], dtype=np.int64)
+            np.savez(
+                path,
+                centroids=self.centroids,
+                nprobe=np.int64(self.nprobe),
+                sizes=sizes,
+                ids=np.concatenate(self._ids),
+                vectors=np.concatenate(self._vectors)
+            )
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "IVFFlatIndex":
+        data = np.load(Path(path).with_suffix(".npz"))
+        index = cls(data["centroids"], nprobe=int(data["nprobe"]))
+        offsets = np.concatenate([[0], np.cumsum(data["sizes"])])
+        ids, vectors = data["ids"], data["vectors"]
+        for list_no in range(index.nlist):
+            start, end = offsets[list_no], offsets[list_no + 1]
+            index._ids[list_no] = ids[start:end].copy()
+            index._vectors[list_no] = vectors[start:end].copy()
+            for vector_id in index._ids[list_no]:
+                index._where[int(vector_id)] = list_no
+        return index
+
+
+class FaissIVFIndex:
+    """Same interface as IVFFlatIndex, backed by faiss.IndexIVFFlat (optional dependency)."""
+
+    def __init__(self, index, nprobe: int = 8):
+        import faiss
+        self.faiss = faiss
+        self.index = index
+        self.index.nprobe = nprobe
+        self.nprobe = nprobe
+
+    @classmethod
+    def build(cls, ids, vectors, nlist=None, nprobe=8, train_size=50000, seed=0) -> "FaissIVFIndex":
+        import faiss
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if nlist is None or nlist <= 0:
+            nlist = int(np.sqrt(len(vectors)))
+        nlist = max(1, min(nlist, len(vectors) // MIN_VECTORS_PER_LIST))
+        quantizer = faiss.IndexFlatL2(vectors.shape[1])
+        index = faiss.IndexIVFFlat(quantizer, vectors.shape[1], nlist)
+        rng = np.random.default_rng(seed)
+        sample = vectors if len(vectors) <= train_size else vectors[rng.choice(len(vectors), train_size, replace=False)]
+        index.train(sample)
+        wrapped = cls(index, nprobe=nprobe)
+        wrapped.add(ids, vectors)
+        return wrapped
+
+    def __len__(self) -> int:
+        return self.index.ntotal
+
+    def add(self, ids, vectors) -> None:
+        ids = np.asarray(ids, dtype=np.int64)
+        self.index.remove_ids(ids)
+        self.index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(ids), -1), ids)
+
+    def remove(self, vector_id: int) -> bool:
+        return self.index.remove_ids(np.array([vector_id], dtype=np.int64)) > 0
+
+    def search(self, query, k=5, nprobe=None):
+        self.index.nprobe = nprobe or self.nprobe
+        sq_dist, ids = self.index.search(np.asarray(query, dtype=np.float32).reshape(1, -1), k)
+        found = ids[0] >= 0
+        return ids[0][found], np.sqrt(np.maximum(sq_dist[0][found], 0.0))
+
+    def save(self, path: str) -> Path:
+        path = Path(path).with_suffix(".faiss")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.faiss.write_index(self.index, str(path))
+        return path
+
+    @classmethod
+    def load(cls, path: str) -> "FaissIVFIndex":
+        import faiss
+        return cls(faiss.read_index(str(Path(path).with_suffix(".faiss"))))
+
+
+_BACKENDS = {
+    "numpy": (IVFFlatIndex, ".npz"),
+    "faiss": (FaissIVFIndex, ".faiss"),
+}
+
+
+class CampusFaceIndex:
+    """
+    Lazily built ANN index over every User.face_embedding.
+
+    The index is persisted next to ANN_INDEX_PATH, one file per embedding
+    model version, and loaded from there on the next start; new enrollments
+    are inserted incrementally by setup_face and written back on shutdown.
+    When the served model changes (see embedding_rollout) the index of the
+    new version is loaded or built on the next lookup.
+
+    Enrollments this process never saw (other workers, a crash before the
+    index was saved) are picked up from the database: users created or
+    updated since the last sync are added (or dropped, when their embedding
+    was cleared) on load and every ANN_SYNC_SECONDS. An empty campus is
+    cached too and only looked at again on that schedule. A saved file's mtime is the time of that sync, not of
+    the save, so a file written by one worker cannot hide another's
+    enrollments.
+    """
+
+    def __init__(self, path: Optional[str] = None, backend: Optional[str] = None):
+        self.backend = (backend or settings.ANN_INDEX_BACKEND).lower()
+        if self.backend not in _BACKENDS:
+            raise ValueError(f"Unknown ANN index backend '{self.backend}'")
+        self.path = Path(path or settings.ANN_INDEX_PATH or DEFAULT_INDEX_PATH)
+        self._index = None
+        # Model version of the cached index; set with _index None when nobody is enrolled
+        self._version: Optional[int] = None
+        self._dirty = False
+        # Unix time up to which the index is known to match the database
+        self._synced_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._index is not None
+
+    def version_path(self, version: int) -> Path:
+        return self.path.with_name(f"{self.path.stem}_v{version}")
+
+    def ensure_loaded(self, db: Session):
+        """Load the persisted index, or build it from the database (None if nobody is enrolled)."""
+        version = rollout.serving_version
+        if self._version == version and not self._sync_due():
+            return self._index
+        with self._lock:
+            if self._version != version:
+                index_class, suffix = _BACKENDS[self.backend]
+                path = self.version_path(version)
+                self._version = version
+                self._dirty = False
+                if path.with_suffix(suffix).exists():
+                    self._index = index_class.load(str(path))
+                    self._synced_at = path.with_suffix(suffix).stat().st_mtime
+                    logger.info(f"Loaded campus face index ({len(self._index)} faces) from {path}")
+                    self._catch_up(db)
+                else:
+                    started = time.time()
+                    self._index = self._build(db)
+                    self._synced_at = started
+                    if self._index is not None:
+                        self._save_locked()
+            elif self._sync_due():
+                if self._index is None:
+                    started = time.time()
+                    self._index = self._build(db)
+                    self._synced_at = started
+                    if self._index is not None:
+                        self._save_locked()
+                else:
+                    self._catch_up(db)
+        return self._index
+
+    def _sync_due(self) -> bool:
+        return time.time() - self._synced_at >= settings.ANN_SYNC_SECONDS
+
+    def _catch_up(self, db: Session) -> None:
+        """Apply enrollments and cleared embeddings since the last sync (caller holds the lock)."""
+        started = time.time()
+        since = datetime.fromtimestamp(self._synced_at - SYNC_MARGIN_SECONDS, timezone.utc)
+        embedding = rollout.embedding_column(self._version).label('face_embedding')
+        enrolled = rollout.has_embedding(self._version).label('enrolled')
+        rows = db.query(User.user_id, embedding, enrolled)\
+            .filter(or_(User.created_at >= since, User.updated_at >= since))\
+            .all()
+        ids, vectors = [], []
+        removed = 0
+        for row in rows:
+            if not row.enrolled:
+                removed += self._index.remove(row.user_id)
+                continue
+            try:
+                vectors.append(decode_embedding(row.face_embedding))
+                ids.append(row.user_id)
+            except Exception as e:
+                logger.error(f"Skipping unreadable embedding for user {row.user_id}: {str(e)}")
+        if ids:
+            self._index.add(ids, np.stack(vectors))
+            self._dirty = True
+            logger.info(f"Campus face index caught up with {len(ids)} enrollments")
+        if removed:
+            self._dirty = True
+            logger.info(f"Dropped {removed} users without an embedding from the campus face index")
+        self._synced_at = started
+
+    def _save_locked(self) -> None:
+        path = self._index.save(str(self.version_path(self._version)))
+        os.utime(path, (self._synced_at, self._synced_at))
+        self._dirty = False
+
+    def rebuild(self, db: Session) -> None:
+        """Rebuild from the database (e.g. after bulk enrollment) and persist."""
+        version = rollout.serving_version
+        started = time.time()
+        index = self._build(db)
+        with self._lock:
+            self._index = index
+            self._version = version
+            self._synced_at = started
+            self._dirty = False
+            if index is not None:
+                self._save_locked()
+
+    def upsert(self, user_id: int, embedding: np.ndarray, model_version: Optional[int] = None) -> None:
+        """Insert or replace one enrollment; no-op until the index of that model version has been loaded."""
+        with self._lock:
+            if self._version is None or (model_version is not None and model_version != self._version):
+                return
+            if self._index is None:
+                # Cached as empty: build it with this enrollment on the next lookup
+                self._synced_at = 0.0
+                return
+            self._index.add([user_id], np.asarray(embedding, dtype=np.float32)[np.newaxis, :])
+            self._dirty = True
+
+    def identify(self, db: Session, embedding: np.ndarray, k: int = 5) -> List[Tuple[int, float]]:
+        """Closest enrolled users as (user_id, distance), closest first."""
+        index = self.ensure_loaded(db)
+        if index is None or len(index) == 0:
+            return []
+        ids, distances = index.search(embedding, k=k)
+        return [(int(user_id), float(distance)) for user_id, distance in zip(ids, distances)]
+
+    def save_if_dirty(self) -> None:
+        with self._lock:
+            if self._index is not None and self._dirty:
+                self._save_locked()
+
+    def _build(self, db: Session, batch_size: int = 5000):
+        ids, vectors = [], []
+        last_id = 0
+        version = rollout.serving_version
+        embedding = rollout.embedding_column(version).label('face_embedding')
+        while True:
+            rows = db.query(User.user_id, embedding)\
+                .filter(rollout.has_embedding(version), User.user_id > last_id)\
+                .order_by(User.user_id)\
+                .limit(batch_size)\
+                .all()
+            if not rows:
+                break
+            last_id = rows[-1].user_id
+            for row in rows:
+                try:
+                    vectors.append(decode_embedding(row.face_embedding))
+                    ids.append(row.user_id)
+                except Exception as e:
+                    logger.error(f"Skipping unreadable embedding for user {row.user_id}: {str(e)}")
+
+        if not vectors:
+            return None
+        index_class, _ = _BACKENDS[self.backend]
+        index = index_class.build(ids, np.stack(vectors), nlist=settings.ANN_NLIST, nprobe=settings.ANN_NPROBE)
+        logger.info(f"Built campus face index with {len(index)} faces")
+        return index
+
+
+campus_index = CampusFaceIndex()
@@ -0,0 +1,355 @@
+"""
+Write-behind buffer for attendance marks.
+
+At the start of a class hundreds of students scan or walk past the kiosk
+within a minute. Instead of a SELECT, an INSERT and a commit per mark, marks
+are collected in memory per session and inserted every
+ATTENDANCE_FLUSH_INTERVAL seconds as a few multi-row
+INSERT ... ON CONFLICT DO NOTHING statements (INSERT OR IGNORE on SQLite,
+INSERT IGNORE on MySQL) in one transaction.
+
+Durability: a mark is appended (and fsynced, see ATTENDANCE_JOURNAL_FSYNC)
+to a per-process journal file before the client is told it is marked. A
+flush first seals the journal, and only deletes sealed journals once their
+marks are committed. Journals are named by pid and a random id drawn when
+the process starts, so a restarted worker that gets the crashed one's pid
+(PID 1 in a container) never appends to or deletes its journal. Journals
+of any other process that is gone, or of an earlier start under our pid,
+are replayed at startup (recover); replaying is safe because the inserts
+ignore rows that already exist.
+
+Deduplication: the marks of a session are loaded with one SELECT the first
+time the session is seen, after which "already marked" is answered from
+memory. A mark made through another worker meanwhile is reported as new
+here but still inserted once.
+"""
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session as DBSession
+
+from app.core.config import settings
+from app.database import SessionLocal
+from app.models.attendance import Attendance, AttendanceStatus
+from app.services.executor import run_in_db_executor
+from app.services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_JOURNAL_DIR = Path(__file__).parent.parent.parent / "attendance_journal"
+# Rows per INSERT statement (4 parameters each, under SQLite's old 999 variable limit)
+INSERT_CHUNK = 200
+# Sessions without a mark for this long are dropped from memory
+SESSION_IDLE_SECONDS = 3600
+
+# attendance-<pid>-<boot id>.journal, sealed as attendance-<pid>-<boot id>-<sequence>.sealed
+_JOURNAL_NAME = re.compile(r"^attendance-(\d+)-([0-9a-f]+)(?:-(\d+)\.sealed|\.journal)$")
+
+
+def insert_ignore_statement(db: DBSession, rows: List[dict]):
+    """Multi-row INSERT into attendance that skips rows whose (session_id, user_id) already exists."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(Attendance).values(rows).on_conflict_do_nothing()
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(Attendance).values(rows).on_conflict_do_nothing()
+    if dialect in ("mysql", "mariadb"):
+        return insert(Attendance).values(rows).prefix_with("IGNORE")
+    raise ValueError(f"No idempotent attendance insert for {dialect}")
+
+def insert_marks(db: DBSession, rows: List[dict]) -> None:
+    """Insert attendance rows, ignoring duplicates, and commit."""
+    for start in range(0, len(rows), INSERT_CHUNK):
+        db.execute(insert_ignore_statement(db, rows[start:start + INSERT_CHUNK]))
+    db.commit()
+
+def _process_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # No signal-0 probe on Windows; only single-worker development runs there
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+class AttendanceBuffer:
+    """Journaled in-memory attendance marks, inserted in batches."""
+
+    def __init__(
+        self,
+        journal_dir: Optional[str] = None,
+        flush_interval: Optional[float] = None,
+        fsync: Optional[bool] = None,
+        enabled: Optional[bool] = None
+    ):
+        self.journal_dir = Path(journal_dir or settings.ATTENDANCE_JOURNAL_DIR or DEFAULT_JOURNAL_DIR)
+        self.flush_interval = flush_interval or settings.ATTENDANCE_FLUSH_INTERVAL
+        self.fsync = settings.ATTENDANCE_JOURNAL_FSYNC if fsync is None else fsync
+        self.enabled = settings.ATTENDANCE_BUFFER_ENABLED if enabled is None else enabled
+        self._lock = threading.Lock()
+        # Serialises flushes, so sealed journals are deleted in order
+        self._flush_lock = threading.Lock()
+        # session_id -> {user_id: marked_at} of every mark known here (inserted or pending)
+        self._marked: Dict[int, Dict[int, datetime]] = {}
+        # session_id -> {user_id: marked_at} waiting for the next flush
+        self._pending: Dict[int, Dict[int, datetime]] = {}
+        self._last_used: Dict[int, float] = {}
+        self._journal = None
+        self._sequence = 0
+        self._owner_pid: Optional[int] = None
+        self._boot_id = ""
+
+    @property
+    def owner(self) -> str:
+        """<pid>-<boot id> of the journals written by this process."""
+        # Drawn again after a fork, so forked workers never share journals
+        if self._owner_pid != os.getpid():
+            self._owner_pid = os.getpid()
+            self._boot_id = uuid.uuid4().hex[:16]
+        return f"{self._owner_pid}-{self._boot_id}"
+
+    def _journal_path(self) -> Path:
+        return self.journal_dir / f"attendance-{self.owner}.journal"
+
+    def _sealed_path(self, sequence: int) -> Path:
+        return self.journal_dir / f"attendance-{self.owner}-{sequence}.sealed"
+
+    def _is_orphan(self, pid: int, boot_id: str) -> bool:
+        """True for journals no running process will flush."""
+        if f"{pid}-{boot_id}" == self.owner:
+            return False
+        if pid == os.getpid():
+            return True  # an earlier start that had our pid
+        return not _process_alive(pid)
+
+    def _load_session(self, db: DBSession, session_id: int) -> None:
+        with self._lock:
+            if session_id in self._marked:
+                return
+        rows = db.query(Attendance.user_id, Attendance.marked_at).filter(
+            Attendance.session_id == session_id
+        ).all()
+        with self._lock:
+            marked = self._marked.setdefault(session_id, {})
+            for row in rows:
+                marked.setdefault(row.user_id, row.marked_at)
+
+    def _append_journal(self, session_id: int, marks: Dict[int, datetime]) -> None:
+        if self._journal is None:
+            self.journal_dir.mkdir(parents=True, exist_ok=True)
+            self._journal = open(self._journal_path(), "a", encoding="utf-8")
+        self._journal.write("".join(
+            json.dumps({"session_id": session_id, "user_id": user_id, "marked_at": marked_at.isoformat()}) + "\n"
+            for user_id, marked_at in marks.items()
+        ))
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def mark(self, db: DBSession, session_id: int, user_ids: Iterable[int]) -> Set[int]:
+        """
+        Mark students present; returns the ids that were not marked before.
+
+        The marks are journaled when this returns, so the caller can
+        acknowledge them; the rows are inserted by the next flush (right
+        away when the buffer is disabled).
+        """
+        user_ids = set(user_ids)
+        if not user_ids:
+            return set()
+        self._load_session(db, session_id)
+        now = datetime.utcnow()
+        with self._lock:
+            marked = self._marked.setdefault(session_id, {})
+            new = {user_id: now for user_id in user_ids if user_id not in marked}
+            self._last_used[session_id] = time.monotonic()
+            if new:
+                self._append_journal(session_id, new)
+                marked.update(new)
+                self._pending.setdefault(session_id, {}).update(new)
+        if new:
+            metrics.increment('attendance_buffer.marked', len(new))
+            if not self.enabled:
+                self.flush(db)
+        return set(new)
+
+    def marked_at(self, session_id: int, user_id: int) -> Optional[datetime]:
+        with self._lock:
+            return self._marked.get(session_id, {}).get(user_id)
+
+    @property
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(len(marks) for marks in self._pending.values())
+
+    def _seal(self):
+        """Take the pending marks and close their journal; returns (marks, sequence)."""
+        with self._lock:
+            # Before the swap, so sessions in the batch keep their dedupe state if the flush fails
+            self._forget_idle_sessions()
+            batch, self._pending = self._pending, {}
+            self._sequence += 1
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+                os.replace(self._journal_path(), self._sealed_path(self._sequence))
+            return batch, self._sequence
+
+    def _forget_idle_sessions(self) -> None:
+        cutoff = time.monotonic() - SESSION_IDLE_SECONDS
+        for session_id in [s for s, used in self._last_used.items() if used < cutoff and s not in self._pending]:
+            del self._last_used[session_id]
+            self._marked.pop(session_id, None)
+
+    def _restore(self, batch: Dict[int, Dict[int, datetime]]) -> None:
+        with self._lock:
+            for session_id, marks in batch.items():
+                pending = self._pending.setdefault(session_id, {})
+                for user_id, marked_at in marks.items():
+                    pending.setdefault(user_id, marked_at)
+
+    def _delete_sealed(self, up_to: int) -> None:
+        for path in self.journal_dir.glob(f"attendance-{self.owner}-*.sealed"):
+            match = _JOURNAL_NAME.match(path.name)
+            if match and int(match.group(3)) <= up_to:
+                path.unlink()
+
+    def flush(self, db: DBSession) -> int:
+        """
+        Insert every pending mark in one transaction.
+
+        Returns:
+            Number of marks written (duplicates included)
+        """
+        with self._flush_lock:
+            batch, sequence = self._seal()
+            rows = [
+                {
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "status": AttendanceStatus.present,
+                    "marked_at": marked_at
+                }
+                for session_id, marks in batch.items()
+                for user_id, marked_at in marks.items()
+            ]
+            if rows:
+                try:
+                    with metrics.timer('attendance_buffer.flush_seconds'):
+                        self._insert(db, rows)
+                except Exception:
+                    db.rollback()
+                    self._restore(batch)
+                    raise
+                metrics.increment('attendance_buffer.flushed', len(rows))
+                metrics.observe('attendance_buffer.batch_size', len(rows))
+            # Every mark of this and earlier sealed journals is committed now
+            self._delete_sealed(sequence)
+            return len(rows)
+
+    def _insert(self, db: DBSession, rows: List[dict]) -> None:
+        try:
+            insert_marks(db, rows)
+        except IntegrityError as e:
+            # A row the database refuses (e.g. a deleted session) must not
+            # hold back the rest of the batch forever
+            db.rollback()
+            logger.warning(f"Attendance batch rejected ({str(e)}), inserting marks one by one")
+            for row in rows:
+                try:
+                    insert_marks(db, [row])
+                except IntegrityError:
+                    db.rollback()
+                    logger.error(f"Dropped attendance mark {row['user_id']} for session {row['session_id']}")
+                    metrics.increment('attendance_buffer.dropped')
+
+    def recover(self, db: DBSession) -> int:
+        """
+        Insert the marks of journals left by processes that are gone,
+        including an earlier start of this process under the same pid.
+
+        Returns:
+            Number of journaled marks replayed
+        """
+        if not self.journal_dir.is_dir():
+            return 0
+        paths = []
+        for path in self.journal_dir.iterdir():
+            match = _JOURNAL_NAME.match(path.name)
+            if match and self._is_orphan(int(match.group(1)), match.group(2)):
+                paths.append(path)
+        if not paths:
+            return 0
+
+        rows = []
+        for path in paths:
+            with open(path, encoding="utf-8") as journal:
+                for line in journal:
+                    try:
+                        entry = json.loads(line)
+                        rows.append({
+                            "session_id": int(entry["session_id"]),
+                            "user_id": int(entry["user_id"]),
+                            "status": AttendanceStatus.present,
+                            "marked_at": datetime.fromisoformat(entry["marked_at"])
+                        })
+                    except (ValueError, KeyError, TypeError):
+                        # Last line torn by the crash: that mark was never acknowledged
+                        continue
+        if rows:
+            self._insert(db, rows)
+        for path in paths:
+            path.unlink()
+        logger.info(f"Replayed {len(rows)} attendance marks from {len(paths)} journals")
+        return len(rows)
+
+    def _with_db(self, func):
+        db = SessionLocal()
+        try:
+            return func(db)
+        finally:
+            db.close()
+
+    def close(self) -> None:
+        """Flush what is left (at shutdown)."""
+        if self.pending_count:
+            self._with_db(self.flush)
+
+    async def run(self) -> None:
+        """Replay orphaned journals, then flush every flush_interval until cancelled."""
+        try:
+            await run_in_db_executor(self._with_db, self.recover)
+        except Exception as e:
+            logger.error(f"Attendance journal recovery failed: {str(e)}")
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if not self.pending_count:
+                continue
+            try:
+                await run_in_db_executor(self._with_db, self.flush)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # The marks stay pending and journaled for the next attempt
+                logger.error(f"Failed to flush attendance marks: {str(e)}")
+
+
+# Shared instance
+attendance_buffer = AttendanceBuffer()
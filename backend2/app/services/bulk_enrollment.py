@@ -0,0 +1,220 @@
+"""
+Offline face enrollment from registrar ID photos.
+
+Photos are detected and embedded in a process pool whose workers each
+load the face models once, a chunk of photos per task so the embedding
+model runs on batches. The parent process resolves students up front and
+writes User.face_embedding in batched transactions.
+"""
+import csv
+import logging
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+import cv2
+from sqlalchemy.orm import Session
+
+from app.models.user import User, UserRole
+from app.services.embedding_codec import embedding_model_version, encode_embedding
+from app.services.embedding_rollout import encode_face_crop, rollout
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+# Face service owned by a pool worker (see _init_worker)
+_worker_face_service = None
+
+
+@dataclass
+class EnrollmentItem:
+    """One photo and the student it belongs to (user_id or email)."""
+    path: str
+    key: str
+    user_id: Optional[int] = None
+
+
+@dataclass
+class EnrollmentFailure:
+    path: str
+    key: str
+    reason: str
+
+
+def scan_directory(image_dir: str) -> List[EnrollmentItem]:
+    """Photos named after the student, e.g. 1234.jpg (user_id) or jane.doe@univ.edu.png (email)."""
+    return [
+        EnrollmentItem(path=str(path), key=path.stem)
+        for path in sorted(Path(image_dir).rglob("*"))
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+def read_manifest(manifest_path: str) -> List[EnrollmentItem]:
+    """
+    CSV manifest with a `path` column and a `user_id` or `email` column.
+
+    Relative paths are resolved against the manifest's directory.
+    """
+    base = Path(manifest_path).parent
+    items = []
+    with open(manifest_path, newline="") as f:
+        for row in csv.DictReader(f):
+            path = Path(row["path"])
+            if not path.is_absolute():
+                path = base / path
+            key = (row.get("user_id") or row.get("email") or "").strip()
+            items.append(EnrollmentItem(path=str(path), key=key))
+    return items
+
+def resolve_users(db: Session, items: Sequence[EnrollmentItem]) -> List[EnrollmentFailure]:
+    """
+    Fill in user_id for every item from its key (one query for the whole roster).
+
+    Returns:
+        Failures for items that do not name an existing student
+    """
+    students = db.query(User.user_id, User.email).filter(User.role == UserRole.STUDENT).all()
+    by_id = {row.user_id for row in students}
+    by_email = {row.email.lower(): row.user_id for row in students}
+
+    failures = []
+    for item in items:
+        if item.key.isdigit() and int(item.key) in by_id:
+            item.user_id = int(item.key)
+        elif item.key.lower() in by_email:
+            item.user_id = by_email[item.key.lower()]
+        else:
+            failures.append(EnrollmentFailure(item.path, item.key, "unknown student"))
+    return failures
+
+def write_embeddings(db: Session, rows: Sequence[Tuple[int, bytes, bytes]]) -> None:
+    """Store (user_id, embedding, crop) rows in one transaction, tagged with the model version."""
+    db.bulk_update_mappings(User, [
+        {"user_id": user_id, **rollout.enrollment_values(embedding, embedding_model_version(embedding), crop)}
+        for user_id, embedding, crop in rows
+    ])
+    db.commit()
+
+def write_report(path: str, failures: Sequence[EnrollmentFailure]) -> None:
+    with open(path, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["path", "key", "reason"])
+        for failure in failures:
+            writer.writerow([failure.path, failure.key, failure.reason])
+
+
+# Process pool entry points. They must be module level so they can be pickled.
+
+def _init_worker() -> None:
+    global _worker_face_service
+    # One OpenCV thread per process; the pool provides the parallelism
+    cv2.setNumThreads(1)
+    from app.services.face_recognition_service import FaceRecognitionService
+    _worker_face_service = FaceRecognitionService()
+
+def embed_photos(
+    items: Sequence[EnrollmentItem],
+    check_quality: bool = True
+) -> List[Tuple[EnrollmentItem, Optional[bytes], Optional[bytes], Optional[str]]]:
+    """
+    Detect the largest face of each photo and embed all of them as one batch.
+
+    Returns:
+        (item, encoded embedding, JPEG crop, failure reason) per photo;
+        embedding and crop are None for failures
+    """
+    service = _worker_face_service
+    results = []
+    crops, crop_items = [], []
+    for item in items:
+        try:
+            image_data = Path(item.path).read_bytes()
+        except OSError as e:
+            results.append((item, None, None, f"unreadable file: {e.strerror}"))
+            continue
+        faces, _, _, error = service.detect_faces(image_data, visualization="none", max_faces=1)
+        if error:
+            results.append((item, None, None, error))
+            continue
+        issue = service.assess_face_quality(faces[0]) if check_quality else None
+        if issue is not None:
+            results.append((item, None, None, f"{issue['reason']}: {issue['message']}"))
+            continue
+        crops.append(faces[0])
+        crop_items.append(item)
+
+    if crops:
+        try:
+            embeddings = service.embed_faces(crops)
+            results.extend(
+                (item, encode_embedding(embedding, model_version=service.model_version), encode_face_crop(crop), None)
+                for item, embedding, crop in zip(crop_items, embeddings, crops)
+            )
+        except Exception as e:
+            results.extend((item, None, None, f"embedding failed: {e}") for item in crop_items)
+    return results
+
+
+def _chunks(items: Sequence[EnrollmentItem], size: int) -> Iterator[Sequence[EnrollmentItem]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+def enroll(
+    db: Session,
+    items: Sequence[EnrollmentItem],
+    workers: int = 4,
+    chunk_size: int = 32,
+    commit_every: int = 500,
+    check_quality: bool = True,
+    dry_run: bool = False,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> Tuple[int, List[EnrollmentFailure]]:
+    """
+    Enroll every photo whose student exists.
+
+    Args:
+        db: Session used to resolve students and write embeddings
+        items: Photos to enroll
+        workers: Worker processes (each loads its own copy of the models)
+        chunk_size: Photos per worker task, embedded as one batch
+        commit_every: Embeddings written per transaction
+        check_quality: Reject blurred, dark, tiny or turned faces
+        dry_run: Run the pipeline without writing to the database
+        progress: Called with (photos done, photos total)
+
+    Returns:
+        Tuple containing:
+        - Number of embeddings written
+        - Failures (unknown students, no face, quality, unreadable files)
+    """
+    failures = resolve_users(db, items)
+    items = [item for item in items if item.user_id is not None]
+
+    enrolled = 0
+    done = 0
+    pending: Dict[int, Tuple[bytes, bytes]] = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+        futures = [pool.submit(embed_photos, chunk, check_quality) for chunk in _chunks(items, chunk_size)]
+        for future in as_completed(futures):
+            for item, embedding, crop, reason in future.result():
+                done += 1
+                if embedding is None:
+                    failures.append(EnrollmentFailure(item.path, item.key, reason))
+                else:
+                    # Several photos of one student: the last one wins
+                    pending[item.user_id] = (embedding, crop)
+            if len(pending) >= commit_every:
+                if not dry_run:
+                    write_embeddings(db, [(user_id, *row) for user_id, row in pending.items()])
+                enrolled += len(pending)
+                pending.clear()
+            if progress:
+                progress(done, len(items))
+
+    if pending:
+        if not dry_run:
+            write_embeddings(db, [(user_id, *row) for user_id, row in pending.items()])
+        enrolled += len(pending)
+    return enrolled, failures
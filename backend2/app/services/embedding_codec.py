@@ -0,0 +1,100 @@
+import json
+import struct
+from dataclasses import dataclass
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+# Binary layout of User.face_embedding (little endian, 16 byte header):
+#   4s  magic            b'AEMB'
+#   B   format version   currently 1
+#   B   dtype code       1 = float32, 2 = float16
+#   H   dimension        number of components
+#   I   model version    version of the model that produced the vector
+#   I   reserved         0
+# followed by `dimension` values of the given dtype.
+MAGIC = b'AEMB'
+FORMAT_VERSION = 1
+HEADER = struct.Struct('<4sBBHII')
+
+_DTYPE_CODES = {
+    1: np.dtype('<f4'),
+    2: np.dtype('<f2'),
+}
+_CODES_BY_NAME = {'float32': 1, 'float16': 2}
+
+
+@dataclass(frozen=True)
+class EmbeddingHeader:
+    format_version: int
+    dtype: np.dtype
+    dimension: int
+    model_version: int
+
+
+def is_legacy_embedding(blob: bytes) -> bool:
+    """Return True for embeddings still stored as a JSON list of floats."""
+    return bytes(blob[:1]) == b'['
+
+def read_header(blob: bytes) -> EmbeddingHeader:
+    """Parse the header of a binary embedding without touching the payload."""
+    if len(blob) < HEADER.size:
+        raise ValueError("Embedding blob is too short")
+    magic, version, dtype_code, dimension, model_version, _ = HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise ValueError("Embedding blob has an unknown format")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported embedding format version {version}")
+    if dtype_code not in _DTYPE_CODES:
+        raise ValueError(f"Unsupported embedding dtype code {dtype_code}")
+    dtype = _DTYPE_CODES[dtype_code]
+    if len(blob) != HEADER.size + dimension * dtype.itemsize:
+        raise ValueError("Embedding blob size does not match its header")
+    return EmbeddingHeader(version, dtype, dimension, model_version)
+
+def encode_embedding(
+    embedding: np.ndarray,
+    model_version: Optional[int] = None,
+    dtype: Optional[str] = None
+) -> bytes:
+    """
+    Serialize an embedding for storage in User.face_embedding.
+
+    Args:
+        embedding: 1-D embedding vector
+        model_version: Version of the model that produced it (defaults to the configured one)
+        dtype: 'float32' or 'float16' (defaults to the configured one)
+
+    Returns:
+        Header followed by the raw little-endian vector
+    """
+    if model_version is None:
+        model_version = settings.FACE_EMBEDDING_MODEL_VERSION
+    dtype_code = _CODES_BY_NAME[dtype or settings.FACE_EMBEDDING_DTYPE]
+    vector = np.ascontiguousarray(np.ravel(embedding), dtype=_DTYPE_CODES[dtype_code])
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, dtype_code, vector.size, model_version, 0)
+    return header + vector.tobytes()
+
+def decode_embedding(blob: bytes) -> np.ndarray:
+    """
+    Deserialize a stored embedding into a float32 vector.
+
+    float32 payloads are returned as a read-only view over the blob
+    (no copy); float16 payloads are widened to float32. Legacy JSON
+    embeddings are still accepted until the migration has run.
+    """
+    if is_legacy_embedding(blob):
+        return np.asarray(json.loads(bytes(blob).decode('utf-8')), dtype=np.float32)
+    header = read_header(blob)
+    vector = np.frombuffer(blob, dtype=header.dtype, count=header.dimension, offset=HEADER.size)
+    if header.dtype != np.float32:
+        vector = vector.astype(np.float32)
+    return vector
+
+def embedding_model_version(blob: bytes) -> Optional[int]:
+    """Return the model version recorded in a stored embedding (None for legacy JSON)."""
+    if is_legacy_embedding(blob):
+        return None
+    return read_header(blob).model_version
@@ -0,0 +1,191 @@
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.class_user import ClassUser
+from app.models.user import User, UserRole
+from app.services.embedding_codec import decode_embedding
+from app.services.embedding_rollout import rollout
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ClassEmbeddingIndex:
+    """Face embeddings of one class, packed for vectorized matching."""
+    class_id: int
+    user_ids: np.ndarray        # (N,) int64
+    names: List[str]            # display names, aligned with user_ids
+    matrix: np.ndarray          # (N, D) float32, C-contiguous
+    sq_norms: np.ndarray        # (N,) float32, squared row norms of matrix
+    loaded_at: float
+    model_version: Optional[int] = None  # embedding model the vectors came from
+
+    def __len__(self) -> int:
+        return len(self.user_ids)
+
+    def nearest(self, embedding: np.ndarray) -> Tuple[Optional[int], float]:
+        """
+        Find the row closest to the given embedding.
+
+        Uses ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b so the whole roster is
+        scored with a single matrix-vector product.
+
+        Returns:
+            Tuple of (row index or None if the index is empty, euclidean distance)
+        """
+        if len(self) == 0:
+            return None, float('inf')
+        query = np.asarray(embedding, dtype=np.float32).ravel()
+        sq_dist = self.sq_norms - 2.0 * (self.matrix @ query) + float(query @ query)
+        row = int(np.argmin(sq_dist))
+        return row, float(np.sqrt(max(float(sq_dist[row]), 0.0)))
+
+    def nearest_many(self, embeddings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Find the closest row for each of several embeddings with one matrix product.
+
+        Returns:
+            Tuple of (row indexes, euclidean distances), both of shape (M,).
+            Rows are -1 and distances inf when the index is empty.
+        """
+        queries = np.asarray(embeddings, dtype=np.float32).reshape(len(embeddings), -1)
+        if len(self) == 0 or len(queries) == 0:
+            return np.full(len(queries), -1, dtype=np.int64), np.full(len(queries), np.inf, dtype=np.float32)
+        sq_dist = self.sq_norms[np.newaxis, :] - 2.0 * (queries @ self.matrix.T)
+        sq_dist += np.einsum('ij,ij->i', queries, queries)[:, np.newaxis]
+        rows = np.argmin(sq_dist, axis=1)
+        distances = np.sqrt(np.maximum(sq_dist[np.arange(len(queries)), rows], 0.0))
+        return rows, distances
+
+
+class EmbeddingIndexService:
+    """
+    Process-wide cache of per-class embedding matrices.
+
+    The roster of a class is read from the database and decoded once, then
+    reused for every frame until it is invalidated (new enrollment) or its
+    TTL expires (class membership changes made through the REST API).
+    """
+
+    def __init__(self, ttl_seconds: Optional[float] = None):
+        self.ttl_seconds = settings.EMBEDDING_INDEX_TTL_SECONDS if ttl_seconds is None else ttl_seconds
+        self._indexes: Dict[int, ClassEmbeddingIndex] = {}
+        self._lock = threading.Lock()
+
+    def get(self, db: Session, class_id: int) -> ClassEmbeddingIndex:
+        """Return the index for a class, loading it from the database if needed."""
+        with self._lock:
+            index = self._indexes.get(class_id)
+        if index is not None and not self._is_stale(index):
+            return index
+
+        index = self._load(db, class_id)
+        with self._lock:
+            self._indexes[class_id] = index
+        return index
+
+    def match(self, db: Session, class_id: int, embedding: np.ndarray) -> Tuple[Optional[int], Optional[str], float]:
+        """
+        Find the enrolled student of a class closest to an embedding.
+
+        Returns:
+            Tuple containing:
+            - user_id of the closest student (or None if nobody is enrolled)
+            - Display name of that student (or None)
+            - Euclidean distance to that student
+        """
+        index = self.get(db, class_id)
+        row, distance = index.nearest(embedding)
+        if row is None:
+            return None, None, distance
+        return int(index.user_ids[row]), index.names[row], distance
+
+    def match_many(self, db: Session, class_id: int, embeddings: np.ndarray) -> List[Tuple[Optional[int], Optional[str], float]]:
+        """Vectorized version of match for all faces of one frame."""
+        index = self.get(db, class_id)
+        rows, distances = index.nearest_many(embeddings)
+        return [
+            (None, None, float(distance)) if row < 0
+            else (int(index.user_ids[row]), index.names[row], float(distance))
+            for row, distance in zip(rows, distances)
+        ]
+
+    def invalidate_class(self, class_id: int) -> None:
+        """Drop the cached index of a class."""
+        with self._lock:
+            self._indexes.pop(class_id, None)
+
+    def invalidate_classes(self, class_ids: Iterable[int]) -> None:
+        """Drop the cached indexes of several classes."""
+        with self._lock:
+            for class_id in class_ids:
+                self._indexes.pop(class_id, None)
+
+    def invalidate_user(self, db: Session, user_id: int) -> None:
+        """Drop the cached index of every class the user belongs to."""
+        class_ids = [
+            row.class_id for row in
+            db.query(ClassUser.class_id).filter(ClassUser.user_id == user_id).all()
+        ]
+        self.invalidate_classes(class_ids)
+
+    def clear(self) -> None:
+        """Drop every cached index."""
+        with self._lock:
+            self._indexes.clear()
+
+    def _is_stale(self, index: ClassEmbeddingIndex) -> bool:
+        if index.model_version != rollout.serving_version:
+            return True
+        return self.ttl_seconds > 0 and time.monotonic() - index.loaded_at > self.ttl_seconds
+
+    def _load(self, db: Session, class_id: int) -> ClassEmbeddingIndex:
+        # Embeddings of the model currently serving queries (see embedding_rollout)
+        model_version = rollout.serving_version
+        embedding = rollout.embedding_column(model_version).label('face_embedding')
+        rows = db.query(User.user_id, User.name, User.prenom, embedding)\
+            .join(ClassUser, ClassUser.user_id == User.user_id)\
+            .filter(
+                ClassUser.class_id == class_id,
+                User.role == UserRole.STUDENT,
+                rollout.has_embedding(model_version)
+            ).all()
+
+        user_ids = []
+        names = []
+        vectors = []
+        for row in rows:
+            try:
+                vectors.append(decode_embedding(row.face_embedding))
+            except Exception as e:
+                logger.error(f"Skipping unreadable embedding for user {row.user_id}: {str(e)}")
+                continue
+            user_ids.append(row.user_id)
+            names.append(f"{row.prenom} {row.name}")
+
+        if vectors:
+            matrix = np.ascontiguousarray(np.stack(vectors), dtype=np.float32)
+        else:
+            matrix = np.empty((0, 0), dtype=np.float32)
+
+        logger.info(f"Loaded embedding index for class {class_id}: {len(user_ids)} students")
+        return ClassEmbeddingIndex(
+            class_id=class_id,
+            user_ids=np.asarray(user_ids, dtype=np.int64),
+            names=names,
+            matrix=matrix,
+            sq_norms=np.einsum('ij,ij->i', matrix, matrix),
+            loaded_at=time.monotonic(),
+            model_version=model_version
+        )
+
+
+# Shared instance used by the Socket.IO handlers
+embedding_index = EmbeddingIndexService()
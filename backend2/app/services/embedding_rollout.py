@@ -0,0 +1,212 @@
+"""
+Embedding model upgrades without downtime.
+
+Every stored embedding is tagged with the model version that produced it
+and the enrollment crop is kept next to it. When a new model is
+configured (FACE_NEXT_MODEL_VERSION / FACE_NEXT_MODEL_PATH) the
+re-embedding job (ai/scripts/reembed_faces.py) fills
+User.face_embedding_next from the crops in the background, while the
+servers keep matching with the old model and User.face_embedding. Once no
+re-embeddable user is left, the servers load the new model and switch
+their indexes to the new embeddings (dual-index mode). Users enrolled
+before crops were kept cannot be re-embedded and would no longer be
+recognised, so the switch waits until they have enrolled again, unless
+FACE_ROLLOUT_ALLOW_MISSING_CROPS is set. `promote` later
+moves the new embeddings into face_embedding so the next model can be
+rolled out the same way.
+"""
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import cv2
+import numpy as np
+from sqlalchemy import and_, case, func, or_, update
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+
+def encode_face_crop(face_image: np.ndarray) -> bytes:
+    """JPEG-encode an enrollment crop for User.face_crop."""
+    ok, buffer = cv2.imencode('.jpg', face_image, [cv2.IMWRITE_JPEG_QUALITY, settings.FACE_CROP_JPEG_QUALITY])
+    if not ok:
+        raise ValueError("Failed to encode face crop")
+    return buffer.tobytes()
+
+def decode_face_crop(blob: bytes) -> Optional[np.ndarray]:
+    return cv2.imdecode(np.frombuffer(blob, np.uint8), cv2.IMREAD_COLOR)
+
+
+class EmbeddingRollout:
+    """Which model version is served, and how far the next one has been rolled out."""
+
+    def __init__(
+        self,
+        current_version: Optional[int] = None,
+        next_version: Optional[int] = None,
+        allow_missing_crops: Optional[bool] = None
+    ):
+        self.allow_missing_crops = (
+            settings.FACE_ROLLOUT_ALLOW_MISSING_CROPS if allow_missing_crops is None else allow_missing_crops
+        )
+        self.current_version = settings.FACE_EMBEDDING_MODEL_VERSION if current_version is None else current_version
+        self.next_version = settings.FACE_NEXT_MODEL_VERSION if next_version is None else next_version
+        if self.next_version == self.current_version:
+            self.next_version = None
+        # Switched to next_version by the model registry once its model is loaded
+        self.serving_version = self.current_version
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    @property
+    def in_progress(self) -> bool:
+        """True while a new model is configured but not served yet."""
+        return self.next_version is not None and self.serving_version != self.next_version
+
+    def model_path(self, version: int) -> Optional[str]:
+        """Model file for a version (None means the default FACE_MODEL_PATH lookup)."""
+        if version == self.next_version:
+            return settings.FACE_NEXT_MODEL_PATH
+        return settings.FACE_MODEL_PATH
+
+    # SQL helpers
+
+    def embedding_column(self, version: Optional[int] = None):
+        """SQL expression selecting the stored embedding produced by a model version."""
+        version = self.serving_version if version is None else version
+        return case(
+            (User.face_embedding_next_version == version, User.face_embedding_next),
+            else_=User.face_embedding
+        )
+
+    def has_embedding(self, version: Optional[int] = None):
+        """SQL filter for users with an embedding from a model version."""
+        version = self.serving_version if version is None else version
+        return or_(User.face_embedding_next_version == version, User.face_embedding_version == version)
+
+    def lacks_embedding(self, version: int):
+        """SQL filter for users without an embedding from a model version (NULL-safe negation of has_embedding)."""
+        return and_(
+            or_(User.face_embedding_version.is_(None), User.face_embedding_version != version),
+            or_(User.face_embedding_next_version.is_(None), User.face_embedding_next_version != version)
+        )
+
+    def needs_reembedding(self, version: int):
+        """SQL filter for users whose crop has not been embedded with a model version yet."""
+        return and_(User.face_crop.isnot(None), self.lacks_embedding(version))
+
+    def remaining(self, db: Session, version: Optional[int] = None) -> int:
+        version = self.next_version if version is None else version
+        if version is None:
+            return 0
+        return db.query(func.count(User.user_id)).filter(self.needs_reembedding(version)).scalar()
+
+    def missing_crops(self, db: Session, version: Optional[int] = None) -> int:
+        """Enrolled users without a crop nor an embedding for a version: they have to enroll again."""
+        version = self.next_version if version is None else version
+        if version is None:
+            return 0
+        return db.query(func.count(User.user_id)).filter(
+            User.face_embedding.isnot(None),
+            User.face_crop.is_(None),
+            self.lacks_embedding(version)
+        ).scalar()
+
+    def status(self, db: Session) -> Dict:
+        missing_crops = self.missing_crops(db)
+        return {
+            "current_version": self.current_version,
+            "next_version": self.next_version,
+            "serving_version": self.serving_version,
+            "remaining": self.remaining(db),
+            "missing_crops": missing_crops,
+        }
+
+    def check_complete(self, db: Session, force: bool = False) -> bool:
+        """
+        True once every enrolled user has an embedding for next_version.
+
+        Users without a crop block the switch unless allow_missing_crops
+        (FACE_ROLLOUT_ALLOW_MISSING_CROPS) is set, in which case they stop
+        being recognised until they enroll again. Checked at most every
+        FACE_ROLLOUT_CHECK_SECONDS unless forced.
+        """
+        if not self.in_progress:
+            return False
+        now = time.monotonic()
+        with self._lock:
+            if not force and now - self._checked_at < settings.FACE_ROLLOUT_CHECK_SECONDS:
+                return False
+            self._checked_at = now
+        remaining = self.remaining(db)
+        if remaining:
+            logger.info(f"Embedding rollout to model v{self.next_version}: {remaining} users left")
+            return False
+        missing_crops = self.missing_crops(db)
+        if missing_crops and not self.allow_missing_crops:
+            logger.warning(
+                f"Embedding rollout to model v{self.next_version}: {missing_crops} users have no enrollment "
+                f"crop and must enroll again (or set FACE_ROLLOUT_ALLOW_MISSING_CROPS to switch anyway)"
+            )
+            return False
+        if missing_crops:
+            logger.warning(f"Switching to model v{self.next_version} without {missing_crops} users lacking a crop")
+        return True
+
+    # Writes
+
+    def enrollment_values(self, embedding: bytes, version: int, crop: Optional[bytes] = None) -> Dict:
+        """
+        Column values for a fresh enrollment made with a model version.
+
+        An enrollment with the old model during a rollout clears the stale
+        next-model embedding so the job re-embeds the new crop.
+        """
+        values = {} if crop is None else {"face_crop": crop}
+        if self.next_version is not None and version == self.next_version:
+            values.update(face_embedding_next=embedding, face_embedding_next_version=version)
+        else:
+            values.update(
+                face_embedding=embedding,
+                face_embedding_version=version,
+                face_embedding_next=None,
+                face_embedding_next_version=None
+            )
+        return values
+
+    def store(self, user: User, embedding: bytes, version: int, crop: Optional[bytes] = None) -> None:
+        for column, value in self.enrollment_values(embedding, version, crop).items():
+            setattr(user, column, value)
+
+    def promote(self, db: Session, version: int) -> int:
+        """
+        Move embeddings of a fully rolled out version into face_embedding.
+
+        Run after every server serves the new model and FACE_EMBEDDING_MODEL_VERSION
+        has been raised; matching reads by version tag, so it is unaffected.
+
+        Returns:
+            Number of users updated
+        """
+        result = db.execute(
+            update(User)
+            .where(User.face_embedding_next_version == version)
+            .values(
+                face_embedding=User.face_embedding_next,
+                face_embedding_version=User.face_embedding_next_version,
+                face_embedding_next=None,
+                face_embedding_next_version=None
+            )
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        return result.rowcount
+
+
+# Shared instance
+rollout = EmbeddingRollout()
@@ -0,0 +1,135 @@
+import asyncio
+import functools
+import logging
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_face_executor: Optional[Executor] = None
+_db_executor: Optional[Executor] = None
+_qr_executor: Optional[Executor] = None
+_lock = threading.Lock()
+
+# Face service owned by a process pool worker (see _init_face_worker)
+_worker_face_service = None
+# Embedding model the workers load: (model_version, model_path)
+_worker_model = (None, None)
+
+
+def uses_process_pool() -> bool:
+    """True when the face pipeline runs in worker processes instead of threads."""
+    return settings.FACE_EXECUTOR == "process"
+
+def get_face_executor() -> Executor:
+    """
+    Return the executor for CPU-bound face work (OpenCV, TensorFlow).
+
+    "thread" (default) shares the models of this process; OpenCV and
+    TensorFlow release the GIL while they run. "process" starts workers
+    that each load their own copy of the models once at startup.
+    """
+    global _face_executor
+    with _lock:
+        if _face_executor is None:
+            workers = settings.FACE_EXECUTOR_WORKERS
+            if uses_process_pool():
+                _face_executor = ProcessPoolExecutor(
+                    max_workers=workers,
+                    initializer=_init_face_worker,
+                    initargs=_worker_model
+                )
+            else:
+                _face_executor = ThreadPoolExecutor(
+                    max_workers=workers,
+                    thread_name_prefix="face-worker"
+                )
+            logger.info(f"Started {settings.FACE_EXECUTOR} face executor with {workers} workers")
+        return _face_executor
+
+def get_db_executor() -> Executor:
+    """Return the thread pool used for blocking SQLAlchemy calls."""
+    global _db_executor
+    with _lock:
+        if _db_executor is None:
+            _db_executor = ThreadPoolExecutor(
+                max_workers=settings.DB_EXECUTOR_WORKERS,
+                thread_name_prefix="db-worker"
+            )
+        return _db_executor
+
+def get_qr_executor() -> Executor:
+    """Return the process pool that renders QR code images (pure Python, GIL bound)."""
+    global _qr_executor
+    with _lock:
+        if _qr_executor is None:
+            _qr_executor = ProcessPoolExecutor(max_workers=settings.QR_RENDER_WORKERS)
+            logger.info(f"Started QR render executor with {settings.QR_RENDER_WORKERS} workers")
+        return _qr_executor
+
+async def run_in_face_executor(func: Callable, *args, **kwargs) -> Any:
+    """Run a CPU-bound callable off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_face_executor(), functools.partial(func, *args, **kwargs))
+
+async def run_in_db_executor(func: Callable, *args, **kwargs) -> Any:
+    """Run a blocking database callable off the event loop."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+async def run_in_qr_executor(func: Callable, *args, **kwargs) -> Any:
+    """Render QR images in worker processes; func must be picklable (module level)."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_qr_executor(), functools.partial(func, *args, **kwargs))
+
+def set_worker_model(model_version: Optional[int], model_path: Optional[str]) -> None:
+    """
+    Choose the embedding model of process pool workers.
+
+    A running pool is retired (queued work still completes) and the next
+    call to get_face_executor starts workers that load the new model.
+    """
+    global _face_executor, _worker_model
+    with _lock:
+        if _worker_model == (model_version, model_path):
+            return
+        _worker_model = (model_version, model_path)
+        if _face_executor is not None and uses_process_pool():
+            _face_executor.shutdown(wait=False)
+            _face_executor = None
+
+def shutdown_executors() -> None:
+    """Stop all pools; called on application shutdown."""
+    global _face_executor, _db_executor, _qr_executor
+    with _lock:
+        for executor in (_face_executor, _db_executor, _qr_executor):
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+        _face_executor = None
+        _db_executor = None
+        _qr_executor = None
+
+
+# Process pool entry points. They must be module level so they can be pickled.
+
+def _init_face_worker(model_version: Optional[int] = None, model_path: Optional[str] = None) -> None:
+    global _worker_face_service
+    from app.services.face_recognition_service import FaceRecognitionService
+    _worker_face_service = FaceRecognitionService(model_version=model_version, model_path=model_path)
+
+def worker_detect_face(image_data, visualization: str = "image"):
+    return _worker_face_service.detect_face(image_data, visualization)
+
+def worker_detect_faces(image_data, visualization: str = "image", max_faces=None):
+    return _worker_face_service.detect_faces(image_data, visualization, max_faces)
+
+def worker_embed_faces(faces) -> np.ndarray:
+    return _worker_face_service.embed_faces(faces)
+
+def worker_assess_faces(faces):
+    return _worker_face_service.assess_faces(faces)
@@ -0,0 +1,168 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+AI_DIR = Path(__file__).parent.parent.parent / "ai"
+HAAR_CASCADE_PATH = AI_DIR / "haarcascade_frontalface_default.xml"
+YUNET_MODEL_PATH = AI_DIR / "model" / "face_detection_yunet_2023mar.onnx"
+SSD_MODEL_PATH = AI_DIR / "model" / "res10_300x300_ssd_iter_140000.caffemodel"
+SSD_CONFIG_PATH = AI_DIR / "model" / "deploy.prototxt"
+
+
+class FaceDetector:
+    """
+    Finds faces in a BGR frame.
+
+    Frames larger than `max_side` are downscaled before detection and the
+    boxes are scaled back to the original resolution, so callers always
+    crop from the full-quality frame.
+    """
+    name = "base"
+
+    def __init__(self, max_side: int = 0):
+        self.max_side = max_side
+
+    def detect(self, image: np.ndarray) -> np.ndarray:
+        """
+        Args:
+            image: BGR frame
+
+        Returns:
+            (N, 4) int32 array of (x, y, w, h) boxes in frame coordinates
+        """
+        height, width = image.shape[:2]
+        scale = 1.0
+        if self.max_side and max(height, width) > self.max_side:
+            scale = self.max_side / float(max(height, width))
+            image = cv2.resize(image, (int(width * scale), int(height * scale)), interpolation=cv2.INTER_AREA)
+
+        boxes = np.asarray(self._detect(image), dtype=np.float32).reshape(-1, 4)
+        if scale != 1.0:
+            boxes /= scale
+
+        # Clip to the frame so crops are never empty or out of bounds
+        x1 = np.clip(boxes[:, 0], 0, width)
+        y1 = np.clip(boxes[:, 1], 0, height)
+        x2 = np.clip(boxes[:, 0] + boxes[:, 2], 0, width)
+        y2 = np.clip(boxes[:, 1] + boxes[:, 3], 0, height)
+        boxes = np.stack([x1, y1, x2 - x1, y2 - y1], axis=1).round().astype(np.int32)
+        return boxes[(boxes[:, 2] > 0) & (boxes[:, 3] > 0)]
+
+    def _detect(self, image: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class HaarCascadeDetector(FaceDetector):
+    """OpenCV Haar cascade (the original detector)."""
+    name = "haar"
+
+    def __init__(self, cascade_path: str = str(HAAR_CASCADE_PATH), max_side: int = 0):
+        super().__init__(max_side)
+        if not Path(cascade_path).exists():
+            raise FileNotFoundError(f"Face cascade file not found at {cascade_path}")
+        self.cascade = cv2.CascadeClassifier(cascade_path)
+        if self.cascade.empty():
+            raise ValueError("Failed to load face cascade classifier")
+
+    def _detect(self, image: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        return self.cascade.detectMultiScale(
+            gray,
+            scaleFactor=1.1,
+            minNeighbors=5,
+            minSize=(30, 30)
+        )
+
+
+class YuNetDetector(FaceDetector):
+    """OpenCV's YuNet CNN detector (cv2.FaceDetectorYN, OpenCV >= 4.8)."""
+    name = "yunet"
+
+    def __init__(self, model_path: str = str(YUNET_MODEL_PATH), score_threshold: float = 0.5, max_side: int = 640):
+        super().__init__(max_side)
+        if not Path(model_path).exists():
+            raise FileNotFoundError(f"YuNet model not found at {model_path}")
+        self.detector = cv2.FaceDetectorYN.create(model_path, "", (320, 320), score_threshold, 0.3, 5000)
+        # The detector keeps per-input-size state
+        self._lock = threading.Lock()
+
+    def _detect(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        with self._lock:
+            self.detector.setInputSize((width, height))
+            _, faces = self.detector.detect(image)
+        if faces is None:
+            return np.empty((0, 4), dtype=np.float32)
+        return faces[:, :4]
+
+
+class SsdDetector(FaceDetector):
+    """ResNet-10 SSD face detector from the OpenCV samples, run with cv2.dnn."""
+    name = "ssd"
+
+    def __init__(
+        self,
+        model_path: str = str(SSD_MODEL_PATH),
+        config_path: str = str(SSD_CONFIG_PATH),
+        score_threshold: float = 0.5,
+        max_side: int = 640
+    ):
+        super().__init__(max_side)
+        for path in (model_path, config_path):
+            if not Path(path).exists():
+                raise FileNotFoundError(f"SSD face detector file not found at {path}")
+        self.net = cv2.dnn.readNetFromCaffe(config_path, model_path)
+        self.score_threshold = score_threshold
+        # cv2.dnn.Net is not safe to call from several threads at once
+        self._lock = threading.Lock()
+
+    def _detect(self, image: np.ndarray) -> np.ndarray:
+        height, width = image.shape[:2]
+        blob = cv2.dnn.blobFromImage(image, 1.0, (300, 300), (104.0, 177.0, 123.0))
+        with self._lock:
+            self.net.setInput(blob)
+            detections = self.net.forward()[0, 0]
+        detections = detections[detections[:, 2] >= self.score_threshold]
+        corners = detections[:, 3:7] * np.array([width, height, width, height], dtype=np.float32)
+        return np.column_stack([corners[:, :2], corners[:, 2:] - corners[:, :2]])
+
+
+def create_face_detector(kind: Optional[str] = None) -> FaceDetector:
+    """
+    Create the configured face detector.
+
+    Args:
+        kind: "haar", "yunet" or "ssd" (defaults to FACE_DETECTOR)
+    """
+    kind = (kind or settings.FACE_DETECTOR).lower()
+    max_side = settings.FACE_DETECTOR_MAX_SIDE
+    threshold = settings.FACE_DETECTION_CONFIDENCE
+
+    if kind == "haar":
+        detector = HaarCascadeDetector(max_side=max_side)
+    elif kind == "yunet":
+        detector = YuNetDetector(
+            settings.FACE_DETECTOR_MODEL_PATH or str(YUNET_MODEL_PATH),
+            score_threshold=threshold,
+            max_side=max_side
+        )
+    elif kind == "ssd":
+        detector = SsdDetector(
+            settings.FACE_DETECTOR_MODEL_PATH or str(SSD_MODEL_PATH),
+            settings.FACE_DETECTOR_CONFIG_PATH or str(SSD_CONFIG_PATH),
+            score_threshold=threshold,
+            max_side=max_side
+        )
+    else:
+        raise ValueError(f"Unknown face detector '{kind}'")
+
+    logger.info(f"Using {kind} face detector (max side {max_side or 'unlimited'})")
+    return detector
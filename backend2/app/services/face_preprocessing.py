@@ -0,0 +1,60 @@
+import threading
+from typing import Optional, Sequence
+
+import cv2
+import numpy as np
+
+FACE_INPUT_SIZE = 160
+INPUT_SHAPE = (FACE_INPUT_SIZE, FACE_INPUT_SIZE, 3)
+
+_local = threading.local()
+
+
+def _buffers(batch_size: int):
+    """Per-thread float32 batch buffer and uint8 resize scratch, grown on demand."""
+    batch = getattr(_local, "batch", None)
+    if batch is None or len(batch) < batch_size:
+        capacity = max(batch_size, 2 * len(batch) if batch is not None else 8)
+        _local.batch = batch = np.empty((capacity,) + INPUT_SHAPE, dtype=np.float32)
+        _local.scratch = np.empty(INPUT_SHAPE, dtype=np.uint8)
+    return batch, _local.scratch
+
+def preprocess_faces(face_images: Sequence[np.ndarray], out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Resize and scale N face crops into one (N, 160, 160, 3) float32 model input.
+
+    Each crop is resized into a reused uint8 scratch image and scaled
+    straight into its row of the batch, so no temporaries are allocated per
+    crop (cv2.resize + astype + divide + expand_dims + stack used to make
+    five).
+
+    Args:
+        face_images: BGR face crops of any size
+        out: Destination array of shape (>= N, 160, 160, 3). When omitted a
+            per-thread buffer is reused, so the result is only valid until
+            the next call from the same thread; pass `out` to keep it.
+
+    Returns:
+        View of the first N rows of the destination
+    """
+    count = len(face_images)
+    if out is None:
+        out, scratch = _buffers(count)
+    else:
+        scratch = np.empty(INPUT_SHAPE, dtype=np.uint8)
+    for row, face in enumerate(face_images):
+        cv2.resize(face, (FACE_INPUT_SIZE, FACE_INPUT_SIZE), dst=scratch)
+        np.multiply(scratch, np.float32(1.0 / 255.0), out=out[row], casting="unsafe")
+    return out[:count]
+
+def preprocess_faces_blob(face_images: Sequence[np.ndarray]) -> np.ndarray:
+    """
+    Same input built with cv2.dnn.blobFromImages (NCHW, transposed to NHWC).
+
+    Allocates a fresh blob per call; kept for runtimes that take NCHW input
+    and as the reference in tests/benchmarks/bench_preprocessing.py.
+    """
+    blob = cv2.dnn.blobFromImages(
+        list(face_images), scalefactor=1.0 / 255.0, size=(FACE_INPUT_SIZE, FACE_INPUT_SIZE), swapRB=False, crop=False
+    )
+    return blob.transpose(0, 2, 3, 1)
@@ -1,71 +1,168 @@
+import asyncio
 import cv2
 import numpy as np
-import tensorflow as tf
-from pathlib import Path
 import base64
 import io
 from PIL import Image
-from app.services.model_handler import load_face_model
+from app.services.inference_backend import load_inference_backend
+from app.services.face_detectors import create_face_detector
+from app.services.embedding_codec import encode_embedding
+from app.services.inference_batcher import EmbeddingBatcher
+from app.services.face_preprocessing import FACE_INPUT_SIZE, preprocess_faces
+from app.services import executor
+from app.core.config import settings
 import logging
-from typing import Optional, Tuple
-import json
+from typing import List, Optional, Tuple, Union
 
 logger = logging.getLogger(__name__)
 
 class FaceRecognitionService:
-    def __init__(self):
+    def __init__(self, load_models: bool = True, model_version: Optional[int] = None, model_path: Optional[str] = None):
+        """
+        Args:
+            load_models: Load the face detector and embedding model in this process.
+                False when a process pool owns the models and this instance
+                only dispatches the async methods to it.
+            model_version: Version tag written into generated embeddings
+                (defaults to FACE_EMBEDDING_MODEL_VERSION)
+            model_path: Embedding model file (defaults to FACE_MODEL_PATH)
+        """
         try:
-            # Load Haar Cascade
-            cascade_path = Path(__file__).parent.parent.parent / "ai" / "haarcascade_frontalface_default.xml"
-            if not cascade_path.exists():
-                raise FileNotFoundError(f"Face cascade file not found at {cascade_path}")
-            self.face_cascade = cv2.CascadeClassifier(str(cascade_path))
-            if self.face_cascade.empty():
-                raise ValueError("Failed to load face cascade classifier")
-            
-            # Load Keras model
-            model_path = Path(__file__).parent.parent.parent / "ai" / "model" / "trained_embedding_model_retrainedv4.keras"
-            if not model_path.exists():
-                raise FileNotFoundError(f"Face embedding model not found at {model_path}")
-            self.embedding_model = load_face_model(str(model_path))
+            self.face_detector = None
+            self.embedding_backend = None
+            self.model_version = settings.FACE_EMBEDDING_MODEL_VERSION if model_version is None else model_version
+            if load_models:
+                # Load face detector (Haar cascade, YuNet or SSD, see FACE_DETECTOR)
+                self.face_detector = create_face_detector()
+
+                # Load embedding model (Keras, TFLite or ONNX, see FACE_INFERENCE_BACKEND)
+                self.embedding_backend = load_inference_backend(model_path=model_path)
+
+            # Micro-batching queue shared by all Socket.IO clients. It carries
+            # raw uint8 crops; preprocessing happens once per batch on the executor
+            self.batcher = EmbeddingBatcher(
+                self.embed_faces_async,
+                max_batch_size=settings.EMBEDDING_BATCH_MAX_SIZE,
+                max_wait_ms=settings.EMBEDDING_BATCH_MAX_WAIT_MS,
+                collate=list
+            )
             
             logger.info("Face recognition service initialized successfully")
         except Exception as e:
             logger.error(f"Failed to initialize face recognition service: {str(e)}", exc_info=True)
             raise
         
-    def detect_face(self, image_data: str) -> Tuple[Optional[np.ndarray], Optional[str], Optional[str]]:
+    def decode_image(self, image_data: Union[str, bytes, bytearray, memoryview]) -> Optional[np.ndarray]:
+        """
+        Decode a frame into a BGR image.
+
+        Args:
+            image_data: Raw JPEG/PNG bytes (binary Socket.IO attachment) or a
+                base64 string, with or without a data URL prefix
+
+        Returns:
+            Decoded image (or None if it cannot be decoded)
+        """
+        if isinstance(image_data, str):
+            image_bytes = base64.b64decode(image_data.split(',', 1)[-1])
+        else:
+            image_bytes = image_data
+        nparr = np.frombuffer(image_bytes, np.uint8)
+        return cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+
+    def render_visualization(self, image: np.ndarray, boxes, mode: str = "image"):
+        """
+        Build the visualization returned to the client.
+
+        Args:
+            image: Decoded frame
+            boxes: Detected faces as (x, y, w, h)
+            mode: "image" (annotated JPEG data URL), "boxes" (coordinates only) or "none"
+        """
+        if mode == "none":
+            return None
+        if mode == "boxes":
+            return {
+                'width': int(image.shape[1]),
+                'height': int(image.shape[0]),
+                'boxes': [[int(v) for v in box] for box in boxes]
+            }
+
+        vis_image = image.copy()
+        for (x, y, w, h) in boxes:
+            # Draw rectangle around face
+            cv2.rectangle(vis_image, (x, y), (x+w, y+h), (0, 255, 0), 2)
+            # Add text
+            cv2.putText(vis_image, "Face Detected", (x, y-10),
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
+
+        # Convert visualization to base64
+        _, buffer = cv2.imencode('.jpg', vis_image)
+        vis_base64 = base64.b64encode(buffer).decode('utf-8')
+        return f"data:image/jpeg;base64,{vis_base64}"
+
+    def find_faces(self, image: np.ndarray) -> np.ndarray:
+        """Return the (x, y, w, h) boxes of every face in a decoded frame"""
+        return self.face_detector.detect(image)
+
+    def detect_faces(self, image_data, visualization: str = "image", max_faces: Optional[int] = None) -> Tuple[List[np.ndarray], np.ndarray, Optional[object], Optional[str]]:
+        """
+        Detect every face in the image (crowd mode).
+
+        Args:
+            image_data: Raw image bytes or base64 encoded image data
+            visualization: "image", "boxes" or "none" (see render_visualization)
+            max_faces: Keep only the largest faces if more are found
+
+        Returns:
+            Tuple containing:
+            - List of face crops (empty if no face detected)
+            - (N, 4) array of (x, y, w, h) boxes aligned with the crops
+            - Visualization as base64 string or box coordinates (or None)
+            - Error message (or None if successful)
+        """
+        try:
+            image = self.decode_image(image_data)
+            if image is None:
+                return [], np.empty((0, 4), dtype=np.int32), None, "Failed to decode image"
+
+            boxes = self.find_faces(image)
+            if len(boxes) == 0:
+                return [], boxes, None, "No face detected in image"
+
+            if max_faces is not None and len(boxes) > max_faces:
+                # Largest faces first: they are closest to the camera
+                order = np.argsort(boxes[:, 2] * boxes[:, 3])[::-1]
+                boxes = boxes[order[:max_faces]]
+
+            crops = [image[y:y+h, x:x+w] for (x, y, w, h) in boxes]
+            return crops, boxes, self.render_visualization(image, boxes, visualization), None
+
+        except Exception as e:
+            logger.error(f"Error in face detection: {str(e)}")
+            return [], np.empty((0, 4), dtype=np.int32), None, f"Error detecting face: {str(e)}"
+
+    def detect_face(self, image_data, visualization: str = "image") -> Tuple[Optional[np.ndarray], Optional[object], Optional[str]]:
         """
         Detect a face in the image and return the face image and visualization.
         
         Args:
-            image_data: Base64 encoded image data
+            image_data: Raw image bytes or base64 encoded image data
+            visualization: "image", "boxes" or "none" (see render_visualization)
             
         Returns:
             Tuple containing:
             - Face image as numpy array (or None if no face detected)
-            - Visualization image as base64 string (or None if error)
+            - Visualization as base64 string or box coordinates (or None)
             - Error message (or None if successful)
         """
         try:
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            nparr = np.frombuffer(image_bytes, np.uint8)
-            image = cv2.imdecode(nparr, cv2.IMREAD_COLOR)
+            image = self.decode_image(image_data)
             
             if image is None:
                 return None, None, "Failed to decode image"
             
-            # Convert to grayscale for face detection
-            gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            
-            # Detect faces
-            faces = self.face_cascade.detectMultiScale(
-                gray,
-                scaleFactor=1.1,
-                minNeighbors=5,
-                minSize=(30, 30)
-            )
+            faces = self.find_faces(image)
             
             if len(faces) == 0:
                 return None, None, "No face detected in image"
@@ -76,41 +173,145 @@ class FaceRecognitionService:
             # Get the first face
             x, y, w, h = faces[0]
             
-            # Create visualization image
-            vis_image = image.copy()
-            # Draw rectangle around face
-            cv2.rectangle(vis_image, (x, y), (x+w, y+h), (0, 255, 0), 2)
-            # Add text
-            cv2.putText(vis_image, "Face Detected", (x, y-10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, (0, 255, 0), 2)
-            
-            # Convert visualization to base64
-            _, buffer = cv2.imencode('.jpg', vis_image)
-            vis_base64 = base64.b64encode(buffer).decode('utf-8')
-            
             # Extract face region
             face = image[y:y+h, x:x+w]
             
-            return face, f"data:image/jpeg;base64,{vis_base64}", None
+            return face, self.render_visualization(image, faces, visualization), None
             
         except Exception as e:
             logger.error(f"Error in face detection: {str(e)}")
             return None, None, f"Error detecting face: {str(e)}"
 
+    def assess_face_quality(self, face_image: np.ndarray) -> Optional[dict]:
+        """
+        Cheap checks that reject crops the embedding model cannot match anyway.
+
+        Checks run cheapest first: face size, pose (box aspect ratio),
+        brightness and blur (variance of the Laplacian at model input size).
+
+        Args:
+            face_image: BGR face crop
+
+        Returns:
+            None if the crop is usable, otherwise a dict with the failed
+            check ('reason'), a message for the user, the measured 'value'
+            and the 'threshold' it missed
+        """
+        height, width = face_image.shape[:2]
+        size = min(height, width)
+        if size < settings.FACE_QUALITY_MIN_SIZE:
+            return self._quality_issue('too_small', 'Face is too small, please move closer to the camera',
+                                       size, settings.FACE_QUALITY_MIN_SIZE)
+
+        aspect = width / float(height)
+        if aspect < settings.FACE_QUALITY_MIN_ASPECT:
+            return self._quality_issue('pose', 'Please face the camera directly',
+                                       aspect, settings.FACE_QUALITY_MIN_ASPECT)
+        if aspect > settings.FACE_QUALITY_MAX_ASPECT:
+            return self._quality_issue('pose', 'Please face the camera directly',
+                                       aspect, settings.FACE_QUALITY_MAX_ASPECT)
+
+        gray = cv2.cvtColor(cv2.resize(face_image, (FACE_INPUT_SIZE, FACE_INPUT_SIZE)), cv2.COLOR_BGR2GRAY)
+        brightness = float(gray.mean())
+        if brightness < settings.FACE_QUALITY_MIN_BRIGHTNESS:
+            return self._quality_issue('too_dark', 'Face is too dark, please improve the lighting',
+                                       brightness, settings.FACE_QUALITY_MIN_BRIGHTNESS)
+        if brightness > settings.FACE_QUALITY_MAX_BRIGHTNESS:
+            return self._quality_issue('too_bright', 'Face is overexposed, please avoid direct light',
+                                       brightness, settings.FACE_QUALITY_MAX_BRIGHTNESS)
+
+        sharpness = float(cv2.Laplacian(gray, cv2.CV_64F).var())
+        if sharpness < settings.FACE_QUALITY_MIN_SHARPNESS:
+            return self._quality_issue('blurry', 'Face is blurry, please hold still',
+                                       sharpness, settings.FACE_QUALITY_MIN_SHARPNESS)
+        return None
+
+    @staticmethod
+    def _quality_issue(reason: str, message: str, value: float, threshold: float) -> dict:
+        return {
+            'reason': reason,
+            'message': message,
+            'value': round(float(value), 2),
+            'threshold': threshold
+        }
+
+    def assess_faces(self, face_images: List[np.ndarray]) -> List[Optional[dict]]:
+        """assess_face_quality for every crop (all None when FACE_QUALITY_ENABLED is off)"""
+        if not settings.FACE_QUALITY_ENABLED:
+            return [None] * len(face_images)
+        return [self.assess_face_quality(face) for face in face_images]
+
+    def preprocess_faces(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """Resize and scale face crops into one (N, 160, 160, 3) model input (see face_preprocessing)"""
+        return preprocess_faces(face_images)
+
+    def predict_batch(self, faces: np.ndarray) -> np.ndarray:
+        """Run the embedding model on a stacked (N, 160, 160, 3) batch"""
+        return self.embedding_backend.predict(faces)
+
+    def embed_faces(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """Preprocess raw face crops into the reused batch buffer and embed them"""
+        return self.predict_batch(self.preprocess_faces(face_images))
+
+    async def detect_face_async(self, image_data, visualization: str = "image") -> Tuple[Optional[np.ndarray], Optional[object], Optional[str]]:
+        """Run detect_face on the face executor so the event loop stays responsive"""
+        if executor.uses_process_pool():
+            return await executor.run_in_face_executor(executor.worker_detect_face, image_data, visualization)
+        return await executor.run_in_face_executor(self.detect_face, image_data, visualization)
+
+    async def detect_faces_async(self, image_data, visualization: str = "image", max_faces: Optional[int] = None):
+        """Run detect_faces on the face executor"""
+        if executor.uses_process_pool():
+            return await executor.run_in_face_executor(executor.worker_detect_faces, image_data, visualization, max_faces)
+        return await executor.run_in_face_executor(self.detect_faces, image_data, visualization, max_faces)
+
+    async def assess_faces_async(self, face_images: List[np.ndarray]) -> List[Optional[dict]]:
+        """Run assess_faces on the face executor"""
+        if executor.uses_process_pool():
+            return await executor.run_in_face_executor(executor.worker_assess_faces, face_images)
+        return await executor.run_in_face_executor(self.assess_faces, face_images)
+
+    async def embed_faces_async(self, face_images: List[np.ndarray]) -> np.ndarray:
+        """Run embed_faces on the face executor (only uint8 crops cross to process workers)"""
+        if executor.uses_process_pool():
+            return await executor.run_in_face_executor(executor.worker_embed_faces, face_images)
+        return await executor.run_in_face_executor(self.embed_faces, face_images)
+
     def generate_embedding(self, face_image):
-        """Generate embedding using the loaded Keras model"""
+        """Generate embedding using the loaded model"""
         try:
-            # Preprocess
-            face = cv2.resize(face_image, (160, 160))
-            face = face.astype('float32') / 255.0
-            face = np.expand_dims(face, axis=0)
-
-            # Generate embedding
-            embedding = self.embedding_model.predict(face, verbose=0)[0]
+            # Preprocess and generate embedding
+            embedding = self.embed_faces([face_image])[0]
             
-            # Convert to list and then to bytes for storage
-            embedding_list = embedding.tolist()
-            return json.dumps(embedding_list).encode('utf-8')
+            # Serialize to the versioned binary format for storage
+            return encode_embedding(embedding, model_version=self.model_version)
+        except Exception as e:
+            logger.error(f"Embedding generation error: {str(e)}", exc_info=True)
+            return None
+
+    async def generate_embedding_async(self, face_image) -> Optional[bytes]:
+        """Generate embedding through the shared micro-batching queue"""
+        try:
+            embedding = await self.batcher.submit(face_image)
+            return encode_embedding(embedding, model_version=self.model_version)
+        except Exception as e:
+            logger.error(f"Embedding generation error: {str(e)}", exc_info=True)
+            return None
+
+    async def generate_embeddings_async(self, face_images: List[np.ndarray]) -> Optional[np.ndarray]:
+        """
+        Embed several faces of one frame as a single batch.
+
+        Returns:
+            (N, D) float32 embeddings aligned with face_images (or None on error)
+        """
+        if not face_images:
+            return np.empty((0, 0), dtype=np.float32)
+        try:
+            embeddings = await asyncio.gather(
+                *(self.batcher.submit(face) for face in face_images)
+            )
+            return np.stack(embeddings).astype(np.float32, copy=False)
         except Exception as e:
             logger.error(f"Embedding generation error: {str(e)}", exc_info=True)
-            return None
\ No newline at end of file
+            return None
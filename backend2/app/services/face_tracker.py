@@ -0,0 +1,176 @@
+import itertools
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def iou_matrix(boxes: np.ndarray, others: np.ndarray) -> np.ndarray:
+    """
+    Intersection over union of every pair of (x, y, w, h) boxes.
+
+    Returns:
+        (len(boxes), len(others)) float32 matrix
+    """
+    a = np.asarray(boxes, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(others, dtype=np.float32).reshape(-1, 4)
+    ax2, ay2 = a[:, 0] + a[:, 2], a[:, 1] + a[:, 3]
+    bx2, by2 = b[:, 0] + b[:, 2], b[:, 1] + b[:, 3]
+
+    inter_w = np.clip(np.minimum(ax2[:, None], bx2[None, :]) - np.maximum(a[:, None, 0], b[None, :, 0]), 0, None)
+    inter_h = np.clip(np.minimum(ay2[:, None], by2[None, :]) - np.maximum(a[:, None, 1], b[None, :, 1]), 0, None)
+    inter = inter_w * inter_h
+    union = (a[:, 2] * a[:, 3])[:, None] + (b[:, 2] * b[:, 3])[None, :] - inter
+    return np.where(union > 0, inter / np.maximum(union, 1e-6), 0.0).astype(np.float32)
+
+
+@dataclass
+class Track:
+    """A face followed across frames and the identity last computed for it."""
+    track_id: int
+    box: np.ndarray
+    last_seen: float
+    user_id: Optional[int] = None
+    name: Optional[str] = None
+    distance: float = float('inf')
+    frames_since_embedding: int = 0
+    embedded: bool = False
+    last_frame: int = 0
+    # Frame signature (see frame_gate) when the identity was computed
+    signature: Optional[np.ndarray] = None
+    # The face may belong to someone else now (gap or scene change): embed again
+    stale: bool = False
+
+
+class FaceTracker:
+    """
+    IoU tracker for the faces seen by one Socket.IO client.
+
+    Boxes of a new frame are greedily linked to the existing track they
+    overlap most. The embedding model only has to run for tracks that are
+    new, have no confident identity yet, or are due for re-verification;
+    every other face reuses the identity attached to its track.
+
+    At a kiosk the next student stands where the previous one stood, so a
+    box overlapping an old track does not prove it is the same person. A
+    track linked again after one or more frames without it, or seen in a
+    frame that differs a lot from the one its identity was computed on, is
+    embedded again before its identity is reused.
+    """
+
+    def __init__(
+        self,
+        iou_threshold: Optional[float] = None,
+        max_idle_seconds: Optional[float] = None,
+        confident_distance: Optional[float] = None,
+        reverify_frames: Optional[int] = None,
+        scene_change_threshold: Optional[float] = None
+    ):
+        self.iou_threshold = settings.FACE_TRACK_IOU_THRESHOLD if iou_threshold is None else iou_threshold
+        self.max_idle_seconds = settings.FACE_TRACK_MAX_IDLE_SECONDS if max_idle_seconds is None else max_idle_seconds
+        self.confident_distance = settings.FACE_TRACK_CONFIDENT_DISTANCE if confident_distance is None else confident_distance
+        self.reverify_frames = settings.FACE_TRACK_REVERIFY_FRAMES if reverify_frames is None else reverify_frames
+        self.scene_change_threshold = (
+            settings.FACE_TRACK_SCENE_CHANGE_THRESHOLD if scene_change_threshold is None else scene_change_threshold
+        )
+        self.tracks: List[Track] = []
+        self._ids = itertools.count(1)
+        self._frame = 0
+        self._signature: Optional[np.ndarray] = None
+
+    def _scene_changed(self, track: Track) -> bool:
+        if self._signature is None or track.signature is None:
+            return False
+        return float(np.mean(np.abs(self._signature - track.signature))) >= self.scene_change_threshold
+
+    def update(self, boxes: np.ndarray, signature: Optional[np.ndarray] = None) -> List[Track]:
+        """
+        Link the boxes of a new frame to tracks.
+
+        Args:
+            boxes: (N, 4) array of (x, y, w, h) boxes
+            signature: frame_gate.frame_signature of the frame, if computed
+
+        Returns:
+            One track per box, in the same order
+        """
+        self._frame += 1
+        self._signature = signature
+        now = time.monotonic()
+        self.tracks = [t for t in self.tracks if now - t.last_seen <= self.max_idle_seconds]
+        boxes = np.asarray(boxes).reshape(-1, 4)
+
+        assigned: List[Optional[Track]] = [None] * len(boxes)
+        if self.tracks and len(boxes):
+            overlaps = iou_matrix(boxes, np.stack([t.box for t in self.tracks]))
+            used = set()
+            # Greedy assignment, best overlaps first
+            for flat in np.argsort(overlaps, axis=None)[::-1]:
+                row, col = np.unravel_index(flat, overlaps.shape)
+                if overlaps[row, col] < self.iou_threshold:
+                    break
+                if assigned[row] is None and col not in used:
+                    used.add(col)
+                    track = self.tracks[col]
+                    if self._frame - track.last_frame > 1 or self._scene_changed(track):
+                        track.stale = True
+                    track.box = boxes[row]
+                    track.last_seen = now
+                    track.last_frame = self._frame
+                    track.frames_since_embedding += 1
+                    assigned[row] = track
+
+        for row, track in enumerate(assigned):
+            if track is None:
+                track = Track(track_id=next(self._ids), box=boxes[row], last_seen=now, last_frame=self._frame)
+                self.tracks.append(track)
+                assigned[row] = track
+        return assigned
+
+    def needs_embedding(self, track: Track) -> bool:
+        """True if the face of this track has to go through the embedding model."""
+        return (
+            not track.embedded
+            or track.stale
+            or track.user_id is None
+            or track.distance >= self.confident_distance
+            or track.frames_since_embedding >= self.reverify_frames
+        )
+
+    def assign(self, track: Track, user_id: Optional[int], name: Optional[str], distance: float) -> None:
+        """Attach the result of a fresh embedding match to a track."""
+        track.user_id = user_id
+        track.name = name
+        track.distance = distance
+        track.frames_since_embedding = 0
+        track.embedded = True
+        track.stale = False
+        track.signature = self._signature
+
+
+@dataclass
+class _ClientTracker:
+    session_id: int
+    tracker: FaceTracker = field(default_factory=FaceTracker)
+
+
+# Tracker per Socket.IO sid
+_trackers: Dict[str, _ClientTracker] = {}
+
+
+def get_face_tracker(sid: str, session_id: int) -> FaceTracker:
+    """Tracker of a client; identities are dropped when it switches session."""
+    state = _trackers.get(sid)
+    if state is None or state.session_id != session_id:
+        state = _ClientTracker(session_id=session_id)
+        _trackers[sid] = state
+    return state.tracker
+
+def forget_face_tracker(sid: str) -> None:
+    _trackers.pop(sid, None)
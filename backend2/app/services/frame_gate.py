@@ -0,0 +1,101 @@
+import base64
+import logging
+import threading
+import time
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+SIGNATURE_SIZE = 16
+
+
+def frame_signature(image_data) -> Optional[np.ndarray]:
+    """
+    Cheap fingerprint of a frame: a 16x16 grayscale thumbnail.
+
+    JPEGs are decoded at 1/8 scale (libjpeg skips most of the IDCT work),
+    so this costs a small fraction of a full decode plus detection.
+
+    Args:
+        image_data: Raw image bytes or base64 encoded image data
+    """
+    if isinstance(image_data, str):
+        image_bytes = base64.b64decode(image_data.split(',', 1)[-1])
+    else:
+        image_bytes = image_data
+    small = cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_REDUCED_GRAYSCALE_8)
+    if small is None:
+        return None
+    thumbnail = cv2.resize(small, (SIGNATURE_SIZE, SIGNATURE_SIZE), interpolation=cv2.INTER_AREA)
+    return thumbnail.astype(np.int16)
+
+
+@dataclass
+class _KioskState:
+    session_id: Optional[int] = None
+    signature: Optional[np.ndarray] = None
+    result: Optional[Tuple[str, dict]] = None
+    result_at: float = 0.0
+
+
+class FrameGate:
+    """
+    Per-kiosk (Socket.IO sid) change detection.
+
+    When a frame is nearly identical to the one that produced the last
+    result and that result is younger than `hold_seconds`, the result is
+    replayed instead of running detection and the embedding model again.
+    This covers both an empty scene and the same student still standing
+    in front of the camera.
+    """
+
+    def __init__(self, diff_threshold: Optional[float] = None, hold_seconds: Optional[float] = None):
+        self.diff_threshold = settings.FRAME_GATE_DIFF_THRESHOLD if diff_threshold is None else diff_threshold
+        self.hold_seconds = settings.FRAME_GATE_HOLD_SECONDS if hold_seconds is None else hold_seconds
+        self._states: Dict[str, _KioskState] = {}
+        self._lock = threading.Lock()
+
+    def check(self, sid: str, session_id: int, signature: Optional[np.ndarray]) -> Optional[Tuple[str, dict]]:
+        """
+        Returns:
+            The (event, payload) to replay for an unchanged scene, or None
+            if the frame must go through the full pipeline
+        """
+        if signature is None:
+            return None
+        with self._lock:
+            state = self._states.setdefault(sid, _KioskState())
+            unchanged = (
+                state.session_id == session_id
+                and state.signature is not None
+                and float(np.mean(np.abs(signature - state.signature))) < self.diff_threshold
+            )
+            if unchanged and state.result and time.monotonic() - state.result_at < self.hold_seconds:
+                return state.result
+
+            # Scene changed (or result expired): this frame becomes the new reference
+            state.session_id = session_id
+            state.signature = signature
+            state.result = None
+            return None
+
+    def record(self, sid: str, event: str, payload: dict) -> None:
+        """Remember the result produced for the current reference frame."""
+        with self._lock:
+            state = self._states.get(sid)
+            if state is not None:
+                state.result = (event, payload)
+                state.result_at = time.monotonic()
+
+    def forget(self, sid: str) -> None:
+        with self._lock:
+            self._states.pop(sid, None)
+
+
+frame_gate = FrameGate()
@@ -0,0 +1,143 @@
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = Path(__file__).parent.parent.parent / "ai" / "model"
+MODEL_STEM = "trained_embedding_model_retrainedv4"
+
+_EXTENSIONS = {
+    "keras": ".keras",
+    "tflite": ".tflite",
+    "onnx": ".onnx",
+}
+
+
+class InferenceBackend:
+    """Runs the face embedding model on a preprocessed (N, 160, 160, 3) float32 batch."""
+    name = "base"
+
+    def predict(self, faces: np.ndarray) -> np.ndarray:
+        raise NotImplementedError
+
+
+class KerasBackend(InferenceBackend):
+    """Full TensorFlow/Keras model (reference implementation)."""
+    name = "keras"
+
+    def __init__(self, model_path: str):
+        # Imported here so the lighter backends never pull in TensorFlow
+        from app.services.model_handler import load_face_model
+        self.model = load_face_model(model_path)
+
+    def predict(self, faces: np.ndarray) -> np.ndarray:
+        return self.model.predict(faces, verbose=0)
+
+
+class TFLiteBackend(InferenceBackend):
+    """
+    TFLite flatbuffer, run with tflite_runtime when installed.
+
+    Falls back to tf.lite.Interpreter, which still loads TensorFlow but
+    keeps the same API. Quantized input/output tensors are handled using
+    the scale and zero point stored in the model.
+    """
+    name = "tflite"
+
+    def __init__(self, model_path: str, num_threads: int = 1):
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = int(self._input["shape"][0])
+        # The interpreter is stateful: one invocation at a time
+        self._lock = threading.Lock()
+
+    def _resize(self, batch_size: int) -> None:
+        if batch_size == self._batch_size:
+            return
+        shape = list(self._input["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(self._input["index"], shape)
+        self.interpreter.allocate_tensors()
+        self._input = self.interpreter.get_input_details()[0]
+        self._output = self.interpreter.get_output_details()[0]
+        self._batch_size = batch_size
+
+    def predict(self, faces: np.ndarray) -> np.ndarray:
+        with self._lock:
+            self._resize(len(faces))
+            tensor = faces
+            scale, zero_point = self._input["quantization"]
+            if self._input["dtype"] != np.float32 and scale:
+                tensor = np.round(faces / scale + zero_point)
+            self.interpreter.set_tensor(self._input["index"], tensor.astype(self._input["dtype"]))
+            self.interpreter.invoke()
+            output = self.interpreter.get_tensor(self._output["index"])
+            scale, zero_point = self._output["quantization"]
+            if self._output["dtype"] != np.float32 and scale:
+                output = (output.astype(np.float32) - zero_point) * scale
+            return np.array(output, dtype=np.float32)
+
+
+class OnnxBackend(InferenceBackend):
+    """ONNX model run with onnxruntime on the CPU execution provider."""
+    name = "onnx"
+
+    def __init__(self, model_path: str, num_threads: int = 1):
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        options.intra_op_num_threads = num_threads
+        options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            model_path,
+            sess_options=options,
+            providers=["CPUExecutionProvider"]
+        )
+        self._input_name = self.session.get_inputs()[0].name
+
+    def predict(self, faces: np.ndarray) -> np.ndarray:
+        output = self.session.run(None, {self._input_name: faces.astype(np.float32, copy=False)})[0]
+        return np.asarray(output, dtype=np.float32)
+
+
+def default_model_path(kind: str) -> Path:
+    """Location of the exported model for a backend inside ai/model."""
+    return MODEL_DIR / f"{MODEL_STEM}{_EXTENSIONS[kind]}"
+
+def load_inference_backend(kind: Optional[str] = None, model_path: Optional[str] = None) -> InferenceBackend:
+    """
+    Create the configured inference backend.
+
+    Args:
+        kind: "keras", "tflite" or "onnx" (defaults to FACE_INFERENCE_BACKEND)
+        model_path: Model file (defaults to FACE_MODEL_PATH, then ai/model/<stem>.<ext>)
+    """
+    kind = (kind or settings.FACE_INFERENCE_BACKEND).lower()
+    if kind not in _EXTENSIONS:
+        raise ValueError(f"Unknown inference backend '{kind}'")
+
+    path = Path(model_path or settings.FACE_MODEL_PATH or default_model_path(kind))
+    if not path.exists():
+        raise FileNotFoundError(f"Face embedding model not found at {path}")
+
+    threads = settings.FACE_INFERENCE_THREADS
+    if kind == "keras":
+        backend = KerasBackend(str(path))
+    elif kind == "tflite":
+        backend = TFLiteBackend(str(path), num_threads=threads)
+    else:
+        backend = OnnxBackend(str(path), num_threads=threads)
+
+    logger.info(f"Loaded {kind} embedding model from {path}")
+    return backend
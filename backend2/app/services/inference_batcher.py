@@ -0,0 +1,114 @@
+import asyncio
+import inspect
+import logging
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class EmbeddingBatcher:
+    """
+    Micro-batching queue in front of the embedding model.
+
+    Faces submitted by concurrent Socket.IO handlers are collected for up to
+    `max_wait_ms` (or until `max_batch_size` is reached), stacked into one
+    tensor and run through the model in a single call. Each caller awaits a
+    future that resolves to its own row of the output.
+
+    `predict_batch` may be a plain function or a coroutine function (for
+    example one that hands the batch to an executor). `collate` turns the
+    submitted items into the batch argument; pass `list` to hand over raw
+    items that still need preprocessing.
+    """
+
+    def __init__(
+        self,
+        predict_batch: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        collate: Callable[[List], object] = np.stack
+    ):
+        self.predict_batch = predict_batch
+        self.collate = collate
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self._queue: Optional[asyncio.Queue] = None
+        self._worker: Optional[asyncio.Task] = None
+
+    async def submit(self, face_tensor: np.ndarray) -> np.ndarray:
+        """
+        Queue one face and wait for its embedding.
+
+        Args:
+            face_tensor: Face of shape (H, W, C), preprocessed unless a
+                custom `collate` prepares the batch
+
+        Returns:
+            Embedding vector for that face
+        """
+        self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((face_tensor, future))
+        return await future
+
+    async def close(self) -> None:
+        """Stop the worker task; pending callers get a CancelledError."""
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        self._queue = None
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._run())
+
+    async def _collect(self) -> List[Tuple[np.ndarray, asyncio.Future]]:
+        """Wait for the first item, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                # Still drain whatever is already queued without waiting
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            items = [(tensor, future) for tensor, future in batch if not future.cancelled()]
+            if not items:
+                continue
+            try:
+                outputs = await self._predict(self.collate([tensor for tensor, _ in items]))
+            except Exception as e:
+                logger.error(f"Batched embedding inference failed: {str(e)}", exc_info=True)
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), output in zip(items, outputs):
+                if not future.done():
+                    future.set_result(output)
+
+    async def _predict(self, batch) -> np.ndarray:
+        result = self.predict_batch(batch)
+        if inspect.isawaitable(result):
+            result = await result
+        return result
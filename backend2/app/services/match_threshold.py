@@ -0,0 +1,111 @@
+"""
+Per-model face match thresholds.
+
+Thresholds calibrated with ai/scripts/calibrate_threshold.py are stored in
+a small JSON file keyed by embedding model version. The matcher reads the
+threshold of the model it is serving, so a model rollout switches the
+threshold together with the embeddings. Models without a calibrated
+threshold fall back to FACE_RECOGNITION_THRESHOLD.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, Optional
+
+from app.core.config import settings
+from app.services.embedding_rollout import rollout
+from app.services.inference_backend import MODEL_DIR
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLDS_PATH = MODEL_DIR / "match_thresholds.json"
+RELOAD_CHECK_SECONDS = 5.0
+
+
+class MatchThresholds:
+    """
+    Calibrated thresholds by model version, re-read when the file changes.
+
+    The file is stat'ed at most every RELOAD_CHECK_SECONDS, so a threshold
+    saved by the calibration tool reaches running servers without a restart.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = Path(path or settings.FACE_THRESHOLDS_PATH or DEFAULT_THRESHOLDS_PATH)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._mtime: Optional[float] = None
+        self._checked_at = float('-inf')
+
+    def _read(self) -> Dict[str, dict]:
+        try:
+            with open(self.path) as f:
+                return json.load(f).get("models", {})
+        except FileNotFoundError:
+            return {}
+
+    def _refresh(self) -> Dict[str, dict]:
+        now = time.monotonic()
+        if now - self._checked_at < RELOAD_CHECK_SECONDS:
+            return self._entries
+        with self._lock:
+            self._checked_at = now
+            try:
+                mtime = self.path.stat().st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if mtime != self._mtime:
+                try:
+                    self._entries = self._read()
+                    self._mtime = mtime
+                    logger.info(f"Loaded match thresholds for models {sorted(self._entries)} from {self.path}")
+                except (OSError, ValueError) as e:
+                    logger.warning(f"Could not read match thresholds from {self.path}: {e}")
+        return self._entries
+
+    def entry(self, model_version: Optional[int] = None) -> Optional[dict]:
+        """Calibration record of a model version (the serving model by default)."""
+        version = rollout.serving_version if model_version is None else model_version
+        return self._refresh().get(str(version))
+
+    def get(self, model_version: Optional[int] = None) -> float:
+        """Distance below which two faces of this model version are the same person."""
+        entry = self.entry(model_version)
+        if entry is None:
+            return settings.FACE_RECOGNITION_THRESHOLD
+        return float(entry["threshold"])
+
+    def save(self, model_version: int, threshold: float, **details) -> Path:
+        """
+        Persist a calibrated threshold, keeping those of other model versions.
+
+        Args:
+            model_version: Embedding model the threshold was calibrated for
+            threshold: Euclidean distance threshold
+            **details: Calibration figures stored alongside (FAR, FRR, ...)
+        """
+        with self._lock:
+            entries = self._read()
+            entries[str(model_version)] = {
+                "threshold": float(threshold),
+                "calibrated_at": datetime.now(timezone.utc).isoformat(),
+                **details
+            }
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump({"models": entries}, f, indent=2)
+            os.replace(tmp_path, self.path)
+            self._entries = entries
+            self._mtime = self.path.stat().st_mtime
+            self._checked_at = time.monotonic()
+        logger.info(f"Saved match threshold {threshold:.4f} for model v{model_version} to {self.path}")
+        return self.path
+
+
+# Shared instance
+match_thresholds = MatchThresholds()
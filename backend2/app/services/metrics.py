@@ -0,0 +1,117 @@
+import asyncio
+import functools
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Deque, Dict
+
+logger = logging.getLogger(__name__)
+
+
+class LatencyHistogram:
+    """Running count/sum plus a bounded window of recent samples for percentiles."""
+
+    def __init__(self, window: int = 2048):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._samples: Deque[float] = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+        self._samples.append(value)
+
+    def snapshot(self) -> Dict[str, float]:
+        samples = sorted(self._samples)
+
+        def percentile(q: float) -> float:
+            if not samples:
+                return 0.0
+            return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": percentile(0.50),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": self.max,
+        }
+
+
+class MetricsRegistry:
+    """In-process metrics, exposed as JSON by the metrics router."""
+
+    def __init__(self):
+        self._histograms: Dict[str, LatencyHistogram] = {}
+        self._counters: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, name: str, value: float) -> None:
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = LatencyHistogram()
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: int = 1) -> None:
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    @contextmanager
+    def timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def snapshot(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                "histograms": {name: h.snapshot() for name, h in self._histograms.items()},
+                "counters": dict(self._counters),
+            }
+
+    def reset(self) -> None:
+        with self._lock:
+            self._histograms.clear()
+            self._counters.clear()
+
+
+metrics = MetricsRegistry()
+
+
+def timed_handler(func):
+    """Record the latency of an async Socket.IO handler as socketio.<event>_seconds."""
+    name = f"socketio.{func.__name__}_seconds"
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        finally:
+            metrics.observe(name, time.perf_counter() - start)
+
+    return wrapper
+
+async def monitor_event_loop_lag(interval: float = 0.5) -> None:
+    """
+    Measure how late the event loop wakes up from a fixed sleep.
+
+    Anything that blocks the loop (a synchronous model call, a slow query)
+    shows up directly as lag in event_loop_lag_seconds.
+    """
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+        metrics.observe("event_loop_lag_seconds", lag)
+        if lag > 1.0:
+            logger.warning(f"Event loop lag of {lag:.3f}s detected")
@@ -0,0 +1,127 @@
+"""
+Conversion of the Keras face embedding model to lightweight runtimes.
+
+TensorFlow is only needed here, at export time. The exported TFLite or
+ONNX files are served by the matching backends in inference_backend.py.
+"""
+import logging
+from pathlib import Path
+from typing import Iterable, Iterator, List, Optional
+
+import cv2
+import numpy as np
+
+from app.services.face_preprocessing import INPUT_SHAPE, preprocess_faces
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def load_face_crops(image_dir: str, limit: int = 200) -> List[np.ndarray]:
+    """Read face crops (already cropped images) from a directory as BGR arrays."""
+    crops = []
+    for path in sorted(Path(image_dir).rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if image is not None:
+            crops.append(image)
+        if len(crops) >= limit:
+            break
+    return crops
+
+def preprocess_crops(crops: Iterable[np.ndarray]) -> np.ndarray:
+    """Same preprocessing as FaceRecognitionService, into a newly owned array."""
+    crops = list(crops)
+    return preprocess_faces(crops, out=np.empty((len(crops),) + INPUT_SHAPE, dtype=np.float32))
+
+def _representative_dataset(faces: np.ndarray) -> Iterator[List[np.ndarray]]:
+    for face in faces:
+        yield [face[np.newaxis, ...]]
+
+def export_tflite(
+    model_path: str,
+    output_path: str,
+    quantize: str = "none",
+    calibration_faces: Optional[np.ndarray] = None
+) -> Path:
+    """
+    Convert the Keras model to a TFLite flatbuffer.
+
+    Args:
+        model_path: Source .keras file (custom L2Normalization layer included)
+        output_path: Destination .tflite file
+        quantize: "none", "float16", "dynamic" (int8 weights) or "int8"
+            (int8 weights and activations, needs calibration_faces)
+        calibration_faces: Preprocessed faces used to calibrate int8 ranges
+
+    Input and output tensors stay float32 in every mode so callers do not
+    need to know how the model was quantized.
+    """
+    import tensorflow as tf
+    from app.services.model_handler import load_face_model
+
+    model = load_face_model(model_path)
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+
+    if quantize == "float16":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.target_spec.supported_types = [tf.float16]
+    elif quantize == "dynamic":
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    elif quantize == "int8":
+        if calibration_faces is None or len(calibration_faces) == 0:
+            raise ValueError("int8 quantization needs calibration faces")
+        converter.optimizations = [tf.lite.Optimize.DEFAULT]
+        converter.representative_dataset = lambda: _representative_dataset(calibration_faces)
+        # Keep the L2 normalization in float if it has no int8 kernel
+        converter.target_spec.supported_ops = [
+            tf.lite.OpsSet.TFLITE_BUILTINS_INT8,
+            tf.lite.OpsSet.TFLITE_BUILTINS,
+        ]
+    elif quantize != "none":
+        raise ValueError(f"Unknown quantization mode '{quantize}'")
+
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_bytes(converter.convert())
+    logger.info(f"Exported TFLite model ({quantize}) to {output}")
+    return output
+
+def export_onnx(
+    model_path: str,
+    output_path: str,
+    quantize: str = "none",
+    opset: int = 13
+) -> Path:
+    """
+    Convert the Keras model to ONNX with tf2onnx.
+
+    Args:
+        model_path: Source .keras file
+        output_path: Destination .onnx file
+        quantize: "none" or "dynamic" (int8 weights via onnxruntime.quantization)
+        opset: ONNX opset version
+    """
+    import tensorflow as tf
+    import tf2onnx
+    from app.services.model_handler import load_face_model
+
+    model = load_face_model(model_path)
+    signature = [tf.TensorSpec((None,) + INPUT_SHAPE, tf.float32, name="input")]
+
+    output = Path(output_path)
+    output.parent.mkdir(parents=True, exist_ok=True)
+    float_path = output if quantize == "none" else output.with_suffix(".float.onnx")
+    tf2onnx.convert.from_keras(model, input_signature=signature, opset=opset, output_path=str(float_path))
+
+    if quantize == "dynamic":
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+        quantize_dynamic(str(float_path), str(output), weight_type=QuantType.QInt8)
+        float_path.unlink()
+    elif quantize != "none":
+        raise ValueError(f"Unsupported ONNX quantization mode '{quantize}'")
+
+    logger.info(f"Exported ONNX model ({quantize}) to {output}")
+    return output
@@ -0,0 +1,171 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+import numpy as np
+
+from app.core.config import settings
+from app.services import executor
+from app.services.embedding_rollout import rollout
+
+logger = logging.getLogger(__name__)
+
+
+class ModelRegistry:
+    """
+    Process-wide, lazily initialized face recognition models.
+
+    Nothing heavy is imported or loaded until the first face request (or
+    the optional warm-up task), so auth and classroom endpoints can serve
+    traffic without OpenCV cascades or the embedding model in memory.
+    """
+
+    IDLE = "idle"
+    LOADING = "loading"
+    READY = "ready"
+    FAILED = "failed"
+
+    def __init__(self):
+        self._face_service = None
+        self._lock = threading.Lock()
+        self.state = self.IDLE
+        self.error: Optional[str] = None
+        self.load_seconds: Optional[float] = None
+        self._rollout_checked_at = 0.0
+        self._rollout_task: Optional[asyncio.Task] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self.state == self.READY
+
+    def get_face_service(self):
+        """Return the shared FaceRecognitionService, loading it on first use (blocking)."""
+        if self._face_service is not None:
+            return self._face_service
+        with self._lock:
+            if self._face_service is None:
+                self._face_service = self._load()
+        return self._face_service
+
+    async def get_face_service_async(self):
+        """Same as get_face_service, but loads off the event loop."""
+        if self._face_service is not None:
+            if rollout.in_progress:
+                self._schedule_rollout_check()
+            return self._face_service
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(None, self.get_face_service)
+
+    async def warm_up(self) -> None:
+        """Load the models and run one dummy inference so the first real frame is fast."""
+        try:
+            service = await self.get_face_service_async()
+            dummy = np.zeros((160, 160, 3), dtype=np.uint8)
+            await service.embed_faces_async([dummy])
+            logger.info("Face recognition models warmed up")
+        except Exception as e:
+            logger.error(f"Face model warm-up failed: {str(e)}")
+
+    def status(self) -> Dict:
+        return {
+            "state": self.state,
+            "error": self.error,
+            "load_seconds": self.load_seconds,
+            "backend": settings.FACE_INFERENCE_BACKEND,
+            "executor": settings.FACE_EXECUTOR,
+            "model_version": rollout.serving_version,
+            "next_model_version": rollout.next_version,
+        }
+
+    def reset(self) -> None:
+        """Forget the loaded service (used by tests and model reloads)."""
+        with self._lock:
+            self._face_service = None
+            self.state = self.IDLE
+            self.error = None
+            self.load_seconds = None
+
+    def _schedule_rollout_check(self) -> None:
+        """Check now and then whether the next model can be served; never blocks a frame."""
+        now = time.monotonic()
+        if now - self._rollout_checked_at < settings.FACE_ROLLOUT_CHECK_SECONDS:
+            return
+        if self._rollout_task is not None and not self._rollout_task.done():
+            return
+        self._rollout_checked_at = now
+        self._rollout_task = asyncio.get_running_loop().create_task(self._switch_model_if_ready())
+
+    async def _switch_model_if_ready(self) -> None:
+        """
+        Dual-index mode: keep serving the old model until every stored crop
+        has been re-embedded with the next one, then swap model and indexes.
+        """
+        from app.services.embedding_index import embedding_index
+
+        loop = asyncio.get_running_loop()
+        try:
+            if not await executor.run_in_db_executor(self._rollout_complete):
+                return
+            version = rollout.next_version
+            new_service = await loop.run_in_executor(None, self._create_service, version)
+        except Exception as e:
+            logger.error(f"Switching to embedding model v{rollout.next_version} failed: {str(e)}")
+            return
+
+        old_service = self._face_service
+        with self._lock:
+            rollout.serving_version = version
+            self._face_service = new_service
+        # Class and campus indexes reload with the embeddings of the new model
+        embedding_index.clear()
+        logger.info(f"Now serving embedding model v{version}")
+
+        if old_service is not None:
+            # Let embeddings already queued on the old model finish first
+            await asyncio.sleep(5)
+            await old_service.batcher.close()
+
+    @staticmethod
+    def _rollout_complete() -> bool:
+        from app.database import SessionLocal
+        db = SessionLocal()
+        try:
+            return rollout.check_complete(db, force=True)
+        finally:
+            db.close()
+
+    def _create_service(self, version: int):
+        # Imported here so importing the registry stays cheap
+        from app.services.face_recognition_service import FaceRecognitionService
+
+        model_path = rollout.model_path(version)
+        executor.set_worker_model(version, model_path)
+        # With a process pool the workers own the models; this process only dispatches
+        return FaceRecognitionService(
+            load_models=not executor.uses_process_pool(),
+            model_version=version,
+            model_path=model_path
+        )
+
+    def _load(self):
+        self.state = self.LOADING
+        start = time.perf_counter()
+        try:
+            # A server (re)started after the new index was completed serves the new model right away
+            if rollout.in_progress and self._rollout_complete():
+                rollout.serving_version = rollout.next_version
+            service = self._create_service(rollout.serving_version)
+        except Exception as e:
+            self.state = self.FAILED
+            self.error = str(e)
+            raise
+        self.load_seconds = time.perf_counter() - start
+        self.state = self.READY
+        self.error = None
+        logger.info(f"Face recognition service (model v{rollout.serving_version}) loaded in {self.load_seconds:.2f}s")
+        return service
+
+
+model_registry = ModelRegistry()
@@ -0,0 +1,531 @@
+"""
+Training and fine-tuning of the face embedding model on campus photos.
+
+Built to run overnight on a CPU-only host. Face crops are read from
+<root>/<identity>/*.jpg, decoded and resized once (in parallel) and cached,
+then served as P identities x K photos per batch so that every batch holds
+positives and negatives for online hard mining. Batch shapes can change
+between phases of one run (small, cheap batches first, larger batches with
+harder negatives later).
+
+The exported .keras model takes the same BGR [0, 1] 160x160 input that
+preprocess_faces produces and ends in L2Normalization, so
+FaceRecognitionService, the inference backends and export_model.py load it
+unchanged.
+"""
+import hashlib
+import logging
+import math
+import os
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import tensorflow as tf
+
+from app.services.face_preprocessing import FACE_INPUT_SIZE, INPUT_SHAPE
+from app.services.model_handler import L2Normalization, load_face_model
+
+logger = logging.getLogger(__name__)
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+AUTOTUNE = tf.data.AUTOTUNE
+
+
+# Data
+
+@dataclass
+class FaceDataset:
+    """Image paths with contiguous integer labels, one label per identity directory."""
+    paths: List[str]
+    labels: np.ndarray
+    identities: List[str]
+
+    @property
+    def num_classes(self) -> int:
+        return len(self.identities)
+
+    def paths_by_class(self) -> List[List[str]]:
+        grouped: List[List[str]] = [[] for _ in self.identities]
+        for path, label in zip(self.paths, self.labels):
+            grouped[label].append(path)
+        return grouped
+
+    def subset(self, classes: Sequence[int]) -> "FaceDataset":
+        """The given identities, relabelled 0..len(classes)-1."""
+        remap = {int(old): new for new, old in enumerate(classes)}
+        keep = [i for i, label in enumerate(self.labels) if int(label) in remap]
+        return FaceDataset(
+            paths=[self.paths[i] for i in keep],
+            labels=np.array([remap[int(self.labels[i])] for i in keep], dtype=np.int32),
+            identities=[self.identities[old] for old in classes]
+        )
+
+def scan_identities(root: str, min_images: int = 1) -> FaceDataset:
+    """
+    Collect face crops laid out as <root>/<identity>/<photo>.
+
+    Args:
+        root: Dataset directory, one sub-directory per person
+        min_images: Skip identities with fewer photos than this
+    """
+    paths: List[str] = []
+    labels: List[int] = []
+    identities: List[str] = []
+    for directory in sorted(p for p in Path(root).iterdir() if p.is_dir()):
+        files = sorted(str(f) for f in directory.rglob("*") if f.suffix.lower() in IMAGE_SUFFIXES)
+        if len(files) < min_images:
+            continue
+        paths.extend(files)
+        labels.extend([len(identities)] * len(files))
+        identities.append(directory.name)
+    return FaceDataset(paths, np.array(labels, dtype=np.int32), identities)
+
+def split_identities(dataset: FaceDataset, validation_fraction: float, seed: int = 0) -> Tuple[FaceDataset, FaceDataset]:
+    """
+    Hold out whole identities for validation.
+
+    The model is evaluated on people it never saw, like newly enrolled
+    students, rather than on other photos of training identities.
+    """
+    order = np.random.default_rng(seed).permutation(dataset.num_classes)
+    held_out = int(round(dataset.num_classes * validation_fraction))
+    return dataset.subset(sorted(order[held_out:])), dataset.subset(sorted(order[:held_out]))
+
+def decode_face(path: tf.Tensor) -> tf.Tensor:
+    """Read a crop as a 160x160 BGR uint8 image, the channel order cv2 hands the service."""
+    image = tf.io.decode_image(tf.io.read_file(path), channels=3, expand_animations=False)
+    image = tf.image.resize(image, (FACE_INPUT_SIZE, FACE_INPUT_SIZE))  # bilinear, like cv2.resize
+    return tf.saturate_cast(tf.round(tf.reverse(image, axis=[-1])), tf.uint8)
+
+def augment_face(image: tf.Tensor) -> tf.Tensor:
+    """
+    Random flip, zoom/shift, colour jitter and JPEG re-compression of one crop.
+
+    Mimics the variation between an enrollment photo and a kiosk frame:
+    looser or tighter detector boxes, lighting, and JPEG-compressed video.
+
+    Returns:
+        float32 image in [0, 1]
+    """
+    image = tf.image.convert_image_dtype(image, tf.float32)
+    image = tf.image.random_flip_left_right(image)
+    side = tf.cast(tf.random.uniform([], 0.85, 1.0) * FACE_INPUT_SIZE, tf.int32)
+    image = tf.image.random_crop(image, tf.stack([side, side, 3]))
+    image = tf.image.resize(image, (FACE_INPUT_SIZE, FACE_INPUT_SIZE))
+    image = tf.image.random_brightness(image, 0.15)
+    image = tf.image.random_contrast(image, 0.8, 1.2)
+    image = tf.image.random_saturation(image, 0.8, 1.2)
+    image = tf.image.random_jpeg_quality(tf.clip_by_value(image, 0.0, 1.0), 50, 95)
+    return tf.ensure_shape(image, INPUT_SHAPE)
+
+def cache_fingerprint(paths: Sequence[str]) -> str:
+    """
+    Short hash of an ordered list of files and their size and mtime.
+
+    tf.data reuses an existing cache file without checking what it holds,
+    so cache names carry this hash: a rerun with other photos, another
+    identity labelling or another split writes a fresh cache instead of
+    reading someone else's faces.
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        stat = os.stat(path)
+        digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def _cache(dataset: tf.data.Dataset, cache_dir: Optional[str], name: str, paths: Sequence[str]) -> tf.data.Dataset:
+    if cache_dir is None:
+        return dataset.cache()
+    Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    return dataset.cache(str(Path(cache_dir) / f"{name}_{cache_fingerprint(paths)}"))
+
+def _labelled(label: int):
+    return lambda images: (images, tf.fill([tf.shape(images)[0]], label))
+
+def pk_batches(
+    dataset: FaceDataset,
+    identities_per_batch: int,
+    images_per_identity: int,
+    cache_dir: Optional[str] = None,
+    augment: bool = True,
+    seed: Optional[int] = None
+) -> tf.data.Dataset:
+    """
+    Endless batches of P identities x K photos for online hard mining.
+
+    Every identity has its own decoded, cached and reshuffled stream, so an
+    identity with fewer than K photos repeats them (differently augmented)
+    and still contributes positive pairs.
+
+    Args:
+        dataset: Training identities
+        identities_per_batch: P, identities sampled per batch
+        images_per_identity: K, photos taken from each sampled identity
+        cache_dir: Directory for on-disk decode caches (memory when None)
+        augment: Apply augment_face to every photo
+        seed: Seed of the identity sampler
+
+    Yields:
+        (images (P*K, 160, 160, 3) float32, labels (P*K,) int32)
+    """
+    per_class = []
+    for label, paths in enumerate(dataset.paths_by_class()):
+        stream = _cache(
+            tf.data.Dataset.from_tensor_slices(paths).map(decode_face, num_parallel_calls=AUTOTUNE),
+            cache_dir,
+            f"identity_{label}",
+            paths
+        )
+        per_class.append(
+            stream.shuffle(len(paths), reshuffle_each_iteration=True)
+            .repeat()
+            .batch(images_per_identity)
+            .map(_labelled(label))
+        )
+
+    selector = tf.data.Dataset.random(seed=seed).map(lambda x: x % dataset.num_classes)
+    batches = tf.data.Dataset.choose_from_datasets(per_class, selector).unbatch()
+    if augment:
+        batches = batches.map(lambda image, label: (augment_face(image), label), num_parallel_calls=AUTOTUNE)
+    else:
+        batches = batches.map(lambda image, label: (tf.image.convert_image_dtype(image, tf.float32), label))
+    batches = batches.batch(identities_per_batch * images_per_identity, drop_remainder=True)
+
+    options = tf.data.Options()
+    options.deterministic = False
+    return batches.with_options(options).prefetch(AUTOTUNE)
+
+def evaluation_images(dataset: FaceDataset, batch_size: int = 64, cache_dir: Optional[str] = None) -> tf.data.Dataset:
+    """Un-augmented crops in dataset order, for validation embeddings."""
+    images = tf.data.Dataset.from_tensor_slices(dataset.paths).map(decode_face, num_parallel_calls=AUTOTUNE)
+    images = _cache(images, cache_dir, "evaluation", dataset.paths)
+    return images.map(lambda image: tf.image.convert_image_dtype(image, tf.float32)).batch(batch_size).prefetch(AUTOTUNE)
+
+
+# Model and losses
+
+def build_embedding_model(
+    embedding_dim: int = 128,
+    width: float = 0.5,
+    imagenet_weights: bool = False,
+    dropout: float = 0.2
+) -> tf.keras.Model:
+    """
+    MobileNetV2 backbone with an L2-normalized embedding head.
+
+    Args:
+        embedding_dim: Size of the embedding
+        width: MobileNetV2 width multiplier (0.35, 0.5, 0.75 or 1.0); 0.5
+            keeps a CPU training epoch affordable
+        imagenet_weights: Start from ImageNet weights (downloaded by Keras)
+        dropout: Dropout before the embedding projection
+    """
+    inputs = tf.keras.Input(shape=INPUT_SHAPE, name="face")
+    x = tf.keras.layers.Rescaling(2.0, offset=-1.0)(inputs)  # [0, 1] -> [-1, 1] as MobileNetV2 expects
+    backbone = tf.keras.applications.MobileNetV2(
+        input_shape=INPUT_SHAPE,
+        alpha=width,
+        include_top=False,
+        weights="imagenet" if imagenet_weights else None
+    )
+    x = backbone(x)
+    x = tf.keras.layers.GlobalAveragePooling2D()(x)
+    x = tf.keras.layers.Dropout(dropout)(x)
+    x = tf.keras.layers.Dense(embedding_dim, use_bias=False)(x)
+    x = tf.keras.layers.BatchNormalization()(x)
+    outputs = L2Normalization(name="embedding")(x)
+    return tf.keras.Model(inputs, outputs, name="face_embedding")
+
+def load_for_fine_tuning(model_path: str, trainable_layers: Optional[int] = None) -> tf.keras.Model:
+    """
+    Load an exported model to continue training it.
+
+    Args:
+        model_path: .keras embedding model
+        trainable_layers: Only train the last N layers (all when None)
+    """
+    model = load_face_model(model_path)
+    if trainable_layers is not None:
+        for layer in model.layers[:-trainable_layers]:
+            layer.trainable = False
+    return model
+
+def batch_hard_triplet_loss(labels: tf.Tensor, embeddings: tf.Tensor, margin: float = 0.2) -> tf.Tensor:
+    """
+    Triplet loss with online batch-hard mining.
+
+    Every photo in the batch is an anchor paired with its farthest positive
+    and its closest negative, using the euclidean distance the matcher
+    thresholds at serving time.
+    """
+    labels = tf.reshape(tf.cast(labels, tf.int32), [-1])
+    embeddings = tf.cast(embeddings, tf.float32)
+    dot = tf.matmul(embeddings, embeddings, transpose_b=True)
+    sq_norms = tf.linalg.diag_part(dot)
+    distances = tf.sqrt(tf.maximum(sq_norms[:, None] - 2.0 * dot + sq_norms[None, :], 1e-12))
+
+    same = tf.equal(labels[:, None], labels[None, :])
+    positives = tf.logical_and(same, tf.logical_not(tf.eye(tf.shape(labels)[0], dtype=tf.bool)))
+    hardest_positive = tf.reduce_max(distances * tf.cast(positives, tf.float32), axis=1)
+    # Push same-identity pairs out of the min with a constant larger than any distance
+    ceiling = tf.stop_gradient(tf.reduce_max(distances)) + 1.0
+    hardest_negative = tf.reduce_min(distances + ceiling * tf.cast(same, tf.float32), axis=1)
+
+    valid = tf.cast(tf.logical_and(tf.reduce_any(positives, axis=1), tf.logical_not(tf.reduce_all(same, axis=1))), tf.float32)
+    losses = tf.nn.relu(hardest_positive - hardest_negative + margin) * valid
+    return tf.reduce_sum(losses) / tf.maximum(tf.reduce_sum(valid), 1.0)
+
+class ArcFaceHead(tf.keras.layers.Layer):
+    """Cosine similarity of each embedding to learned per-identity centres (training only)."""
+
+    def __init__(self, num_classes: int, **kwargs):
+        super().__init__(**kwargs)
+        self.num_classes = num_classes
+
+    def build(self, input_shape):
+        self.centres = self.add_weight(
+            name="centres", shape=(int(input_shape[-1]), self.num_classes), initializer="glorot_uniform"
+        )
+
+    def call(self, embeddings):
+        return tf.matmul(tf.math.l2_normalize(embeddings, axis=1), tf.math.l2_normalize(self.centres, axis=0))
+
+    def get_config(self):
+        config = super().get_config()
+        config.update({"num_classes": self.num_classes})
+        return config
+
+def arcface_loss(margin: float = 0.5, scale: float = 30.0) -> Callable[[tf.Tensor, tf.Tensor], tf.Tensor]:
+    """Additive angular margin softmax loss on ArcFaceHead cosines."""
+    def loss(labels, cosines):
+        labels = tf.reshape(tf.cast(labels, tf.int32), [-1])
+        cosines = tf.clip_by_value(tf.cast(cosines, tf.float32), -1.0 + 1e-7, 1.0 - 1e-7)
+        target = tf.one_hot(labels, depth=tf.shape(cosines)[1])
+        angles = tf.minimum(tf.acos(cosines) + margin * target, math.pi)
+        logits = scale * tf.cos(angles)
+        return tf.reduce_mean(tf.nn.sparse_softmax_cross_entropy_with_logits(labels, logits))
+    return loss
+
+
+# Evaluation
+
+def verification_scores(embeddings: np.ndarray, labels: np.ndarray, max_pairs: int = 2_000_000) -> Dict[str, float]:
+    """
+    Genuine/impostor separation of held-out embeddings.
+
+    Returns:
+        Dict with the accuracy at the best distance threshold, that
+        threshold, and the genuine/impostor pair counts
+    """
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    rows, cols = np.triu_indices(len(embeddings), k=1)
+    if len(rows) > max_pairs:
+        pick = np.random.default_rng(0).choice(len(rows), max_pairs, replace=False)
+        rows, cols = rows[pick], cols[pick]
+    distances = np.linalg.norm(embeddings[rows] - embeddings[cols], axis=1)
+    genuine = labels[rows] == labels[cols]
+    if not genuine.any() or genuine.all():
+        return {"accuracy": float("nan"), "threshold": float("nan"), "genuine": int(genuine.sum()), "impostor": int((~genuine).sum())}
+
+    # Balanced accuracy at every candidate threshold, from the sorted distances
+    order = np.argsort(distances)
+    genuine_sorted = genuine[order]
+    tar = np.cumsum(genuine_sorted) / genuine.sum()
+    trr = 1.0 - np.cumsum(~genuine_sorted) / (~genuine).sum()
+    balanced = (tar + trr) / 2.0
+    best = int(np.argmax(balanced))
+    return {
+        "accuracy": float(balanced[best]),
+        "threshold": float(distances[order][best]),
+        "genuine": int(genuine.sum()),
+        "impostor": int((~genuine).sum()),
+    }
+
+class VerificationCallback(tf.keras.callbacks.Callback):
+    """Scores held-out identities each epoch and saves the best embedding model."""
+
+    def __init__(self, embedding_model: tf.keras.Model, images: tf.data.Dataset, labels: np.ndarray, output_path: str):
+        super().__init__()
+        self.embedding_model = embedding_model
+        self.images = images
+        self.labels = labels
+        self.output_path = output_path
+        self.best = -1.0
+
+    def on_epoch_end(self, epoch, logs=None):
+        embeddings = self.embedding_model.predict(self.images, verbose=0)
+        scores = verification_scores(embeddings, self.labels)
+        if logs is not None:
+            logs["val_verification_accuracy"] = scores["accuracy"]
+            logs["val_threshold"] = scores["threshold"]
+        logger.info(
+            f"Epoch {epoch + 1}: held-out verification accuracy {scores['accuracy']:.4f} "
+            f"at distance {scores['threshold']:.3f}"
+        )
+        if scores["accuracy"] > self.best:
+            self.best = scores["accuracy"]
+            export_embedding_model(self.embedding_model, self.output_path)
+
+class TimeLimit(tf.keras.callbacks.Callback):
+    """Stops training once a wall-clock deadline has passed (checked after every epoch)."""
+
+    def __init__(self, deadline: float):
+        super().__init__()
+        self.deadline = deadline
+
+    @property
+    def expired(self) -> bool:
+        return time.monotonic() >= self.deadline
+
+    def on_epoch_end(self, epoch, logs=None):
+        if self.expired:
+            logger.info("Time limit reached, stopping training")
+            self.model.stop_training = True
+
+
+# Training
+
+@dataclass
+class BatchPhase:
+    """Epochs trained with P identities x K photos per batch."""
+    identities_per_batch: int
+    images_per_identity: int
+    epochs: int
+
+    @property
+    def batch_size(self) -> int:
+        return self.identities_per_batch * self.images_per_identity
+
+def parse_batch_schedule(schedule: str) -> List[BatchPhase]:
+    """Parse "16x4:10,32x4:20" into phases (P x K : epochs)."""
+    phases = []
+    for part in schedule.split(","):
+        shape, epochs = part.strip().split(":")
+        identities, images = shape.lower().split("x")
+        phases.append(BatchPhase(int(identities), int(images), int(epochs)))
+    return phases
+
+@dataclass
+class TrainingConfig:
+    data_dir: str
+    output_path: str
+    init_model: Optional[str] = None  # fine-tune this .keras model instead of building a new one
+    trainable_layers: Optional[int] = None
+    embedding_dim: int = 128
+    width: float = 0.5
+    imagenet_weights: bool = False
+    loss: str = "triplet"  # "triplet", "arcface" or "both"
+    triplet_margin: float = 0.2
+    arcface_margin: float = 0.5
+    arcface_scale: float = 30.0
+    phases: List[BatchPhase] = field(default_factory=lambda: parse_batch_schedule("16x4:10,32x4:20"))
+    learning_rate: float = 1e-3
+    min_images: int = 2
+    validation_fraction: float = 0.1
+    cache_dir: Optional[str] = None
+    threads: Optional[int] = None
+    max_hours: Optional[float] = None
+    seed: int = 0
+
+def configure_cpu(threads: Optional[int]) -> None:
+    """Pin TensorFlow's thread pools (must run before any op executes)."""
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(2)
+
+def _training_model(embedding_model: tf.keras.Model, config: TrainingConfig, num_classes: int):
+    """Wrap the embedding model with the loss heads; returns (model, losses by output name)."""
+    outputs, losses = {}, {}
+    embeddings = embedding_model.output
+    if config.loss in ("triplet", "both"):
+        outputs["triplet"] = embeddings
+        losses["triplet"] = lambda labels, emb: batch_hard_triplet_loss(labels, emb, config.triplet_margin)
+    if config.loss in ("arcface", "both"):
+        outputs["arcface"] = ArcFaceHead(num_classes, name="arcface")(embeddings)
+        losses["arcface"] = arcface_loss(config.arcface_margin, config.arcface_scale)
+    if not outputs:
+        raise ValueError(f"Unknown loss '{config.loss}'")
+    return tf.keras.Model(embedding_model.input, outputs), losses
+
+def export_embedding_model(model: tf.keras.Model, output_path: str) -> Path:
+    """Save the embedding model as .keras, the format load_face_model reads."""
+    output = Path(output_path)
+    if output.suffix != ".keras":
+        raise ValueError("The embedding model must be exported as a .keras file")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    model.save(str(output))
+    logger.info(f"Saved embedding model to {output}")
+    return output
+
+def train(config: TrainingConfig) -> Dict[str, float]:
+    """
+    Train (or fine-tune) the embedding model and export the best checkpoint.
+
+    Returns:
+        Held-out verification scores of the exported model
+    """
+    configure_cpu(config.threads)
+    tf.keras.utils.set_random_seed(config.seed)
+
+    dataset = scan_identities(config.data_dir, config.min_images)
+    train_set, val_set = split_identities(dataset, config.validation_fraction, config.seed)
+    if train_set.num_classes < 2:
+        raise ValueError(f"Need at least two identities with {config.min_images}+ photos in {config.data_dir}")
+    logger.info(
+        f"{train_set.num_classes} training identities ({len(train_set.paths)} photos), "
+        f"{val_set.num_classes} held out ({len(val_set.paths)} photos)"
+    )
+
+    if config.init_model:
+        embedding_model = load_for_fine_tuning(config.init_model, config.trainable_layers)
+    else:
+        embedding_model = build_embedding_model(config.embedding_dim, config.width, config.imagenet_weights)
+    model, losses = _training_model(embedding_model, config, train_set.num_classes)
+
+    steps = [max(1, len(train_set.paths) // phase.batch_size) for phase in config.phases]
+    schedule = tf.keras.optimizers.schedules.CosineDecay(
+        config.learning_rate, sum(s * p.epochs for s, p in zip(steps, config.phases)), alpha=0.01
+    )
+    model.compile(optimizer=tf.keras.optimizers.Adam(schedule), loss=losses)
+
+    time_limit = TimeLimit(time.monotonic() + (config.max_hours or float("inf")) * 3600)
+    callbacks: List[tf.keras.callbacks.Callback] = [time_limit, tf.keras.callbacks.TerminateOnNaN()]
+    val_cache = str(Path(config.cache_dir) / "validation") if config.cache_dir else None
+    if val_set.num_classes >= 2:
+        verification = VerificationCallback(
+            embedding_model, evaluation_images(val_set, cache_dir=val_cache), val_set.labels, config.output_path
+        )
+        callbacks.append(verification)
+
+    epoch = 0
+    for phase, steps_per_epoch in zip(config.phases, steps):
+        if time_limit.expired:
+            break
+        logger.info(
+            f"Phase {phase.identities_per_batch}x{phase.images_per_identity} "
+            f"(batch {phase.batch_size}) for {phase.epochs} epochs of {steps_per_epoch} steps"
+        )
+        train_cache = str(Path(config.cache_dir) / "train") if config.cache_dir else None
+        batches = pk_batches(
+            train_set, phase.identities_per_batch, phase.images_per_identity,
+            cache_dir=train_cache, seed=config.seed + epoch
+        )
+        batches = batches.map(lambda images, labels: (images, {name: labels for name in losses}))
+        model.fit(
+            batches,
+            initial_epoch=epoch,
+            epochs=epoch + phase.epochs,
+            steps_per_epoch=steps_per_epoch,
+            callbacks=callbacks,
+            verbose=2
+        )
+        epoch += phase.epochs
+
+    if val_set.num_classes < 2:
+        export_embedding_model(embedding_model, config.output_path)
+        return {}
+    best = load_face_model(config.output_path)
+    return verification_scores(best.predict(evaluation_images(val_set, cache_dir=val_cache), verbose=0), val_set.labels)
@@ -0,0 +1,139 @@
+"""
+QR code image rendering.
+
+qrcode is pure Python and holds the GIL while it encodes, so the rotation
+scheduler renders through the QR process pool (see executor.py) instead of
+on the event loop or an API worker thread.
+
+Three output formats are supported:
+
+- "png": base64 PNG, for clients that just show an <img>;
+- "svg": SVG markup, one path, scales to any projector without blur;
+- "matrix": the modules as rows of '0'/'1' without the quiet zone, for
+  clients that draw the code themselves (the cheapest to produce).
+
+Encoding the same token again is wasted work, so renders are kept in a
+small LRU cache keyed by (token, format) in the calling process.
+"""
+import base64
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+import qrcode
+
+from app.core.config import settings
+
+QR_FORMATS = ("png", "svg", "matrix")
+BOX_SIZE = 10
+BORDER = 5
+
+
+def _make_qr(data: str, border: int = BORDER) -> qrcode.QRCode:
+    qr = qrcode.QRCode(version=1, box_size=BOX_SIZE, border=border)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+def qr_version(data: str) -> int:
+    """The smallest QR version (1-40) that holds the text."""
+    return _make_qr(data).version
+
+def qr_matrix(data: str) -> List[List[bool]]:
+    """The dark (True) and light modules of the code, without the quiet zone."""
+    return _make_qr(data, border=0).get_matrix()
+
+def render_qr_png(data: str) -> str:
+    """Render text as a base64 PNG QR code"""
+    img = _make_qr(data).make_image(fill_color="black", back_color="white")
+    buffered = BytesIO()
+    img.save(buffered, format="PNG")
+    return base64.b64encode(buffered.getvalue()).decode('utf-8')
+
+def render_qr_matrix(data: str) -> str:
+    """Render text as rows of '0' (light) and '1' (dark) modules separated by newlines"""
+    return "\n".join("".join("1" if dark else "0" for dark in row) for row in qr_matrix(data))
+
+def render_qr_svg(data: str) -> str:
+    """
+    Render text as an SVG QR code.
+
+    Each horizontal run of dark modules becomes one subpath of a single
+    <path>, in module units; the viewBox includes the quiet zone.
+    """
+    matrix = qr_matrix(data)
+    size = len(matrix) + 2 * BORDER
+    parts = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < len(row):
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < len(row) and row[x]:
+                x += 1
+            parts.append(f"M{start + BORDER} {y + BORDER}h{x - start}v1h-{x - start}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * BOX_SIZE}" height="{size * BOX_SIZE}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(parts)}" fill="#000"/></svg>'
+    )
+
+_RENDERERS = {
+    "png": render_qr_png,
+    "svg": render_qr_svg,
+    "matrix": render_qr_matrix,
+}
+
+def render_qr(data: str, fmt: str = "png") -> str:
+    """Render text in one of QR_FORMATS"""
+    try:
+        renderer = _RENDERERS[fmt]
+    except KeyError:
+        raise ValueError(f"Unknown QR format '{fmt}', expected one of {', '.join(QR_FORMATS)}")
+    return renderer(data)
+
+
+class QrRenderCache:
+    """Thread-safe LRU cache of rendered codes keyed by (token, format)."""
+
+    def __init__(self, max_entries: Optional[int] = None):
+        self.max_entries = settings.QR_RENDER_CACHE_SIZE if max_entries is None else max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, token: str, fmt: str = "png") -> Optional[str]:
+        with self._lock:
+            rendered = self._entries.get((token, fmt))
+            if rendered is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((token, fmt))
+            self.hits += 1
+            return rendered
+
+    def put(self, token: str, fmt: str, rendered: str) -> None:
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[(token, fmt)] = rendered
+            self._entries.move_to_end((token, fmt))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = 0
+
+
+# Shared instance
+render_cache = QrRenderCache()
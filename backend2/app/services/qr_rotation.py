@@ -0,0 +1,219 @@
+"""
+Background rotation of session QR codes for projector screens.
+
+Screens join a per-session Socket.IO room instead of polling. Once per
+rotation window the scheduler:
+
+1. pushes back, in one UPDATE, the expiry of sessions shown on a screen
+   here (each session is written at most once a minute);
+2. expires, in one UPDATE, every active session whose QR code ran out;
+3. checks, in one SELECT, which watched sessions are still active;
+4. renders the new signed code of each of them, once per format its
+   screens asked for, in the QR process pool and pushes it to the
+   session's room for that format.
+
+Signed tokens are derived from the clock (see qr_tokens.QrTokenSigner), so
+rotating writes nothing and every worker pushes the same code.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import or_, update
+from sqlalchemy.orm import Session as DBSession
+
+from app.database import SessionLocal
+from app.models.session import QRCodeStatus, Session
+from app.services.executor import run_in_db_executor, run_in_qr_executor
+from app.services.metrics import metrics
+from app.services.qr_rendering import render_cache, render_qr
+from app.services.qr_tokens import qr_signer
+
+logger = logging.getLogger(__name__)
+
+# Displayed sessions are kept valid this far ahead, renewed when under half is left
+WATCHED_EXPIRY = timedelta(minutes=2)
+
+
+def qr_room(session_id: int, fmt: str = "png") -> str:
+    return f"session_qr_{session_id}_{fmt}"
+
+def with_new_session(func: Callable, *args):
+    """Run a query function with its own database session (for the DB executor)."""
+    db = SessionLocal()
+    try:
+        return func(db, *args)
+    finally:
+        db.close()
+
+def keep_alive(db: DBSession, session_ids: List[int]) -> int:
+    """
+    Extend the expiry of displayed sessions of today in a single UPDATE.
+
+    A session shown on a projector keeps rotating past its original expiry;
+    as soon as no screen shows it, it runs out within WATCHED_EXPIRY.
+    """
+    if not session_ids:
+        return 0
+    now = datetime.utcnow()
+    result = db.execute(
+        update(Session)
+        .where(
+            Session.session_id.in_(session_ids),
+            Session.qr_status == QRCodeStatus.ACTIVE,
+            Session.session_date >= now.date(),
+            or_(Session.qr_expires_at.is_(None), Session.qr_expires_at < now + WATCHED_EXPIRY / 2)
+        )
+        .values(qr_expires_at=now + WATCHED_EXPIRY)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount or 0
+
+def expire_sessions(db: DBSession) -> int:
+    """
+    Mark every run-out QR code, and every session of an earlier day, EXPIRED in a single UPDATE.
+
+    Returns:
+        Number of sessions expired
+    """
+    # Session dates are compared in UTC like the expiry, whatever the server's timezone
+    now = datetime.utcnow()
+    result = db.execute(
+        update(Session)
+        .where(
+            Session.qr_status == QRCodeStatus.ACTIVE,
+            or_(Session.qr_expires_at < now, Session.session_date < now.date())
+        )
+        .values(qr_status=QRCodeStatus.EXPIRED)
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount or 0
+
+def active_session_ids(db: DBSession, session_ids: List[int]) -> Set[int]:
+    """Which of the given sessions are still open (one indexed SELECT)."""
+    if not session_ids:
+        return set()
+    rows = db.query(Session.session_id).filter(
+        Session.session_id.in_(session_ids),
+        Session.qr_status == QRCodeStatus.ACTIVE
+    ).all()
+    return {row.session_id for row in rows}
+
+def rotation_queries(db: DBSession, watched: List[int]) -> Tuple[int, Set[int]]:
+    """The database work of one rotation; returns (sessions expired, watched sessions still active)."""
+    keep_alive(db, watched)
+    return expire_sessions(db), active_session_ids(db, watched)
+
+
+class QrRotationScheduler:
+    """Tracks which screens watch which session and pushes each new code to them."""
+
+    def __init__(self):
+        self._emit: Optional[Callable[..., Awaitable]] = None
+        # session_id -> {sid: format}
+        self._watchers: Dict[int, Dict[str, str]] = {}
+
+    def bind(self, emit: Callable[..., Awaitable]) -> None:
+        """Use the Socket.IO server's emit to push codes."""
+        self._emit = emit
+
+    def watch(self, sid: str, session_id: int, fmt: str = "png") -> None:
+        self._watchers.setdefault(session_id, {})[sid] = fmt
+
+    def unwatch(self, sid: str, session_id: int) -> Optional[str]:
+        """Stop pushing a session to a screen; returns the format it watched, if any."""
+        watchers = self._watchers.get(session_id)
+        if watchers is None:
+            return None
+        fmt = watchers.pop(sid, None)
+        if not watchers:
+            del self._watchers[session_id]
+        return fmt
+
+    def forget(self, sid: str) -> None:
+        """Drop a disconnected screen from every session it watched."""
+        for session_id in [s for s, watchers in self._watchers.items() if sid in watchers]:
+            self.unwatch(sid, session_id)
+
+    @property
+    def watched_sessions(self) -> List[int]:
+        return list(self._watchers)
+
+    def _formats(self, session_id: int) -> Set[str]:
+        return set(self._watchers.get(session_id, {}).values())
+
+    async def current_payload(self, session_id: int, fmt: str = "png") -> dict:
+        """
+        The code of the current window, rendered off the event loop.
+
+        Every screen and API poll of a session within one window shares the
+        same token, so each (token, format) is rendered once per process.
+        """
+        window = qr_signer.window()
+        token = qr_signer.issue(session_id)
+        qr_code = render_cache.get(token, fmt)
+        if qr_code is None:
+            qr_code = await run_in_qr_executor(render_qr, token, fmt)
+            render_cache.put(token, fmt, qr_code)
+        return {
+            'session_id': session_id,
+            'token': token,
+            'format': fmt,
+            'qr_code': qr_code,
+            'rotates_at': datetime.utcfromtimestamp(qr_signer.window_end(window)).isoformat(),
+            'rotation_seconds': qr_signer.rotation_seconds
+        }
+
+    async def _push(self, session_id: int, fmt: str) -> None:
+        payload = await self.current_payload(session_id, fmt)
+        await self._emit('session_qr', payload, room=qr_room(session_id, fmt))
+
+    async def tick(self) -> None:
+        """Expire run-out sessions, then push a fresh code to every watched active session."""
+        watched = self.watched_sessions
+        expired, active = await run_in_db_executor(with_new_session, rotation_queries, watched)
+        if expired:
+            logger.info(f"Expired QR codes of {expired} sessions")
+            metrics.increment('qr_rotation.expired', expired)
+        if not watched or self._emit is None:
+            return
+
+        for session_id in watched:
+            if session_id not in active:
+                for fmt in self._formats(session_id):
+                    await self._emit('session_qr_closed', {'session_id': session_id}, room=qr_room(session_id, fmt))
+                self._watchers.pop(session_id, None)
+
+        with metrics.timer('qr_rotation.push_seconds'):
+            results = await asyncio.gather(
+                *(
+                    self._push(session_id, fmt)
+                    for session_id in watched if session_id in active
+                    for fmt in self._formats(session_id)
+                ),
+                return_exceptions=True
+            )
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Failed to push a rotated QR code: {result}")
+
+    async def run(self) -> None:
+        """Rotate at every window boundary until cancelled."""
+        logger.info(f"QR rotation every {qr_signer.rotation_seconds}s")
+        while True:
+            window = qr_signer.window()
+            try:
+                await self.tick()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"QR rotation failed: {str(e)}")
+            await asyncio.sleep(max(0.05, qr_signer.window_end(window) - time.time()))
+
+
+# Shared instance
+qr_rotation = QrRotationScheduler()
@@ -0,0 +1,254 @@
+"""
+Resolution of scanned attendance QR tokens to sessions.
+
+Sessions store the random token of their current QR code in the indexed
+sessions.qr_token column. Scans are resolved through an in-memory map of
+active tokens, falling back to one indexed lookup that reads only the
+session id and expiry (never the QR image). Entries are re-checked against
+the database after QR_TOKEN_CACHE_SECONDS, so a code refreshed or ended by
+another worker stops resolving here within that time.
+
+Rotating codes use stateless signed tokens instead (QrTokenSigner): an
+HMAC over the session id and the current time window, so issuing a new
+code every few seconds writes nothing and verifying a scan is a CPU check.
+"""
+import base64
+import binascii
+import hashlib
+import hmac
+import logging
+import re
+import secrets
+import struct
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple, Union
+
+from sqlalchemy.orm import Session as DBSession
+
+from app.core.config import settings
+from app.models.session import QRCodeStatus, Session
+
+logger = logging.getLogger(__name__)
+
+# Scanned text longer than this is not one of our codes
+MAX_SCAN_LENGTH = 512
+# The token of a code printed before the compact format: the repr of
+# {'session_id': ..., 'token': token_urlsafe(32), 'expires_at': ...}
+_LEGACY_PAYLOAD = re.compile(
+    r"\{'session_id': \d+, 'token': '([A-Za-z0-9_-]{1,128})', 'expires_at': '[0-9T:.+-]{1,40}'\}"
+)
+
+
+def extract_qr_token(scanned: str) -> Optional[str]:
+    """
+    The token inside the text of a scanned QR code.
+
+    Current codes hold the bare token; codes printed before the compact
+    format hold the repr of a dict with a 'token' key, which is matched
+    exactly rather than evaluated, since the text comes from the client.
+    """
+    scanned = (scanned or "").strip()
+    if len(scanned) > MAX_SCAN_LENGTH:
+        return None
+    if scanned.startswith("{"):
+        match = _LEGACY_PAYLOAD.fullmatch(scanned)
+        return match.group(1) if match else None
+    return scanned or None
+
+
+class ActiveQrTokens:
+    """
+    Process-local map of active QR tokens to (session_id, expiry).
+
+    Also remembers sessions ended here for as long as their last signed
+    token could still verify, so a screenshot of the projector scanned
+    right after the end is refused.
+    """
+
+    def __init__(self, cache_seconds: Optional[float] = None, ended_seconds: Optional[float] = None):
+        self.cache_seconds = settings.QR_TOKEN_CACHE_SECONDS if cache_seconds is None else cache_seconds
+        self.ended_seconds = (
+            (settings.QR_TOKEN_SKEW_WINDOWS + 2) * settings.QR_ROTATION_SECONDS
+            if ended_seconds is None else ended_seconds
+        )
+        self._lock = threading.Lock()
+        # token -> (session_id, expires_at (naive UTC), cached_at (monotonic))
+        self._tokens: Dict[str, Tuple[int, datetime, float]] = {}
+        # session_id -> monotonic time until which its signed tokens are refused
+        self._ended: Dict[int, float] = {}
+
+    def register(self, token: str, session_id: int, expires_at: datetime) -> None:
+        """Remember a freshly issued token and forget the session's previous one."""
+        with self._lock:
+            self._drop_session(session_id)
+            self._ended.pop(session_id, None)
+            self._tokens[token] = (session_id, expires_at, time.monotonic())
+
+    def revoke_session(self, session_id: int) -> None:
+        """Forget an ended session's token and refuse its signed tokens still in their window."""
+        now = time.monotonic()
+        with self._lock:
+            self._drop_session(session_id)
+            for ended in [s for s, until in self._ended.items() if until <= now]:
+                del self._ended[ended]
+            self._ended[session_id] = now + self.ended_seconds
+
+    def is_ended(self, session_id: int) -> bool:
+        """True for a session ended here whose signed tokens could still verify."""
+        with self._lock:
+            until = self._ended.get(session_id)
+        return until is not None and time.monotonic() < until
+
+    def _drop_session(self, session_id: int) -> None:
+        for token in [t for t, entry in self._tokens.items() if entry[0] == session_id]:
+            del self._tokens[token]
+
+    def resolve(self, db: DBSession, token: Optional[str]) -> Optional[int]:
+        """
+        The session id an active, unexpired token belongs to.
+
+        Returns:
+            Session id, or None for unknown, replaced or expired tokens
+        """
+        if not token:
+            return None
+        now = datetime.utcnow()
+        with self._lock:
+            entry = self._tokens.get(token)
+        if entry is not None:
+            session_id, expires_at, cached_at = entry
+            if expires_at <= now:
+                with self._lock:
+                    self._tokens.pop(token, None)
+                return None
+            if time.monotonic() - cached_at < self.cache_seconds:
+                return session_id
+
+        row = db.query(Session.session_id, Session.qr_expires_at).filter(
+            Session.qr_token == token,
+            Session.qr_status == QRCodeStatus.ACTIVE,
+            Session.qr_expires_at > now
+        ).first()
+        if row is None:
+            with self._lock:
+                self._tokens.pop(token, None)
+            return None
+
+        expires_at = row.qr_expires_at
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+        with self._lock:
+            self._tokens[token] = (row.session_id, expires_at, time.monotonic())
+        return row.session_id
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tokens.clear()
+            self._ended.clear()
+
+
+SIGNED_PREFIX = "S-"
+_SIGNED_HEADER = struct.Struct(">II")  # session_id, window
+
+
+def _b32encode(raw: bytes) -> str:
+    return base64.b32encode(raw).decode("ascii").rstrip("=")
+
+def _b32decode(text: str) -> bytes:
+    return base64.b32decode(text + "=" * (-len(text) % 8))
+
+def new_random_token() -> str:
+    """
+    Random token for a long-lived QR code: 160 bits as unpadded base32.
+
+    Upper-case base32 fits the QR alphanumeric mode, so the 32-character
+    token encodes in a version 2 code instead of the version 6+ that the
+    old dict payload with a token_urlsafe token needed.
+    """
+    return _b32encode(secrets.token_bytes(20))
+
+
+class QrTokenSigner:
+    """
+    Stateless rotating QR tokens: "S-" + base32(session_id, window, mac).
+
+    The window is the number of rotation periods since the epoch, and the
+    MAC a truncated HMAC-SHA256 over the packed session id and window,
+    keyed from SECRET_KEY. The whole token is 31 QR-alphanumeric characters
+    (a version 2 code). It verifies during its own window and the next
+    `skew_windows` windows, which covers the time a student needs to scan
+    plus clock skew between workers; a screenshot shared later than that
+    is rejected. No database row is read or written.
+
+    Ending a session does not invalidate its tokens by itself: the worker
+    that ended it refuses them (ActiveQrTokens.is_ended), but other workers
+    accept a screenshot until its window runs out, at most skew_windows + 1
+    rotation periods after the end.
+    """
+
+    MAC_BYTES = 10
+
+    def __init__(
+        self,
+        secret_key: Optional[Union[str, bytes]] = None,
+        rotation_seconds: Optional[int] = None,
+        skew_windows: Optional[int] = None
+    ):
+        secret = secret_key if secret_key is not None else settings.SECRET_KEY
+        if isinstance(secret, str):
+            secret = secret.encode("utf-8")
+        # Separate key so QR MACs can never be confused with other uses of SECRET_KEY
+        self._key = hmac.new(secret, b"attendify-qr-token-v1", hashlib.sha256).digest()
+        self.rotation_seconds = rotation_seconds or settings.QR_ROTATION_SECONDS
+        self.skew_windows = settings.QR_TOKEN_SKEW_WINDOWS if skew_windows is None else skew_windows
+
+    def window(self, now: Optional[float] = None) -> int:
+        return int((time.time() if now is None else now) // self.rotation_seconds)
+
+    def window_end(self, window: int) -> float:
+        """Unix time at which a window's token stops being the current one."""
+        return (window + 1) * self.rotation_seconds
+
+    def _mac(self, header: bytes) -> bytes:
+        return hmac.new(self._key, header, hashlib.sha256).digest()[:self.MAC_BYTES]
+
+    def issue(self, session_id: int, now: Optional[float] = None) -> str:
+        """The token to display for a session right now."""
+        header = _SIGNED_HEADER.pack(session_id, self.window(now))
+        return SIGNED_PREFIX + _b32encode(header + self._mac(header))
+
+    @staticmethod
+    def is_signed(token: Optional[str]) -> bool:
+        return bool(token) and token.startswith(SIGNED_PREFIX)
+
+    def verify(self, token: Optional[str], now: Optional[float] = None) -> Optional[int]:
+        """
+        The session id of a valid, current token.
+
+        Returns:
+            Session id, or None for malformed, forged or stale tokens
+        """
+        if not self.is_signed(token):
+            return None
+        try:
+            raw = _b32decode(token[len(SIGNED_PREFIX):])
+        except (binascii.Error, ValueError):
+            return None
+        if len(raw) != _SIGNED_HEADER.size + self.MAC_BYTES:
+            return None
+        header, mac = raw[:_SIGNED_HEADER.size], raw[_SIGNED_HEADER.size:]
+        session_id, window = _SIGNED_HEADER.unpack(header)
+        age = self.window(now) - window
+        # One window of tolerance for a clock running ahead of ours
+        if age < -1 or age > self.skew_windows:
+            return None
+        if not hmac.compare_digest(mac, self._mac(header)):
+            return None
+        return session_id
+
+
+# Shared instances
+active_qr_tokens = ActiveQrTokens()
+qr_signer = QrTokenSigner()
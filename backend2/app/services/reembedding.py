@@ -0,0 +1,142 @@
+"""
+Resumable re-embedding of stored enrollment crops with a new model.
+
+Users are walked in user_id order in small batches. Every batch is
+committed and then recorded in a JSON checkpoint, so an interrupted job
+resumes after the last committed user, and the job sleeps between
+batches so it never competes with live attendance for CPU or the
+database. A pass that reaches the end starts over once for users that
+enrolled again (with the old model) behind the checkpoint.
+"""
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable, Optional
+
+from sqlalchemy.orm import Session
+
+from app.models.user import User
+from app.services.embedding_codec import encode_embedding
+from app.services.embedding_rollout import EmbeddingRollout, decode_face_crop
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class ReembedCheckpoint:
+    target_version: int
+    last_user_id: int = 0
+    reembedded: int = 0
+    failed: int = 0
+
+    @classmethod
+    def load(cls, path: str, target_version: int) -> "ReembedCheckpoint":
+        """Resume from `path` if it belongs to the same target version, else start over."""
+        if Path(path).exists():
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("target_version") == target_version:
+                return cls(**data)
+            logger.info(f"Ignoring checkpoint for model v{data.get('target_version')}")
+        return cls(target_version=target_version)
+
+    def save(self, path: str) -> None:
+        # Write then rename so a crash never leaves a truncated checkpoint
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(asdict(self), f)
+        os.replace(tmp_path, path)
+
+
+def reembed_batch(db: Session, service, rollout: EmbeddingRollout, checkpoint: ReembedCheckpoint, batch_size: int) -> int:
+    """
+    Re-embed the next batch of users after the checkpoint and commit it.
+
+    Returns:
+        Number of users read (0 when the pass is finished)
+    """
+    version = checkpoint.target_version
+    rows = db.query(User.user_id, User.face_crop)\
+        .filter(rollout.needs_reembedding(version), User.user_id > checkpoint.last_user_id)\
+        .order_by(User.user_id)\
+        .limit(batch_size)\
+        .all()
+    if not rows:
+        return 0
+
+    updates, user_ids, crops = [], [], []
+    for row in rows:
+        crop = decode_face_crop(row.face_crop)
+        if crop is None:
+            # Dropped so it does not block the rollout; the user shows up
+            # under missing_crops in the rollout status and has to enroll again
+            logger.error(f"Unreadable enrollment crop for user {row.user_id}, dropping it")
+            updates.append({"user_id": row.user_id, "face_crop": None})
+            continue
+        user_ids.append(row.user_id)
+        crops.append(crop)
+
+    if crops:
+        embeddings = service.embed_faces(crops)
+        updates.extend(
+            {
+                "user_id": user_id,
+                "face_embedding_next": encode_embedding(embedding, model_version=version),
+                "face_embedding_next_version": version
+            }
+            for user_id, embedding in zip(user_ids, embeddings)
+        )
+    db.bulk_update_mappings(User, updates)
+    db.commit()
+
+    checkpoint.last_user_id = rows[-1].user_id
+    checkpoint.reembedded += len(crops)
+    checkpoint.failed += len(rows) - len(crops)
+    return len(rows)
+
+def reembed_all(
+    db: Session,
+    service,
+    rollout: EmbeddingRollout,
+    checkpoint_path: str,
+    batch_size: int = 64,
+    sleep_seconds: float = 0.5,
+    max_batches: Optional[int] = None,
+    progress: Optional[Callable[[ReembedCheckpoint], None]] = None
+) -> ReembedCheckpoint:
+    """
+    Re-embed every stored crop with `service` (loaded with the next model).
+
+    Args:
+        db: Database session
+        service: FaceRecognitionService for rollout.next_version
+        rollout: Rollout state; its next_version is the target
+        checkpoint_path: JSON checkpoint, created or resumed
+        batch_size: Users per batch and per transaction
+        sleep_seconds: Pause between batches (throttle)
+        max_batches: Stop after this many batches (None runs to completion)
+        progress: Called with the checkpoint after every batch
+    """
+    checkpoint = ReembedCheckpoint.load(checkpoint_path, rollout.next_version)
+    batches = 0
+    restarted = False
+    while max_batches is None or batches < max_batches:
+        read = reembed_batch(db, service, rollout, checkpoint, batch_size)
+        if read == 0:
+            # Users re-enrolled behind the checkpoint need one more pass
+            if restarted or checkpoint.last_user_id == 0 or rollout.remaining(db) == 0:
+                break
+            checkpoint.last_user_id = 0
+            restarted = True
+            continue
+        batches += 1
+        checkpoint.save(checkpoint_path)
+        if progress:
+            progress(checkpoint)
+        if sleep_seconds > 0:
+            time.sleep(sleep_seconds)
+    checkpoint.save(checkpoint_path)
+    return checkpoint
@@ -0,0 +1,166 @@
+"""
+Match threshold calibration from labelled embeddings.
+
+Every genuine (same person) and impostor (different people) pair distance
+is computed in blocked matrix form: one block_size x block_size tile of the
+distance matrix at a time, reduced straight into fixed-width histograms.
+Memory stays bounded by the tile size however many identities there are,
+and the ROC/FAR/FRR curves are read off the cumulative histograms.
+"""
+import logging
+from dataclasses import dataclass
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class DistanceHistograms:
+    """Pair counts per distance bin; bin i holds distances in [edges[i], edges[i + 1])."""
+    edges: np.ndarray
+    genuine: np.ndarray
+    impostor: np.ndarray
+
+
+@dataclass
+class RocCurve:
+    """
+    Error rates of the rule "match if distance < threshold" at every bin edge.
+
+    far[i] is the share of impostor pairs accepted and frr[i] the share of
+    genuine pairs rejected at thresholds[i].
+    """
+    thresholds: np.ndarray
+    far: np.ndarray
+    frr: np.ndarray
+    genuine_pairs: int
+    impostor_pairs: int
+
+    def equal_error_rate(self) -> Tuple[float, float]:
+        """Returns (error rate, threshold) where FAR and FRR cross."""
+        i = int(np.argmin(np.abs(self.far - self.frr)))
+        return float((self.far[i] + self.frr[i]) / 2.0), float(self.thresholds[i])
+
+    def at_far(self, target_far: float) -> Tuple[float, float, float]:
+        """
+        The most lenient threshold whose FAR does not exceed the target.
+
+        Returns:
+            Tuple of (threshold, FAR, FRR)
+
+        Raises:
+            ValueError: if even the strictest threshold accepts more impostors
+        """
+        allowed = np.nonzero(self.far <= target_far)[0]
+        if not len(allowed):
+            raise ValueError(
+                f"No threshold reaches a FAR of {target_far:g}; the strictest one "
+                f"({self.thresholds[0]:.4f}) has a FAR of {self.far[0]:g}"
+            )
+        i = int(allowed[-1])
+        return float(self.thresholds[i]), float(self.far[i]), float(self.frr[i])
+
+    def rows(self) -> List[Tuple[float, float, float]]:
+        return list(zip(self.thresholds.tolist(), self.far.tolist(), self.frr.tolist()))
+
+
+def distance_histograms(
+    embeddings: np.ndarray,
+    labels: np.ndarray,
+    block_size: int = 4096,
+    bins: int = 4000,
+    max_distance: Optional[float] = None,
+    progress: Optional[Callable[[int, int], None]] = None
+) -> DistanceHistograms:
+    """
+    Histogram the distances of all N*(N-1)/2 embedding pairs, split by genuine/impostor.
+
+    Uses ||a - b||^2 = ||a||^2 + ||b||^2 - 2 a.b, so each tile is one
+    matrix product. Impostor counts are all counts of a tile minus its
+    genuine counts, which avoids masking the (mostly impostor) tile.
+
+    Args:
+        embeddings: (N, D) embeddings
+        labels: (N,) identity of each embedding
+        block_size: Rows per tile; peak memory is about 12 * block_size^2 bytes
+        bins: Histogram resolution between 0 and max_distance
+        max_distance: Upper histogram edge (twice the largest norm by default,
+            2.0 for L2-normalized embeddings)
+        progress: Called with (row blocks done, row blocks total)
+    """
+    x = np.ascontiguousarray(embeddings, dtype=np.float32)
+    labels = np.asarray(labels)
+    count = len(x)
+    sq_norms = np.einsum('ij,ij->i', x, x)
+    if max_distance is None:
+        max_distance = 2.0 * float(np.sqrt(sq_norms.max())) if count else 2.0
+    scale = bins / max_distance
+
+    genuine = np.zeros(bins, dtype=np.int64)
+    impostor = np.zeros(bins, dtype=np.int64)
+    blocks = range(0, count, block_size)
+    for done, i0 in enumerate(blocks, start=1):
+        i1 = min(i0 + block_size, count)
+        for j0 in range(i0, count, block_size):
+            j1 = min(j0 + block_size, count)
+            tile = x[i0:i1] @ x[j0:j1].T
+            tile *= -2.0
+            tile += sq_norms[i0:i1, np.newaxis]
+            tile += sq_norms[np.newaxis, j0:j1]
+            np.maximum(tile, 0.0, out=tile)
+            np.sqrt(tile, out=tile)
+            tile *= scale
+            bin_ids = np.minimum(tile.astype(np.int32), bins - 1)
+            same = labels[i0:i1, np.newaxis] == labels[np.newaxis, j0:j1]
+            if i0 == j0:
+                # Diagonal tile: each unordered pair once, no self-pairs
+                upper = np.triu_indices(i1 - i0, k=1)
+                bin_ids, same = bin_ids[upper], same[upper]
+            all_counts = np.bincount(bin_ids.ravel(), minlength=bins)
+            genuine_counts = np.bincount(bin_ids[same], minlength=bins)
+            genuine += genuine_counts
+            impostor += all_counts - genuine_counts
+        if progress is not None:
+            progress(done, len(blocks))
+
+    return DistanceHistograms(np.linspace(0.0, max_distance, bins + 1), genuine, impostor)
+
+
+def roc_curve(histograms: DistanceHistograms) -> RocCurve:
+    """FAR/FRR at every bin edge from the cumulative pair counts."""
+    genuine_pairs = int(histograms.genuine.sum())
+    impostor_pairs = int(histograms.impostor.sum())
+    if genuine_pairs == 0 or impostor_pairs == 0:
+        raise ValueError("Calibration needs both genuine and impostor pairs (several photos of several people)")
+    accepted_genuine = np.cumsum(histograms.genuine)
+    accepted_impostor = np.cumsum(histograms.impostor)
+    return RocCurve(
+        thresholds=histograms.edges[1:],
+        far=accepted_impostor / impostor_pairs,
+        frr=1.0 - accepted_genuine / genuine_pairs,
+        genuine_pairs=genuine_pairs,
+        impostor_pairs=impostor_pairs
+    )
+
+
+def recommend_threshold(roc: RocCurve, target_far: float) -> Dict[str, float]:
+    """
+    Threshold for a target false accept rate, with the figures to persist.
+
+    The FAR is per comparison; a student is compared with every classmate,
+    so the chance of marking a wrong student grows with the roster size.
+    """
+    threshold, far, frr = roc.at_far(target_far)
+    eer, eer_threshold = roc.equal_error_rate()
+    return {
+        "threshold": threshold,
+        "target_far": target_far,
+        "far": far,
+        "frr": frr,
+        "eer": eer,
+        "eer_threshold": eer_threshold,
+        "genuine_pairs": roc.genuine_pairs,
+        "impostor_pairs": roc.impostor_pairs,
+    }
@@ -1,24 +1,163 @@
-from app.services.face_recognition_service import FaceRecognitionService
+from app.crud.session import end_session
+from app.services.model_registry import model_registry
+from app.services.attendance_buffer import attendance_buffer
+from app.services.embedding_index import embedding_index
+from app.services.executor import run_in_db_executor, run_in_face_executor
+from app.services.frame_gate import frame_gate, frame_signature
+from app.services.face_tracker import get_face_tracker
+from app.services.match_threshold import match_thresholds
+from app.services.metrics import metrics, timed_handler
+from app.socketio.frame_transport import get_frame_format
+from app.core.config import settings
 from app.database import SessionLocal
-from app.models.user import User
+from app.models.user import User, UserRole
 from app.models.classroom import Class
 from app.models.session import Session
 from app.models.attendance import Attendance
 from app.models.class_user import ClassUser
 from sqlalchemy.orm import Session as DBSession
-import json
 import logging
 from datetime import datetime
+from typing import List, Optional, Set, Tuple
 import numpy as np
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize face recognition service
-face_service = FaceRecognitionService()
+def _get_session(db: DBSession, session_id: int):
+    return db.query(Session).filter(Session.session_id == session_id).first()
+
+def _record_attendance(db: DBSession, session_id: int, user_id: int) -> bool:
+    """Mark a student present; returns False if the student was already marked."""
+    return bool(attendance_buffer.mark(db, session_id, [user_id]))
+
+def _record_attendance_many(db: DBSession, session_id: int, user_ids: List[int]) -> Set[int]:
+    """Mark several students present at once; returns the newly marked ids."""
+    return attendance_buffer.mark(db, session_id, user_ids)
+
+def _end_session(db: DBSession, session_id: int) -> Optional[Tuple[int, int]]:
+    """
+    End a session like the REST API does (buffered marks flushed, QR code
+    expired and revoked).
+
+    Returns:
+        (marked students, class students), or None if the session does not exist
+    """
+    session = end_session(db, session_id)
+    if not session:
+        return None
+    total_students = db.query(User)\
+        .join(ClassUser, ClassUser.user_id == User.user_id)\
+        .filter(
+            ClassUser.class_id == session.class_id,
+            User.role == UserRole.STUDENT
+        ).count()
+    marked_attendance = db.query(Attendance).filter(
+        Attendance.session_id == session_id
+    ).count()
+    return marked_attendance, total_students
+
+def _skip_tracked_frame(sid, session, signature) -> None:
+    """Count a frame without usable faces, so a face seen again after it is re-identified."""
+    if settings.FACE_TRACKING_ENABLED:
+        get_face_tracker(sid, session.session_id).update(np.empty((0, 4)), signature)
+
+async def _identify_faces(sid, face_service, db: DBSession, session, faces, boxes, signature=None):
+    """
+    Identify the faces of a frame, reusing the identity of tracked faces.
+
+    Only faces on new or unconfident tracks go through the embedding model,
+    so a student standing in front of the kiosk costs one inference instead
+    of one per frame. Those faces are quality checked first and crops that
+    cannot match (blurred, dark, tiny, turned away) are not embedded at all.
+
+    Returns:
+        Tuple containing:
+        - (user_id, name, distance) per face (None if embedding failed)
+        - Quality issue per face (None for usable or already identified faces)
+    """
+    if settings.FACE_TRACKING_ENABLED:
+        tracker = get_face_tracker(sid, session.session_id)
+        tracks = tracker.update(boxes, signature)
+        pending = [i for i, track in enumerate(tracks) if tracker.needs_embedding(track)]
+    else:
+        tracker, tracks, pending = None, None, list(range(len(faces)))
+
+    matches: List[Tuple[Optional[int], Optional[str], float]] = [(None, None, float('inf'))] * len(faces)
+    issues: List[Optional[dict]] = [None] * len(faces)
+    if tracker is not None:
+        metrics.increment('face_tracker.reused', len(faces) - len(pending))
+        for i, track in enumerate(tracks):
+            if i not in pending:
+                matches[i] = (track.user_id, track.name, track.distance)
+
+    if pending:
+        for i, issue in zip(pending, await face_service.assess_faces_async([faces[i] for i in pending])):
+            issues[i] = issue
+        accepted = [i for i in pending if issues[i] is None]
+        metrics.increment('face_quality.rejected', len(pending) - len(accepted))
+        pending = accepted
+
+    if pending:
+        embeddings = await face_service.generate_embeddings_async([faces[i] for i in pending])
+        if embeddings is None:
+            return None, issues
+        fresh = await run_in_db_executor(embedding_index.match_many, db, session.class_id, embeddings)
+        for i, (user_id, name, distance) in zip(pending, fresh):
+            matches[i] = (user_id, name, distance)
+            if tracker is not None:
+                tracker.assign(tracks[i], user_id, name, distance)
+    return matches, issues
 
 def register_attendance_handlers(sio):
+    async def process_crowd_frame(sid, db, session, image_data, signature=None):
+        """Identify every face of a frame and mark all confident matches at once."""
+        face_service = await model_registry.get_face_service_async()
+        faces, boxes, visualization, error = await face_service.detect_faces_async(
+            image_data, get_frame_format(sid).visualization, settings.CROWD_MAX_FACES
+        )
+        if error:
+            _skip_tracked_frame(sid, session, signature)
+            payload = {'message': error, 'visualization': visualization}
+            frame_gate.record(sid, 'attendance_error', payload)
+            await sio.emit('attendance_error', payload, room=sid)
+            return
+
+        matches, issues = await _identify_faces(sid, face_service, db, session, faces, boxes, signature)
+        if matches is None:
+            await sio.emit('attendance_error', {
+                'message': 'Failed to generate face embeddings',
+                'visualization': visualization
+            }, room=sid)
+            return
+
+        # Keep the closest face per student so one person cannot be counted twice
+        best = {}
+        threshold = match_thresholds.get()
+        for user_id, name, distance in matches:
+            if user_id is not None and distance < threshold:
+                if user_id not in best or distance < best[user_id][1]:
+                    best[user_id] = (name, distance)
+
+        newly_marked = await run_in_db_executor(
+            _record_attendance_many, db, session.session_id, list(best)
+        )
+
+        payload = {
+            'faces': len(faces),
+            'marked': [best[user_id][0] for user_id in best if user_id in newly_marked],
+            'already_marked': [best[user_id][0] for user_id in best if user_id not in newly_marked],
+            'unmatched': len(faces) - len(best),
+            'rejected': [issue for issue in issues if issue is not None],
+            'visualization': visualization
+        }
+        # Only replay a result that marked nobody; after a new mark the next
+        # frame runs again and reports those students as already marked
+        if not newly_marked:
+            frame_gate.record(sid, 'attendance_batch_result', payload)
+        await sio.emit('attendance_batch_result', payload, room=sid)
+
     @sio.event
     async def start_attendance_session(sid, data):
         """Start a new attendance session."""
@@ -72,6 +211,7 @@ def register_attendance_handlers(sio):
             }, room=sid)
 
     @sio.event
+    @timed_handler
     async def process_attendance_frame(sid, data):
         """Process a frame from the camera for attendance marking."""
         try:
@@ -87,88 +227,83 @@ def register_attendance_handlers(sio):
                 image_data = data['image']
 
                 # Get session
-                session = db.query(Session).filter(Session.id == session_id).first()
+                session = await run_in_db_executor(_get_session, db, session_id)
                 if not session:
                     await sio.emit('attendance_error', {
                         'message': 'Session not found'
                     }, room=sid)
                     return
 
+                # Skip inference when the kiosk still sees the same scene
+                signature = None
+                if settings.FRAME_GATE_ENABLED:
+                    signature = await run_in_face_executor(frame_signature, image_data)
+                    cached = frame_gate.check(sid, session.session_id, signature)
+                    if cached:
+                        metrics.increment('frame_gate.skipped')
+                        await sio.emit(cached[0], cached[1], room=sid)
+                        return
+
+                # Crowd mode: identify every face in the frame
+                if data.get('mode') == 'crowd':
+                    await process_crowd_frame(sid, db, session, image_data, signature)
+                    return
+
                 # Detect face and get visualization
-                face, visualization, error = face_service.detect_face(image_data)
+                face_service = await model_registry.get_face_service_async()
+                faces, boxes, visualization, error = await face_service.detect_faces_async(
+                    image_data, get_frame_format(sid).visualization
+                )
+                if not error and len(faces) > 1:
+                    error = "Multiple faces detected. Please ensure only one face is visible"
                 if error:
+                    _skip_tracked_frame(sid, session, signature)
+                    payload = {'message': error, 'visualization': visualization}
+                    frame_gate.record(sid, 'attendance_error', payload)
+                    await sio.emit('attendance_error', payload, room=sid)
+                    return
+
+                # Find matching student (embedding only if the face is not tracked yet)
+                matches, issues = await _identify_faces(sid, face_service, db, session, faces, boxes, signature)
+                if issues[0] is not None:
                     await sio.emit('attendance_error', {
-                        'message': error,
+                        'message': issues[0]['message'],
+                        'quality': issues[0],
                         'visualization': visualization
                     }, room=sid)
                     return
-
-                # Generate embedding
-                embedding = face_service.generate_embedding(face)
-                if embedding is None:
+                if matches is None:
                     await sio.emit('attendance_error', {
                         'message': 'Failed to generate face embedding',
                         'visualization': visualization
                     }, room=sid)
                     return
-
-                # Get all students in the class with face embeddings
-                students = db.query(User).filter(
-                    User.class_id == session.class_id,
-                    User.role == 'student',
-                    User.face_embedding.isnot(None)
-                ).all()
-
-                # Find matching student
-                best_match = None
-                best_distance = float('inf')
-                for student in students:
-                    try:
-                        student_embedding = json.loads(student.face_embedding.decode('utf-8'))
-                        distance = face_service.compare_embeddings(embedding, student_embedding)
-                        if distance < best_distance:
-                            best_distance = distance
-                            best_match = student
-                    except Exception as e:
-                        logger.error(f"Error comparing embeddings for student {student.id}: {str(e)}")
-                        continue
+                best_match_id, best_match_name, best_distance = matches[0]
 
                 # Check if we found a match
-                if best_match and best_distance < 0.6:  # Threshold for face matching
-                    # Check if attendance already marked
-                    existing_attendance = db.query(Attendance).filter(
-                        Attendance.session_id == session_id,
-                        Attendance.student_id == best_match.id
-                    ).first()
-
-                    if existing_attendance:
-                        await sio.emit('attendance_already_marked', {
-                            'message': f'Attendance already marked for {best_match.name}',
+                if best_match_id is not None and best_distance < match_thresholds.get():
+                    # Mark attendance unless it is already marked
+                    marked = await run_in_db_executor(_record_attendance, db, session_id, best_match_id)
+
+                    if not marked:
+                        payload = {
+                            'message': f'Attendance already marked for {best_match_name}',
                             'visualization': visualization
-                        }, room=sid)
+                        }
+                        frame_gate.record(sid, 'attendance_already_marked', payload)
+                        await sio.emit('attendance_already_marked', payload, room=sid)
                     else:
-                        # Mark attendance
-                        attendance = Attendance(
-                            session_id=session_id,
-                            student_id=best_match.id,
-                            marked_at=datetime.utcnow()
-                        )
-                        db.add(attendance)
-                        db.commit()
-
-                        # Update student's attendance stats
-                        best_match.total_attendance += 1
-                        db.commit()
-
                         await sio.emit('attendance_marked', {
-                            'message': f'Attendance marked for {best_match.name}',
+                            'message': f'Attendance marked for {best_match_name}',
                             'visualization': visualization
                         }, room=sid)
                 else:
-                    await sio.emit('attendance_no_match', {
+                    payload = {
                         'message': 'No matching student found',
                         'visualization': visualization
-                    }, room=sid)
+                    }
+                    frame_gate.record(sid, 'attendance_no_match', payload)
+                    await sio.emit('attendance_no_match', payload, room=sid)
 
             except Exception as e:
                 logger.error(f"Error processing attendance frame: {str(e)}")
@@ -197,27 +332,15 @@ def register_attendance_handlers(sio):
             db = SessionLocal()
             try:
                 session_id = data['session_id']
-                session = db.query(Session).filter(Session.id == session_id).first()
-                
-                if not session:
+                # Attendance statistics include marks that were still buffered
+                counts = await run_in_db_executor(_end_session, db, session_id)
+
+                if counts is None:
                     await sio.emit('attendance_error', {
                         'message': 'Session not found'
                     }, room=sid)
                     return
-
-                # Update session end time
-                session.end_time = datetime.utcnow()
-                db.commit()
-
-                # Get attendance statistics
-                total_students = db.query(User).filter(
-                    User.class_id == session.class_id,
-                    User.role == 'student'
-                ).count()
-
-                marked_attendance = db.query(Attendance).filter(
-                    Attendance.session_id == session_id
-                ).count()
+                marked_attendance, total_students = counts
 
                 await sio.emit('attendance_session_ended', {
                     'message': f'Attendance session ended. {marked_attendance} out of {total_students} students marked present.',
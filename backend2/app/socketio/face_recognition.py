@@ -1,20 +1,76 @@
-from app.services.face_recognition_service import FaceRecognitionService
-from app.database import get_db
+from fastapi import HTTPException
+
+from app.auth.jwt import verify_access_token
+from app.services.model_registry import model_registry
+from app.services.embedding_index import embedding_index
+from app.services.ann_index import campus_index
+from app.services.embedding_codec import decode_embedding, embedding_model_version
+from app.services.embedding_rollout import encode_face_crop, rollout
+from app.services.match_threshold import match_thresholds
+from app.services.executor import run_in_db_executor
+from app.services.metrics import timed_handler
+from app.socketio.frame_transport import get_frame_format
+from app.database import SessionLocal
 from app.models.user import User
 from sqlalchemy.orm import Session
 import base64
 import numpy as np
-import cv2
 import logging
+from typing import List
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-face_service = FaceRecognitionService()
+def _store_embedding(user_id: int, embedding: bytes, face: np.ndarray) -> bool:
+    """Save a user's embedding and enrollment crop; returns False if the user does not exist."""
+    db: Session = SessionLocal()
+    try:
+        user = db.query(User).filter(User.user_id == user_id).first()
+        if not user:
+            return False
+
+        # The crop lets a later model re-embed this user without a new enrollment
+        model_version = embedding_model_version(embedding)
+        rollout.store(user, embedding, model_version, encode_face_crop(face))
+        db.commit()
+
+        # Rebuild the cached roster of every class this student attends
+        embedding_index.invalidate_user(db, user.user_id)
+        campus_index.upsert(user.user_id, decode_embedding(embedding), model_version)
+        return True
+    finally:
+        db.close()
+
+def _identify(embedding: bytes, limit: int) -> List[dict]:
+    """Campus-wide lookup of the closest enrolled users."""
+    db: Session = SessionLocal()
+    try:
+        candidates = campus_index.identify(db, decode_embedding(embedding), k=limit)
+        threshold = match_thresholds.get()
+        candidates = [(user_id, distance) for user_id, distance in candidates if distance < threshold]
+        if not candidates:
+            return []
+        users = {
+            row.user_id: row for row in
+            db.query(User.user_id, User.name, User.prenom, User.email)
+            .filter(User.user_id.in_([user_id for user_id, _ in candidates])).all()
+        }
+        return [
+            {
+                'user_id': user_id,
+                'name': f"{users[user_id].prenom} {users[user_id].name}",
+                'email': users[user_id].email,
+                'distance': distance
+            }
+            for user_id, distance in candidates if user_id in users
+        ]
+    finally:
+        db.close()
 
 def register_face_recognition_handlers(sio):
     @sio.event
+    @timed_handler
     async def setup_face(sid, data):
         """Handle face setup request"""
         try:
@@ -43,7 +99,10 @@ def register_face_recognition_handlers(sio):
             logger.info(f"Image data length: {len(image_data)}")
 
             # Detect face
-            face, visualization, error = face_service.detect_face(image_data)
+            face_service = await model_registry.get_face_service_async()
+            face, visualization, error = await face_service.detect_face_async(
+                image_data, get_frame_format(sid).visualization
+            )
             if error:
                 logger.error(f"Face detection error: {error}")
                 await sio.emit('face_setup_error', {
@@ -62,8 +121,19 @@ def register_face_recognition_handlers(sio):
             logger.info("Face detected successfully")
             logger.info(f"Face image shape: {face.shape}")
 
+            # Reject crops that would enroll a poor reference embedding
+            issue = (await face_service.assess_faces_async([face]))[0]
+            if issue is not None:
+                logger.info(f"Face rejected by quality check: {issue['reason']}")
+                await sio.emit('face_setup_error', {
+                    'message': issue['message'],
+                    'quality': issue,
+                    'visualization': visualization
+                }, room=sid)
+                return
+
             # Generate embedding
-            embedding = face_service.generate_embedding(face)
+            embedding = await face_service.generate_embedding_async(face)
             if embedding is None:
                 logger.error("Failed to generate face embedding")
                 await sio.emit('face_setup_error', {
@@ -76,9 +146,8 @@ def register_face_recognition_handlers(sio):
             logger.info(f"Embedding length: {len(embedding)}")
 
             # Store in database
-            db: Session = next(get_db())
-            user = db.query(User).filter(User.user_id == user_id).first()
-            if not user:
+            stored = await run_in_db_executor(_store_embedding, user_id, embedding, face)
+            if not stored:
                 logger.error(f"User {user_id} not found")
                 await sio.emit('face_setup_error', {
                     'message': 'User not found',
@@ -86,9 +155,6 @@ def register_face_recognition_handlers(sio):
                 }, room=sid)
                 return
 
-            user.face_embedding = embedding
-            db.commit()
-
             logger.info(f"Face setup completed for user {user_id}")
             await sio.emit('face_setup_success', {
                 'message': 'Face setup completed successfully',
@@ -101,4 +167,67 @@ def register_face_recognition_handlers(sio):
             await sio.emit('face_setup_error', {
                 'message': f'Face setup failed: {str(e)}',
                 'visualization': None
-            }, room=sid)
\ No newline at end of file
+            }, room=sid)
+
+    @sio.event
+    @timed_handler
+    async def identify_face(sid, data):
+        """
+        Campus-wide "who is this" lookup through the ANN index.
+
+        Expects {'image': frame, 'access_token': teacher or admin JWT} and
+        optionally 'limit' (1-20, default 5) candidates.
+        """
+        try:
+            data = data or {}
+            try:
+                scopes = verify_access_token(data.get('access_token') or '').get('scopes', [])
+                limit = max(1, min(int(data.get('limit', 5)), 20))
+            except (TypeError, ValueError, HTTPException):
+                await sio.emit('identify_face_error', {
+                    'message': 'A valid access token and limit are required'
+                }, room=sid)
+                return
+            if 'teacher' not in scopes:
+                await sio.emit('identify_face_error', {
+                    'message': 'Only teachers and admins can identify faces'
+                }, room=sid)
+                return
+
+            image_data = data.get('image')
+            if not image_data:
+                await sio.emit('identify_face_error', {
+                    'message': 'No image data received'
+                }, room=sid)
+                return
+
+            face_service = await model_registry.get_face_service_async()
+            face, visualization, error = await face_service.detect_face_async(
+                image_data, get_frame_format(sid).visualization
+            )
+            if error:
+                await sio.emit('identify_face_error', {
+                    'message': error,
+                    'visualization': visualization
+                }, room=sid)
+                return
+
+            embedding = await face_service.generate_embedding_async(face)
+            if embedding is None:
+                await sio.emit('identify_face_error', {
+                    'message': 'Failed to generate face embedding',
+                    'visualization': visualization
+                }, room=sid)
+                return
+
+            candidates = await run_in_db_executor(_identify, embedding, limit)
+            await sio.emit('face_identified', {
+                'candidates': candidates,
+                'visualization': visualization
+            }, room=sid)
+
+        except Exception as e:
+            logger.error(f"Unhandled error in identify_face: {str(e)}", exc_info=True)
+            await sio.emit('identify_face_error', {
+                'message': f'Identification failed: {str(e)}'
+            }, room=sid)
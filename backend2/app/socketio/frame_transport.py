@@ -0,0 +1,79 @@
+from dataclasses import asdict, dataclass
+from typing import Dict
+import logging
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+VISUALIZATION_MODES = ("none", "boxes", "image")
+
+
+@dataclass
+class FrameFormat:
+    """How a client sends frames and what it wants back."""
+    max_width: int
+    max_height: int
+    jpeg_quality: float     # 0..1, as used by canvas.toBlob / toDataURL
+    binary: bool            # raw JPEG bytes as a Socket.IO attachment
+    visualization: str      # none, boxes or image
+
+
+def default_frame_format() -> FrameFormat:
+    """Format assumed for clients that never negotiate (legacy kiosks)."""
+    return FrameFormat(
+        max_width=settings.FRAME_MAX_WIDTH,
+        max_height=settings.FRAME_MAX_HEIGHT,
+        jpeg_quality=settings.FRAME_JPEG_QUALITY,
+        binary=False,
+        visualization="image"
+    )
+
+
+# Negotiated format per Socket.IO sid
+_formats: Dict[str, FrameFormat] = {}
+
+
+def get_frame_format(sid: str) -> FrameFormat:
+    return _formats.get(sid) or default_frame_format()
+
+def forget_frame_format(sid: str) -> None:
+    _formats.pop(sid, None)
+
+def negotiate_frame_format(sid: str, request: dict) -> FrameFormat:
+    """
+    Clamp a client's requested format to the server limits and remember it.
+
+    The client may ask for a smaller resolution or lower quality than the
+    server maximum, never a larger one.
+    """
+    default = default_frame_format()
+    try:
+        max_width = int(request.get('max_width') or default.max_width)
+        max_height = int(request.get('max_height') or default.max_height)
+        jpeg_quality = float(request.get('jpeg_quality') or default.jpeg_quality)
+    except (TypeError, ValueError):
+        max_width, max_height, jpeg_quality = default.max_width, default.max_height, default.jpeg_quality
+
+    visualization = request.get('visualization', 'boxes')
+    if visualization not in VISUALIZATION_MODES:
+        visualization = 'boxes'
+
+    frame_format = FrameFormat(
+        max_width=max(settings.FRAME_MIN_SIDE, min(max_width, default.max_width)),
+        max_height=max(settings.FRAME_MIN_SIDE, min(max_height, default.max_height)),
+        jpeg_quality=max(0.3, min(jpeg_quality, default.jpeg_quality)),
+        binary=bool(request.get('binary', True)),
+        visualization=visualization
+    )
+    _formats[sid] = frame_format
+    return frame_format
+
+
+def register_frame_transport_handlers(sio):
+    @sio.on('negotiate_frame_format')
+    async def handle_negotiate_frame_format(sid, data):
+        """Agree on resolution, JPEG quality, binary transport and visualization mode."""
+        frame_format = negotiate_frame_format(sid, data or {})
+        logger.info(f"Frame format for {sid}: {frame_format}")
+        await sio.emit('frame_format', asdict(frame_format), room=sid)
@@ -0,0 +1,69 @@
+import inspect
+import logging
+
+from fastapi import HTTPException
+
+from app.auth.jwt import verify_access_token
+from app.services.executor import run_in_db_executor
+from app.services.metrics import timed_handler
+from app.services.qr_rendering import QR_FORMATS
+from app.services.qr_rotation import active_session_ids, qr_room, qr_rotation, with_new_session
+
+logger = logging.getLogger(__name__)
+
+
+async def _room_call(result) -> None:
+    # enter_room/leave_room are coroutines on recent python-socketio releases only
+    if inspect.isawaitable(result):
+        await result
+
+
+def register_qr_rotation_handlers(sio):
+    qr_rotation.bind(sio.emit)
+
+    @sio.on('watch_session_qr')
+    @timed_handler
+    async def watch_session_qr(sid, data):
+        """
+        Subscribe a projector screen to the rotating QR code of a session.
+
+        Expects {'session_id': int, 'access_token': teacher or admin JWT} and
+        optionally 'format': 'png' (default), 'svg' or 'matrix'. The current
+        code is sent right away and every new one is pushed as 'session_qr';
+        'session_qr_closed' is sent when the session ends.
+        """
+        data = data or {}
+        fmt = data.get('format') or 'png'
+        if fmt not in QR_FORMATS:
+            await sio.emit('session_qr_error', {'message': f"Format must be one of {', '.join(QR_FORMATS)}"}, room=sid)
+            return
+        try:
+            session_id = int(data.get('session_id'))
+            scopes = verify_access_token(data.get('access_token') or '').get('scopes', [])
+        except (TypeError, ValueError, HTTPException):
+            await sio.emit('session_qr_error', {'message': 'A session id and a valid access token are required'}, room=sid)
+            return
+        if 'teacher' not in scopes:
+            await sio.emit('session_qr_error', {'message': 'Only teachers and admins can display session QR codes'}, room=sid)
+            return
+        if session_id not in await run_in_db_executor(with_new_session, active_session_ids, [session_id]):
+            await sio.emit('session_qr_error', {'message': 'No active session found'}, room=sid)
+            return
+
+        previous = qr_rotation.unwatch(sid, session_id)
+        if previous is not None and previous != fmt:
+            await _room_call(sio.leave_room(sid, qr_room(session_id, previous)))
+        await _room_call(sio.enter_room(sid, qr_room(session_id, fmt)))
+        qr_rotation.watch(sid, session_id, fmt)
+        logger.info(f"{sid} displays the {fmt} QR code of session {session_id}")
+        await sio.emit('session_qr', await qr_rotation.current_payload(session_id, fmt), room=sid)
+
+    @sio.on('unwatch_session_qr')
+    async def unwatch_session_qr(sid, data):
+        try:
+            session_id = int((data or {}).get('session_id'))
+        except (TypeError, ValueError):
+            return
+        fmt = qr_rotation.unwatch(sid, session_id)
+        if fmt is not None:
+            await _room_call(sio.leave_room(sid, qr_room(session_id, fmt)))
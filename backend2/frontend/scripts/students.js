@@ -12,6 +12,50 @@ const videoElement = document.getElementById('cameraFeed');
 const faceDetectionBox = document.querySelector('.face-detection-box');
 const statusMessage = document.querySelector('.status-message');
 
+// Frame format negotiated with the server (see 'frame_format')
+const requestedFrameFormat = {
+    max_width: 640,
+    max_height: 480,
+    jpeg_quality: 0.7,
+    binary: true,
+    visualization: 'boxes'
+};
+let frameFormat = { ...requestedFrameFormat };
+
+socket.on('connect', () => {
+    socket.emit('negotiate_frame_format', requestedFrameFormat);
+});
+
+socket.on('frame_format', (data) => {
+    frameFormat = data;
+});
+
+// Encode the canvas as raw JPEG bytes, or as a data URL if binary frames were declined
+function encodeFrame(canvas) {
+    if (!frameFormat.binary) {
+        return Promise.resolve(canvas.toDataURL('image/jpeg', frameFormat.jpeg_quality));
+    }
+    return new Promise((resolve, reject) => {
+        canvas.toBlob((blob) => {
+            if (!blob) {
+                reject(new Error('Failed to encode frame'));
+                return;
+            }
+            blob.arrayBuffer().then(resolve, reject);
+        }, 'image/jpeg', frameFormat.jpeg_quality);
+    });
+}
+
+// Place the detection box over the video using the coordinates sent by the server
+function positionFaceBox(box, visualization) {
+    if (!box || !visualization || !visualization.boxes || !visualization.boxes.length) return;
+    const [x, y, w, h] = visualization.boxes[0];
+    box.style.left = `${(x / visualization.width) * 100}%`;
+    box.style.top = `${(y / visualization.height) * 100}%`;
+    box.style.width = `${(w / visualization.width) * 100}%`;
+    box.style.height = `${(h / visualization.height) * 100}%`;
+}
+
 // Function to get user ID from localStorage
 function getUserId() {
     const userData = localStorage.getItem('user_data');
@@ -53,14 +97,20 @@ async function processVideoFrame() {
     if (!videoStream || isProcessingFrame) return;
 
     isProcessingFrame = true;
+    // Downscale to the negotiated resolution before encoding
+    const scale = Math.min(
+        1,
+        frameFormat.max_width / videoElement.videoWidth,
+        frameFormat.max_height / videoElement.videoHeight
+    );
     const canvas = document.createElement('canvas');
-    canvas.width = videoElement.videoWidth;
-    canvas.height = videoElement.videoHeight;
+    canvas.width = Math.round(videoElement.videoWidth * scale);
+    canvas.height = Math.round(videoElement.videoHeight * scale);
     const ctx = canvas.getContext('2d');
     ctx.drawImage(videoElement, 0, 0, canvas.width, canvas.height);
 
     try {
-        const imageData = canvas.toDataURL('image/jpeg', 0.8);
+        const imageData = await encodeFrame(canvas);
         socket.emit('process_attendance_frame', {
             session_id: currentSessionId,
             image: imageData
@@ -261,6 +311,7 @@ function initializeAttendanceSocketListeners() {
             statusMessage.textContent = data.message;
         }
         if (faceDetectionBox) {
+            positionFaceBox(faceDetectionBox, data.visualization);
             faceDetectionBox.style.display = 'block';
             faceDetectionBox.style.borderColor = 'var(--success)';
             setTimeout(() => {
@@ -280,6 +331,7 @@ function initializeAttendanceSocketListeners() {
             statusMessage.textContent = data.message;
         }
         if (faceDetectionBox) {
+            positionFaceBox(faceDetectionBox, data.visualization);
             faceDetectionBox.style.display = 'block';
             faceDetectionBox.style.borderColor = 'var(--warning)';
             setTimeout(() => {
@@ -295,6 +347,7 @@ function initializeAttendanceSocketListeners() {
             statusMessage.textContent = data.message;
         }
         if (faceDetectionBox) {
+            positionFaceBox(faceDetectionBox, data.visualization);
             faceDetectionBox.style.display = 'block';
             faceDetectionBox.style.borderColor = 'var(--error)';
             setTimeout(() => {
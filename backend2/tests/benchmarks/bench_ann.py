@@ -0,0 +1,77 @@
+"""
+Recall and latency of the campus ANN index against brute force.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_ann --size 50000 --queries 500
+    python -m tests.benchmarks.bench_ann --backend faiss --nprobe 4 8 16
+
+Embeddings are synthetic: unit vectors drawn around one centre per
+identity, queried with a fresh noisy sample of a random identity, which
+mimics a new photo of an enrolled student.
+"""
+import argparse
+import time
+
+import numpy as np
+
+from app.services.ann_index import FaissIVFIndex, IVFFlatIndex
+
+
+def synthetic_embeddings(size, dim, noise, rng):
+    centres = rng.normal(size=(size, dim)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    return centres
+
+def noisy(vectors, noise, rng):
+    out = vectors + rng.normal(scale=noise, size=vectors.shape).astype(np.float32)
+    return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+def brute_force(vectors, queries, k):
+    sq = (
+        np.einsum('ij,ij->i', queries, queries)[:, None]
+        - 2.0 * queries @ vectors.T
+        + np.einsum('ij,ij->i', vectors, vectors)[None, :]
+    )
+    return np.argsort(sq, axis=1)[:, :k]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the ANN face index")
+    parser.add_argument("--size", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=128)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--noise", type=float, default=0.03)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32])
+    parser.add_argument("--backend", choices=["numpy", "faiss"], default="numpy")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    vectors = synthetic_embeddings(args.size, args.dim, args.noise, rng)
+    ids = np.arange(args.size)
+    targets = rng.choice(args.size, size=args.queries)
+    queries = noisy(vectors[targets], args.noise, rng)
+
+    start = time.perf_counter()
+    truth = brute_force(vectors, queries, args.k)
+    brute_ms = (time.perf_counter() - start) * 1000 / args.queries
+    print(f"brute force: {brute_ms:.3f} ms/query (batched)")
+
+    start = time.perf_counter()
+    index_class = IVFFlatIndex if args.backend == "numpy" else FaissIVFIndex
+    index = index_class.build(ids, vectors, nlist=args.nlist)
+    print(f"build: {time.perf_counter() - start:.2f}s")
+
+    print(f"{'nprobe':>6} {'ms/query':>9} {'recall@1':>9} {f'recall@{args.k}':>10}")
+    for nprobe in args.nprobe:
+        hits_1 = hits_k = 0
+        start = time.perf_counter()
+        results = [index.search(query, k=args.k, nprobe=nprobe)[0] for query in queries]
+        elapsed_ms = (time.perf_counter() - start) * 1000 / args.queries
+        for found, expected in zip(results, truth):
+            hits_1 += int(len(found) > 0 and found[0] == expected[0])
+            hits_k += len(set(found.tolist()) & set(expected.tolist()))
+        print(f"{nprobe:>6} {elapsed_ms:>9.3f} {hits_1 / args.queries:>9.3f} {hits_k / (args.queries * args.k):>10.3f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Face detector benchmark: latency and recall on a local image set.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_detectors --images path/to/images
+    python -m tests.benchmarks.bench_detectors --images imgs --labels faces.csv --detectors haar yunet
+
+The optional labels CSV has a `filename,faces` header and gives the
+number of faces in each image. Recall is the fraction of labelled faces
+found (detections beyond the label count are reported as extra).
+Detectors whose model files are missing are skipped.
+"""
+import argparse
+import csv
+import json
+import statistics
+import time
+from pathlib import Path
+
+import cv2
+
+from app.services.face_detectors import create_face_detector
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+DEFAULT_IMAGES = Path(__file__).parent.parent.parent.parent / "backend" / "ai" / "dataset"
+
+
+def load_labels(path):
+    with open(path, newline="") as f:
+        return {row["filename"]: int(row["faces"]) for row in csv.DictReader(f)}
+
+def load_images(image_dir):
+    images = {}
+    for path in sorted(Path(image_dir).rglob("*")):
+        if path.suffix.lower() in IMAGE_SUFFIXES:
+            image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+            if image is not None:
+                images[path.name] = image
+    return images
+
+def bench_detector(detector, images, labels, repeat):
+    latencies = []
+    expected = found = extra = 0
+    for name, image in images.items():
+        detector.detect(image)  # warm-up (lazy allocations, input size changes)
+        for _ in range(repeat):
+            start = time.perf_counter()
+            boxes = detector.detect(image)
+            latencies.append(time.perf_counter() - start)
+        if name in labels:
+            expected += labels[name]
+            found += min(len(boxes), labels[name])
+            extra += max(0, len(boxes) - labels[name])
+
+    latencies.sort()
+    return {
+        "images": len(images),
+        "median_ms": statistics.median(latencies) * 1000,
+        "p95_ms": latencies[int(0.95 * (len(latencies) - 1))] * 1000,
+        "recall": found / expected if expected else None,
+        "extra_detections": extra if expected else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark face detectors")
+    parser.add_argument("--images", default=str(DEFAULT_IMAGES))
+    parser.add_argument("--labels", help="CSV with filename,faces columns")
+    parser.add_argument("--detectors", nargs="+", default=["haar", "yunet", "ssd"])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", help="Write results to this file")
+    args = parser.parse_args()
+
+    images = load_images(args.images)
+    if not images:
+        parser.error(f"No images found in {args.images}")
+    labels = load_labels(args.labels) if args.labels else {}
+
+    results = {}
+    for kind in args.detectors:
+        try:
+            detector = create_face_detector(kind)
+        except (FileNotFoundError, AttributeError) as e:
+            print(f"{kind:>6}: skipped ({e})")
+            continue
+        results[kind] = bench_detector(detector, images, labels, args.repeat)
+
+    print(f"{'detector':>8} {'median ms':>10} {'p95 ms':>8} {'recall':>7}")
+    for kind, r in results.items():
+        recall = f"{r['recall']:.3f}" if r["recall"] is not None else "n/a"
+        print(f"{kind:>8} {r['median_ms']:>10.2f} {r['p95_ms']:>8.2f} {recall:>7}")
+
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
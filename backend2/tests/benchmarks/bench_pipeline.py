@@ -0,0 +1,186 @@
+"""
+Stage-by-stage latency of the face recognition pipeline.
+
+Times every stage of one attendance frame separately: base64 decode,
+cv2.imdecode, face detection, crop, preprocessing, model predict,
+embedding serialization and the roster match against synthetic classes
+of 50, 500 and 5000 students. Results can be saved as a JSON baseline and
+later runs compared against it; the run fails (exit code 1) when a stage
+is slower than the baseline by more than the threshold.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_pipeline
+    python -m tests.benchmarks.bench_pipeline --save tests/benchmarks/baselines/pipeline.json
+    python -m tests.benchmarks.bench_pipeline --compare tests/benchmarks/baselines/pipeline.json --threshold 0.25
+
+Baselines are machine specific; record them on the box that runs the
+comparison. The predict stage is skipped (and a random embedding used
+downstream) when the embedding model file is missing.
+"""
+import argparse
+import base64
+import json
+import platform
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from app.services.embedding_codec import decode_embedding, encode_embedding
+from app.services.embedding_index import ClassEmbeddingIndex
+from app.services.face_detectors import create_face_detector
+from app.services.face_preprocessing import preprocess_faces
+from app.services.inference_backend import load_inference_backend
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+DEFAULT_IMAGES = Path(__file__).parent.parent.parent.parent / "backend" / "ai" / "dataset"
+ROSTER_SIZES = (50, 500, 5000)
+DEFAULT_DIM = 128  # embedding size used without a model
+
+
+def load_frames(image_dir, max_side=640):
+    """Sample images re-encoded like kiosk frames: JPEG, at most 640px, as base64 data URLs."""
+    frames = []
+    for path in sorted(Path(image_dir).rglob("*")):
+        if path.suffix.lower() not in IMAGE_SUFFIXES:
+            continue
+        image = cv2.imread(str(path), cv2.IMREAD_COLOR)
+        if image is None:
+            continue
+        scale = max_side / float(max(image.shape[:2]))
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        frames.append((path.name, "data:image/jpeg;base64," + base64.b64encode(buffer).decode("ascii")))
+    return frames
+
+def synthetic_roster(size, dim, rng):
+    matrix = rng.normal(size=(size, dim)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    return ClassEmbeddingIndex(
+        class_id=size,
+        user_ids=np.arange(size, dtype=np.int64),
+        names=[f"Student {i}" for i in range(size)],
+        matrix=matrix,
+        sq_norms=np.einsum("ij,ij->i", matrix, matrix),
+        loaded_at=time.monotonic()
+    )
+
+def timed(timings, stage, func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    timings.setdefault(stage, []).append(time.perf_counter() - start)
+    return result
+
+def run_frame(timings, frame, detector, backend, rosters, dim, rng):
+    image_bytes = timed(timings, "base64_decode", lambda data: base64.b64decode(data.split(",", 1)[-1]), frame)
+    image = timed(timings, "imdecode", lambda data: cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR), image_bytes)
+    boxes = timed(timings, "detect", detector.detect, image)
+    if len(boxes) == 0:
+        return False
+    crops = timed(timings, "crop", lambda img, bxs: [img[y:y+h, x:x+w] for (x, y, w, h) in bxs[:1]], image, boxes)
+    batch = timed(timings, "preprocess", preprocess_faces, crops)
+    if backend is not None:
+        embedding = timed(timings, "predict", backend.predict, batch)[0]
+    else:
+        embedding = rng.normal(size=dim).astype(np.float32)
+    blob = timed(timings, "serialize", encode_embedding, embedding)
+    query = decode_embedding(blob)
+    for size, roster in rosters.items():
+        timed(timings, f"match/{size}", roster.nearest, query)
+    return True
+
+def summarize(timings):
+    summary = {}
+    for stage, samples in timings.items():
+        samples = sorted(samples)
+        summary[stage] = {
+            "median_ms": statistics.median(samples) * 1000,
+            "p95_ms": samples[int(0.95 * (len(samples) - 1))] * 1000,
+            "samples": len(samples),
+        }
+    return summary
+
+def compare(summary, baseline, threshold):
+    """Stages whose median regressed by more than `threshold` (a fraction) against the baseline."""
+    regressions = []
+    for stage, row in summary.items():
+        reference = baseline.get("stages", {}).get(stage)
+        if reference is None or reference["median_ms"] <= 0:
+            continue
+        change = row["median_ms"] / reference["median_ms"] - 1.0
+        if change > threshold:
+            regressions.append((stage, reference["median_ms"], row["median_ms"], change))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the face recognition pipeline stage by stage")
+    parser.add_argument("--images", default=str(DEFAULT_IMAGES), help="Directory of sample frames")
+    parser.add_argument("--repeat", type=int, default=20, help="Runs per sample image")
+    parser.add_argument("--detector", default="haar", help="haar, yunet or ssd")
+    parser.add_argument("--backend", help="Inference backend (defaults to FACE_INFERENCE_BACKEND)")
+    parser.add_argument("--rosters", type=int, nargs="+", default=list(ROSTER_SIZES))
+    parser.add_argument("--save", help="Write the results as a JSON baseline")
+    parser.add_argument("--compare", help="JSON baseline to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed slowdown, e.g. 0.2 = 20%%")
+    args = parser.parse_args()
+
+    frames = load_frames(args.images)
+    if not frames:
+        sys.exit(f"No sample images found in {args.images}")
+
+    detector = create_face_detector(args.detector)
+    try:
+        backend = load_inference_backend(args.backend)
+    except (FileNotFoundError, ImportError) as e:
+        print(f"Skipping predict stage: {e}")
+        backend = None
+
+    dim = DEFAULT_DIM
+    if backend is not None:
+        dim = backend.predict(np.zeros((1, 160, 160, 3), dtype=np.float32)).shape[1]
+    rng = np.random.default_rng(0)
+    rosters = {size: synthetic_roster(size, dim, rng) for size in args.rosters}
+
+    timings = {}
+    for name, frame in frames:
+        run_frame({}, frame, detector, backend, rosters, dim, rng)  # warm-up
+        for _ in range(args.repeat):
+            if not run_frame(timings, frame, detector, backend, rosters, dim, rng):
+                print(f"No face detected in {name}; only decode and detection were timed")
+                break
+
+    summary = summarize(timings)
+    print(f"{'stage':<16}{'median ms':>12}{'p95 ms':>10}{'samples':>9}")
+    for stage, row in summary.items():
+        print(f"{stage:<16}{row['median_ms']:>12.3f}{row['p95_ms']:>10.3f}{row['samples']:>9}")
+
+    if args.save:
+        path = Path(args.save)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as f:
+            json.dump({
+                "machine": platform.node(),
+                "python": platform.python_version(),
+                "opencv": cv2.__version__,
+                "detector": args.detector,
+                "predict": backend is not None,
+                "stages": summary,
+            }, f, indent=2)
+        print(f"Baseline written to {path}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(summary, baseline, args.threshold)
+        for stage, before, after, change in regressions:
+            print(f"REGRESSION {stage}: {before:.3f} ms -> {after:.3f} ms (+{change:.0%})")
+        if regressions:
+            sys.exit(1)
+        print(f"No stage slower than the baseline by more than {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
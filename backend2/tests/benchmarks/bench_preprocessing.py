@@ -0,0 +1,91 @@
+"""
+Embedding preprocessing microbenchmark: latency and allocations per batch.
+
+Compares the original per-crop path (resize, astype, divide, expand_dims,
+concatenate), cv2.dnn.blobFromImages and the reused buffer in
+app.services.face_preprocessing. Allocations are measured with
+tracemalloc, which sees every NumPy and OpenCV output array.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_preprocessing
+    python -m tests.benchmarks.bench_preprocessing --batch-sizes 1 8 32 --repeat 200
+"""
+import argparse
+import json
+import statistics
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+
+from app.services.face_preprocessing import preprocess_faces, preprocess_faces_blob
+
+
+def per_crop(crops):
+    faces = [np.expand_dims(cv2.resize(crop, (160, 160)).astype('float32') / 255.0, axis=0) for crop in crops]
+    return np.concatenate(faces)
+
+METHODS = {
+    "per_crop": per_crop,
+    "blob_from_images": preprocess_faces_blob,
+    "reused_buffer": preprocess_faces,
+}
+
+
+def make_crops(batch_size, seed=0):
+    rng = np.random.default_rng(seed)
+    sides = rng.integers(80, 240, size=batch_size)
+    return [rng.integers(0, 256, size=(side, side, 3), dtype=np.uint8) for side in sides]
+
+def measure_allocations(method, crops):
+    """Blocks still allocated after one call (result held) and peak traced bytes during it."""
+    method(crops)  # let buffers reach their steady state first
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    result = method(crops)
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    del result
+    allocations = sum(max(0, stat.count_diff) for stat in after.compare_to(before, "lineno"))
+    return allocations, peak
+
+def bench(method, crops, repeat):
+    method(crops)
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        method(crops)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies) * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark batched face preprocessing")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--repeat", type=int, default=100)
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for batch_size in args.batch_sizes:
+        crops = make_crops(batch_size)
+        for name, method in METHODS.items():
+            allocations, peak = measure_allocations(method, crops)
+            results[f"{name}/{batch_size}"] = {
+                "median_ms": bench(method, crops, args.repeat),
+                "live_allocations": allocations,
+                "peak_kib": peak / 1024,
+            }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'method/batch':<24}{'median ms':>12}{'live allocs':>14}{'peak KiB':>12}")
+    for key, row in results.items():
+        print(f"{key:<24}{row['median_ms']:>12.3f}{row['live_allocations']:>14}{row['peak_kib']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,92 @@
+"""
+QR rendering microbenchmark: renders per second and QR version per payload.
+
+Compares the original payload (repr of a dict with the session id, a
+token_urlsafe(32) token and an ISO expiry) with the compact random and
+signed tokens, in every output format of app.services.qr_rendering, and
+the LRU render cache against rendering every request.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_qr_rendering
+    python -m tests.benchmarks.bench_qr_rendering --seconds 2 --json
+"""
+import argparse
+import json
+import secrets
+import time
+from datetime import datetime, timedelta
+
+from app.services.qr_rendering import QR_FORMATS, QrRenderCache, qr_version, render_qr
+from app.services.qr_tokens import new_random_token, qr_signer
+
+
+def legacy_payload():
+    return str({
+        "session_id": 12345,
+        "token": secrets.token_urlsafe(32),
+        "expires_at": (datetime.utcnow() + timedelta(minutes=15)).isoformat()
+    })
+
+PAYLOADS = {
+    "legacy_dict": legacy_payload,
+    "random_token": new_random_token,
+    "signed_token": lambda: qr_signer.issue(12345),
+}
+
+
+def renders_per_second(render, seconds):
+    render()
+    count = 0
+    start = time.perf_counter()
+    while time.perf_counter() - start < seconds:
+        render()
+        count += 1
+    return count / (time.perf_counter() - start)
+
+def bench_cached(fmt, seconds, screens=30):
+    """Each token requested by `screens` clients, as when a lecture hall polls one session."""
+    cache = QrRenderCache(max_entries=64)
+    state = {"token": None, "left": 0}
+
+    def render():
+        if state["left"] == 0:
+            state["token"], state["left"] = qr_signer.issue(secrets.randbelow(10 ** 6)), screens
+        state["left"] -= 1
+        if cache.get(state["token"], fmt) is None:
+            cache.put(state["token"], fmt, render_qr(state["token"], fmt))
+
+    return renders_per_second(render, seconds)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark QR code rendering")
+    parser.add_argument("--seconds", type=float, default=1.0, help="Time spent on each case")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    results = {}
+    for name, payload in PAYLOADS.items():
+        data = payload()
+        for fmt in QR_FORMATS:
+            results[f"{name}/{fmt}"] = {
+                "version": qr_version(data),
+                "payload_chars": len(data),
+                "renders_per_second": renders_per_second(lambda: render_qr(payload(), fmt), args.seconds),
+            }
+    for fmt in QR_FORMATS:
+        results[f"signed_token/{fmt}/cached"] = {
+            "version": qr_version(qr_signer.issue(12345)),
+            "payload_chars": len(qr_signer.issue(12345)),
+            "renders_per_second": bench_cached(fmt, args.seconds),
+        }
+
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    print(f"{'payload/format':<28}{'version':>9}{'chars':>8}{'renders/s':>12}")
+    for key, row in results.items():
+        print(f"{key:<28}{row['version']:>9}{row['payload_chars']:>8}{row['renders_per_second']:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
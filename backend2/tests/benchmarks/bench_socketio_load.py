@@ -0,0 +1,432 @@
+"""
+End-to-end Socket.IO load test of the attendance pipeline.
+
+Everything runs on this machine: a temporary SQLite database is seeded
+with a class of enrolled students and an open session, the ASGI
+socket_app is started with uvicorn in a subprocess (so the clients do not
+share its event loop), and N python-socketio AsyncClients replay frames
+to process_attendance_frame (and optionally setup_face) at a fixed rate.
+
+Each client keeps at most one frame in flight, like a kiosk: a tick that
+comes while the previous frame is still unanswered is counted as dropped.
+Replies carry no request id, so a frame that exceeds --timeout is counted
+as timed out but still awaited (its round trip is recorded, it is counted
+as late); only after 5x --timeout is it given up as lost.
+Reported are client-side round-trip percentiles per event, dropped and
+timed-out frames, and the server's event-loop lag and handler latency
+from /api/v1/metrics.
+
+Usage (from backend2/):
+    python -m tests.benchmarks.bench_socketio_load --clients 30 --fps 2 --duration 60
+    python -m tests.benchmarks.bench_socketio_load --frames recorded/ --binary --setup-clients 4
+    python -m tests.benchmarks.bench_socketio_load --url http://127.0.0.1:8000 --session-id 12
+
+Synthetic frames contain no real face, so they exercise decode, frame
+gating and detection but not the embedding model; record kiosk frames
+(JPEG files) and pass --frames to load the full pipeline.
+"""
+import argparse
+import asyncio
+import base64
+import json
+import os
+import random
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from datetime import date, datetime
+from pathlib import Path
+
+import cv2
+import numpy as np
+import socketio
+
+BACKEND_DIR = Path(__file__).parent.parent.parent
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+ATTENDANCE_EVENTS = (
+    "attendance_marked", "attendance_already_marked", "attendance_no_match",
+    "attendance_error", "attendance_batch_result",
+)
+SETUP_EVENTS = ("face_setup_success", "face_setup_error")
+
+
+# Frames
+
+def load_recorded_frames(frame_dir):
+    return [
+        path.read_bytes()
+        for path in sorted(Path(frame_dir).rglob("*"))
+        if path.suffix.lower() in IMAGE_SUFFIXES
+    ]
+
+def synthetic_frames(count=30, width=640, height=480, seed=0):
+    """A short clip of moving shapes on noise, so consecutive frames differ."""
+    rng = np.random.default_rng(seed)
+    background = rng.integers(0, 255, size=(height, width, 3), dtype=np.uint8)
+    frames = []
+    for i in range(count):
+        image = background.copy()
+        centre = (int(width * (0.2 + 0.6 * i / count)), height // 2)
+        cv2.ellipse(image, centre, (70, 90), 0, 0, 360, (150, 170, 200), -1)
+        _, buffer = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, 70])
+        frames.append(buffer.tobytes())
+    return frames
+
+def as_payload(frame, binary):
+    if binary:
+        return frame
+    return "data:image/jpeg;base64," + base64.b64encode(frame).decode("ascii")
+
+
+# Local server
+
+def embedding_dimension():
+    """Output size of the configured embedding model (128 if it cannot be loaded here)."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    try:
+        from app.services.inference_backend import load_inference_backend
+        backend = load_inference_backend()
+        return int(backend.predict(np.zeros((1, 160, 160, 3), dtype=np.float32)).shape[1])
+    except Exception as e:
+        print(f"Embedding model not loadable here ({e}); seeding 128-d embeddings")
+        return 128
+
+def seed_database(database_url, students, dim, seed=0):
+    """
+    Create the schema and a class of enrolled students with one open session.
+
+    Must run before anything imports app.database with another DATABASE_URL.
+    """
+    os.environ["DATABASE_URL"] = database_url
+    sys.path.insert(0, str(BACKEND_DIR))
+    import app.models  # noqa: F401  (registers every table)
+    from app.database import Base, SessionLocal, engine
+    from app.models.class_user import ClassUser
+    from app.models.classroom import Class
+    from app.models.session import Session
+    from app.models.user import User, UserRole
+    from app.services.embedding_codec import encode_embedding
+    from app.services.embedding_rollout import rollout
+
+    Base.metadata.create_all(bind=engine)
+    db = SessionLocal()
+    try:
+        teacher = User(name="Load", prenom="Teacher", email="teacher@load.test", password_hash="x", role=UserRole.TEACHER)
+        db.add(teacher)
+        db.flush()
+        classroom = Class(class_name="Load test", class_code="LOAD01", created_by=teacher.user_id)
+        db.add(classroom)
+        db.flush()
+
+        rng = np.random.default_rng(seed)
+        vectors = rng.normal(size=(students, dim)).astype(np.float32)
+        vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+        version = rollout.serving_version
+        user_ids = []
+        for i, vector in enumerate(vectors):
+            student = User(
+                name=f"Student{i}", prenom="Load", email=f"student{i}@load.test", password_hash="x",
+                role=UserRole.STUDENT, **rollout.enrollment_values(encode_embedding(vector, model_version=version), version)
+            )
+            db.add(student)
+            db.flush()
+            user_ids.append(student.user_id)
+        db.add_all([ClassUser(class_id=classroom.class_id, user_id=user_id) for user_id in user_ids])
+
+        session = Session(
+            class_id=classroom.class_id,
+            session_topic="Load test",
+            session_date=date.today(),
+            start_time=datetime.now().time(),
+            created_by=teacher.user_id
+        )
+        db.add(session)
+        db.commit()
+        return session.session_id, user_ids
+    finally:
+        db.close()
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+def start_server(database_url, port, log_path, extra_env):
+    env = dict(os.environ, DATABASE_URL=database_url, FACE_WARMUP_ON_STARTUP="true", **extra_env)
+    log = open(log_path, "w")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:socket_app", "--host", "127.0.0.1",
+         "--port", str(port), "--log-level", "warning"],
+        cwd=str(BACKEND_DIR), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    return process, log
+
+WARMUP_FAILED = "Face model warm-up failed"
+
+def wait_until_ready(url, process, log_path=None, timeout=300.0):
+    """
+    Poll the readiness probe; with warm-up enabled this waits for the models too.
+
+    Fails as soon as the model load is reported failed (probe body or server
+    log) instead of waiting out the timeout for a probe that stays 503.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            with urllib.request.urlopen(f"{url}/api/v1/health/ready", timeout=2) as response:
+                if response.status == 200:
+                    return
+        except urllib.error.HTTPError as e:
+            try:
+                models = json.load(e).get("face_recognition") or {}
+            except ValueError:
+                models = {}
+            if isinstance(models, dict) and models.get("state") == "failed":
+                raise RuntimeError(f"Face models failed to load: {models.get('error')}")
+        except OSError:
+            pass
+        if log_path is not None:
+            with open(log_path, errors="replace") as log:
+                for line in log:
+                    if WARMUP_FAILED in line:
+                        raise RuntimeError(f"Server warm-up failed: {line.strip()}")
+        time.sleep(0.5)
+    raise TimeoutError("Server did not become ready")
+
+def fetch_metrics(url):
+    with urllib.request.urlopen(f"{url}/api/v1/metrics/", timeout=10) as response:
+        return json.load(response)
+
+
+# Clients
+
+class KioskClient:
+    """One simulated kiosk streaming frames at a fixed rate, one frame in flight at a time."""
+
+    def __init__(self, url, frames, fps, event, make_request, response_events, binary, timeout):
+        self.url = url
+        self.frames = frames
+        self.interval = 1.0 / fps
+        self.event = event
+        self.make_request = make_request
+        self.response_events = response_events
+        self.binary = binary
+        self.timeout = timeout
+        self.sent = 0
+        self.dropped = 0
+        self.timed_out = 0
+        self.late = 0
+        self.lost = 0
+        self.latencies = {}
+        self.errors = {}
+        self._sent_at = None
+        self._overdue = False
+        self._answered = asyncio.Event()
+
+    @property
+    def give_up_after(self):
+        return self.timeout * 5
+
+    def _on_response(self, event):
+        async def handler(data):
+            if self._sent_at is None:
+                return  # reply to a frame already given up as lost
+            loop = asyncio.get_running_loop()
+            self.latencies.setdefault(event, []).append(loop.time() - self._sent_at)
+            if self._overdue:
+                self.late += 1
+            if event.endswith("error"):
+                message = (data or {}).get("message", "")
+                self.errors[message] = self.errors.get(message, 0) + 1
+            self._sent_at = None
+            self._overdue = False
+            self._answered.set()
+        return handler
+
+    def _check_in_flight(self, now):
+        """Account for the frame in flight; True while it still blocks the next one."""
+        waited = now - self._sent_at
+        if waited > self.timeout and not self._overdue:
+            self.timed_out += 1
+            self._overdue = True
+        if waited > self.give_up_after:
+            self.lost += 1
+            self._sent_at = None
+            self._overdue = False
+            return False
+        return True
+
+    async def run(self, duration):
+        client = socketio.AsyncClient(reconnection=False)
+        for event in self.response_events:
+            client.on(event, self._on_response(event))
+        negotiated = asyncio.Event()
+        client.on("frame_format", lambda data: negotiated.set())
+
+        await client.connect(self.url, transports=["websocket"])
+        await client.emit("negotiate_frame_format", {"binary": self.binary, "visualization": "none"})
+        await asyncio.wait_for(negotiated.wait(), timeout=10)
+
+        loop = asyncio.get_running_loop()
+        next_tick = loop.time() + random.uniform(0, self.interval)
+        end = loop.time() + duration
+        frame_no = random.randrange(len(self.frames))
+        while loop.time() < end:
+            await asyncio.sleep(max(0.0, next_tick - loop.time()))
+            next_tick += self.interval
+            if self._sent_at is not None and self._check_in_flight(loop.time()):
+                self.dropped += 1
+                continue
+            frame = as_payload(self.frames[frame_no % len(self.frames)], self.binary)
+            frame_no += 1
+            self._answered.clear()
+            self._sent_at = loop.time()
+            self.sent += 1
+            await client.emit(self.event, self.make_request(frame))
+
+        if self._sent_at is not None:
+            try:
+                remaining = self.give_up_after - (loop.time() - self._sent_at)
+                await asyncio.wait_for(self._answered.wait(), timeout=max(0.0, remaining))
+            except asyncio.TimeoutError:
+                self._check_in_flight(loop.time())
+                if self._sent_at is not None:
+                    self.lost += 1
+                    self._sent_at = None
+        await client.disconnect()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))] * 1000
+    return {"count": len(samples), "p50_ms": pick(0.50), "p95_ms": pick(0.95), "p99_ms": pick(0.99),
+            "mean_ms": statistics.mean(samples) * 1000}
+
+def summarize(clients, server_metrics):
+    latencies, errors = {}, {}
+    for client in clients:
+        for event, samples in client.latencies.items():
+            latencies.setdefault(event, []).extend(samples)
+        for message, count in client.errors.items():
+            errors[message] = errors.get(message, 0) + count
+    all_samples = [sample for samples in latencies.values() for sample in samples]
+
+    histograms = server_metrics.get("histograms", {}) if server_metrics else {}
+    return {
+        "sent": sum(client.sent for client in clients),
+        "dropped": sum(client.dropped for client in clients),
+        "timed_out": sum(client.timed_out for client in clients),
+        "late": sum(client.late for client in clients),
+        "lost": sum(client.lost for client in clients),
+        "round_trip": percentiles(all_samples) if all_samples else None,
+        "round_trip_by_event": {event: percentiles(samples) for event, samples in latencies.items()},
+        "errors": errors,
+        "server_event_loop_lag": histograms.get("event_loop_lag_seconds"),
+        "server_handlers": {name: value for name, value in histograms.items() if name.startswith("socketio.")},
+        "server_counters": server_metrics.get("counters", {}) if server_metrics else {},
+    }
+
+def print_report(report):
+    print(f"frames sent {report['sent']}, dropped {report['dropped']}, timed out {report['timed_out']} "
+          f"(answered late {report['late']}, lost {report['lost']})")
+    print(f"{'event':<28}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    rows = dict(report["round_trip_by_event"])
+    if report["round_trip"]:
+        rows["all"] = report["round_trip"]
+    for event, row in rows.items():
+        print(f"{event:<28}{row['count']:>7}{row['p50_ms']:>10.1f}{row['p95_ms']:>10.1f}{row['p99_ms']:>10.1f}")
+    for message, count in sorted(report["errors"].items(), key=lambda item: -item[1])[:5]:
+        print(f"  error x{count}: {message}")
+    lag = report["server_event_loop_lag"]
+    if lag:
+        print(f"server loop lag: p50 {lag['p50'] * 1000:.1f} ms, p99 {lag['p99'] * 1000:.1f} ms, "
+              f"max {lag['max'] * 1000:.1f} ms")
+    for name, row in report["server_handlers"].items():
+        print(f"server {name}: p50 {row['p50'] * 1000:.1f} ms, p99 {row['p99'] * 1000:.1f} ms ({row['count']} calls)")
+
+
+async def run_load(args, url, session_id, user_ids, frames):
+    def attendance_request(frame):
+        request = {"session_id": session_id, "image": frame}
+        if args.crowd:
+            request["mode"] = "crowd"
+        return request
+
+    clients = [
+        KioskClient(url, frames, args.fps, "process_attendance_frame", attendance_request,
+                    ATTENDANCE_EVENTS, args.binary, args.timeout)
+        for _ in range(args.clients)
+    ]
+    for i in range(args.setup_clients):
+        user_id = user_ids[i % len(user_ids)] if user_ids else 1
+        clients.append(KioskClient(
+            url, frames, args.fps, "setup_face",
+            lambda frame, user_id=user_id: {"user_id": user_id, "image": frame},
+            SETUP_EVENTS, args.binary, args.timeout
+        ))
+    await asyncio.gather(*(client.run(args.duration) for client in clients))
+    return clients
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO load generator for the attendance pipeline")
+    parser.add_argument("--clients", type=int, default=20, help="Kiosks streaming attendance frames")
+    parser.add_argument("--setup-clients", type=int, default=0, help="Clients streaming setup_face frames")
+    parser.add_argument("--fps", type=float, default=1.0, help="Frames per second per client")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds of load")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Seconds before a frame counts as lost")
+    parser.add_argument("--frames", help="Directory of recorded JPEG frames (synthetic if omitted)")
+    parser.add_argument("--binary", action="store_true", help="Send frames as binary attachments")
+    parser.add_argument("--crowd", action="store_true", help="Use crowd mode")
+    parser.add_argument("--students", type=int, default=500, help="Students seeded into the class")
+    parser.add_argument("--url", help="Use a running server instead of starting one")
+    parser.add_argument("--session-id", type=int, help="Session to use with --url")
+    parser.add_argument("--env", nargs="*", default=[], metavar="KEY=VALUE", help="Extra settings for the server")
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args()
+
+    frames = load_recorded_frames(args.frames) if args.frames else synthetic_frames()
+    if not frames:
+        sys.exit(f"No frames found in {args.frames}")
+
+    process = log = None
+    workdir = tempfile.mkdtemp(prefix="attendify-load-")
+    try:
+        if args.url:
+            if args.session_id is None:
+                parser.error("--url requires --session-id")
+            url, session_id, user_ids = args.url.rstrip("/"), args.session_id, []
+        else:
+            database_url = f"sqlite:///{workdir}/load.db"
+            os.environ["DATABASE_URL"] = database_url  # before the first import of app settings
+            dim = embedding_dimension()
+            session_id, user_ids = seed_database(database_url, args.students, dim)
+            port = free_port()
+            url = f"http://127.0.0.1:{port}"
+            extra_env = dict(item.split("=", 1) for item in args.env)
+            process, log = start_server(database_url, port, f"{workdir}/server.log", extra_env)
+            print(f"Waiting for the server on {url} (log: {workdir}/server.log)")
+            wait_until_ready(url, process, f"{workdir}/server.log")
+
+        print(f"{args.clients} attendance + {args.setup_clients} setup clients at {args.fps} fps for {args.duration}s")
+        clients = asyncio.run(run_load(args, url, session_id, user_ids, frames))
+        report = summarize(clients, fetch_metrics(url))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+            log.close()
+
+    print_report(report)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
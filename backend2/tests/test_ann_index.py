@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base
+from app.models.user import User
+from app.services.ann_index import CampusFaceIndex, IVFFlatIndex
+from app.services.embedding_codec import encode_embedding
+from app.services.embedding_rollout import rollout
+
+
+def _unit_vectors(rng, n, dim=32):
+    vectors = rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+def test_search_finds_enrolled_vector():
+    rng = np.random.default_rng(0)
+    vectors = _unit_vectors(rng, 4000)
+    index = IVFFlatIndex.build(np.arange(4000), vectors, nprobe=8)
+    assert index.nlist > 1
+
+    hits = sum(int(index.search(vectors[i], k=1)[0][0] == i) for i in range(0, 4000, 40))
+    assert hits >= 95
+
+def test_incremental_upsert_and_remove():
+    rng = np.random.default_rng(1)
+    vectors = _unit_vectors(rng, 100)
+    index = IVFFlatIndex.build(np.arange(100), vectors)
+
+    replacement = _unit_vectors(rng, 1)
+    index.add([7], replacement)
+    assert len(index) == 100
+    ids, distances = index.search(replacement[0], k=1)
+    assert ids[0] == 7 and distances[0] < 1e-3
+
+    assert index.remove(7)
+    assert 7 not in index.search(replacement[0], k=5)[0]
+
+def test_save_and_load_round_trip(tmp_path):
+    rng = np.random.default_rng(2)
+    vectors = _unit_vectors(rng, 2000)
+    index = IVFFlatIndex.build(np.arange(2000), vectors)
+    index.save(str(tmp_path / "campus"))
+
+    loaded = IVFFlatIndex.load(str(tmp_path / "campus"))
+    assert len(loaded) == 2000
+    assert np.array_equal(loaded.search(vectors[5], k=3)[0], index.search(vectors[5], k=3)[0])
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def _enroll(db, user_id, vector):
+    user = User(user_id=user_id, name=f"N{user_id}", prenom="P", email=f"u{user_id}@univ.edu", password_hash="x")
+    version = rollout.serving_version
+    rollout.store(user, encode_embedding(vector, model_version=version), version)
+    db.add(user)
+    db.commit()
+
+def test_loaded_campus_index_catches_up_with_unsaved_enrollments(db, tmp_path):
+    rng = np.random.default_rng(3)
+    vectors = _unit_vectors(rng, 51)
+    for user_id in range(1, 51):
+        _enroll(db, user_id, vectors[user_id - 1])
+    first_worker = CampusFaceIndex(path=str(tmp_path / "campus"), backend="numpy")
+    assert len(first_worker.ensure_loaded(db)) == 50
+
+    # Enrolled through another worker, never upserted into this file
+    _enroll(db, 51, vectors[50])
+    restarted = CampusFaceIndex(path=str(tmp_path / "campus"), backend="numpy")
+    assert len(restarted.ensure_loaded(db)) == 51
+    assert restarted.identify(db, vectors[50], k=1)[0][0] == 51
+
+    # A save by the first worker must not hide the enrollment from the next start
+    first_worker.upsert(7, vectors[6])
+    first_worker.save_if_dirty()
+    assert len(CampusFaceIndex(path=str(tmp_path / "campus"), backend="numpy").ensure_loaded(db)) == 51
+
+def test_catch_up_drops_users_whose_embedding_was_cleared(db, tmp_path, monkeypatch):
+    rng = np.random.default_rng(4)
+    vectors = _unit_vectors(rng, 3)
+    for user_id in range(1, 4):
+        _enroll(db, user_id, vectors[user_id - 1])
+    index = CampusFaceIndex(path=str(tmp_path / "campus"), backend="numpy")
+    assert len(index.ensure_loaded(db)) == 3
+
+    user = db.get(User, 2)
+    user.face_embedding = user.face_embedding_version = None
+    db.commit()
+    monkeypatch.setattr("app.services.ann_index.settings.ANN_SYNC_SECONDS", 0)
+    assert len(index.ensure_loaded(db)) == 2
+    assert 2 not in [user_id for user_id, _ in index.identify(db, vectors[1], k=3)]
+
+def test_empty_campus_is_cached_until_the_next_sync(db, tmp_path, monkeypatch):
+    index = CampusFaceIndex(path=str(tmp_path / "campus"), backend="numpy")
+    builds = []
+    build = index._build
+    monkeypatch.setattr(index, "_build", lambda db: builds.append(1) or build(db))
+    assert index.identify(db, np.ones(32, dtype=np.float32)) == []
+    assert index.identify(db, np.ones(32, dtype=np.float32)) == []
+    assert len(builds) == 1
+
+    # An enrollment on this worker makes the next lookup build the index
+    vector = _unit_vectors(np.random.default_rng(5), 1)[0]
+    _enroll(db, 1, vector)
+    index.upsert(1, vector)
+    assert index.identify(db, vector, k=1)[0][0] == 1
+    assert len(builds) == 2
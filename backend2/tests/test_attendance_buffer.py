@@ -0,0 +1,115 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base
+from app.models.attendance import Attendance
+from app.services.attendance_buffer import AttendanceBuffer
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def _buffer(tmp_path, **kwargs):
+    return AttendanceBuffer(journal_dir=str(tmp_path), fsync=False, **kwargs)
+
+def _rows(db):
+    db.expire_all()
+    return sorted((a.session_id, a.user_id) for a in db.query(Attendance).all())
+
+def test_marks_are_deduplicated_and_flushed_in_one_batch(db, tmp_path):
+    buffer = _buffer(tmp_path)
+    assert buffer.mark(db, 1, [10, 11]) == {10, 11}
+    assert buffer.mark(db, 1, [11, 12]) == {12}
+    assert buffer.mark(db, 2, [10]) == {10}
+    assert _rows(db) == []  # acknowledged, not written yet
+
+    assert buffer.flush(db) == 4
+    assert _rows(db) == [(1, 10), (1, 11), (1, 12), (2, 10)]
+    assert buffer.pending_count == 0
+    assert list(tmp_path.iterdir()) == []  # committed journals are deleted
+
+def test_rows_already_in_database_are_reported_and_ignored(db, tmp_path):
+    first = _buffer(tmp_path)
+    first.mark(db, 1, [10])
+    first.flush(db)
+
+    other_worker = _buffer(tmp_path / "other")
+    assert other_worker.mark(db, 1, [10, 11]) == {11}
+    # A mark committed by another worker after this one loaded the session
+    db.add(Attendance(session_id=1, user_id=12, status="present"))
+    db.commit()
+    assert other_worker.mark(db, 1, [12]) == {12}
+    assert other_worker.flush(db) == 2  # duplicate row skipped, not an error
+    assert _rows(db) == [(1, 10), (1, 11), (1, 12)]
+
+def test_journal_of_crashed_process_is_replayed(db, tmp_path):
+    crashed = _buffer(tmp_path)
+    crashed.mark(db, 1, [10, 11])
+    crashed._journal.close()
+    # Pretend the journal belongs to a process that is gone
+    os.replace(crashed._journal_path(), tmp_path / "attendance-999999999-0123abcd.journal")
+    with open(tmp_path / "attendance-999999999-0123abcd.journal", "a") as journal:
+        journal.write('{"session_id": 1, "user_')  # torn last line
+
+    assert _buffer(tmp_path).recover(db) == 2
+    assert _rows(db) == [(1, 10), (1, 11)]
+    assert list(tmp_path.iterdir()) == []
+
+def test_restart_with_the_same_pid_replays_the_crashed_journal(db, tmp_path):
+    crashed = _buffer(tmp_path)
+    crashed.mark(db, 1, [10, 11])
+    crashed._journal.close()  # killed before flushing
+
+    # Restarted container: same pid (PID 1), new process
+    restarted = _buffer(tmp_path)
+    assert restarted.owner != crashed.owner
+    restarted.mark(db, 1, [12])
+    assert restarted.recover(db) == 2
+    assert restarted.flush(db) == 1
+    assert _rows(db) == [(1, 10), (1, 11), (1, 12)]
+    assert list(tmp_path.iterdir()) == []
+
+def test_failed_flush_keeps_marks_and_journal(db, tmp_path, monkeypatch):
+    buffer = _buffer(tmp_path)
+    buffer.mark(db, 1, [10])
+
+    def fail(db, rows):
+        raise RuntimeError("database is down")
+    monkeypatch.setattr(buffer, "_insert", fail)
+    with pytest.raises(RuntimeError):
+        buffer.flush(db)
+    assert buffer.pending_count == 1
+    assert len(list(tmp_path.glob("*.sealed"))) == 1
+
+    monkeypatch.undo()
+    buffer.mark(db, 1, [11])
+    assert buffer.flush(db) == 2
+    assert _rows(db) == [(1, 10), (1, 11)]
+    assert list(tmp_path.iterdir()) == []
+
+def test_failed_flush_keeps_dedupe_state_of_idle_sessions(db, tmp_path, monkeypatch):
+    monkeypatch.setattr("app.services.attendance_buffer.SESSION_IDLE_SECONDS", -1)
+    buffer = _buffer(tmp_path)
+    buffer.mark(db, 1, [10])
+
+    def fail(db, rows):
+        raise RuntimeError("database is down")
+    monkeypatch.setattr(buffer, "_insert", fail)
+    with pytest.raises(RuntimeError):
+        buffer.flush(db)
+    assert buffer.mark(db, 1, [10]) == set()  # still known as marked
+    assert buffer.pending_count == 1
+
+def test_disabled_buffer_writes_through(db, tmp_path):
+    buffer = _buffer(tmp_path, enabled=False)
+    assert buffer.mark(db, 1, [10]) == {10}
+    assert _rows(db) == [(1, 10)]
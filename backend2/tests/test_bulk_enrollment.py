@@ -0,0 +1,158 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base
+from app.models.user import User, UserRole
+from app.services import bulk_enrollment
+from app.services.bulk_enrollment import (
+    EnrollmentItem, embed_photos, enroll, read_manifest, resolve_users, scan_directory, write_embeddings
+)
+from app.services.embedding_codec import decode_embedding, embedding_model_version, encode_embedding
+
+
+class FakeService:
+    """
+    Reads photos written by _photo: b"face:<value>" is a face of that colour
+    (too dark below 16), anything else has no face. Embeds a crop as its
+    mean colour.
+    """
+    model_version = 4
+
+    def detect_faces(self, image_data, visualization="none", max_faces=None):
+        kind, _, value = image_data.decode().partition(":")
+        if kind != "face":
+            return [], None, [], "No face detected in image"
+        return [np.full((40, 40, 3), int(value), dtype=np.uint8)], None, [(0, 0, 40, 40)], None
+
+    def assess_face_quality(self, face):
+        if face.mean() < 16:
+            return {"reason": "too_dark", "message": "Face is too dark"}
+        return None
+
+    def embed_faces(self, crops):
+        return np.stack([crop.reshape(-1, 3).mean(axis=0) for crop in crops]).astype(np.float32)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+@pytest.fixture
+def fake_workers(monkeypatch):
+    """Run the worker pool as threads sharing one FakeService."""
+    def init_worker():
+        bulk_enrollment._worker_face_service = FakeService()
+    monkeypatch.setattr(bulk_enrollment, "ProcessPoolExecutor", ThreadPoolExecutor)
+    monkeypatch.setattr(bulk_enrollment, "_init_worker", init_worker)
+    init_worker()
+
+def _add_user(db, user_id, role=UserRole.STUDENT):
+    db.add(User(user_id=user_id, name=f"N{user_id}", prenom="P", email=f"U{user_id}@Univ.edu",
+                password_hash="x", role=role))
+    db.commit()
+
+def _photo(tmp_path, name, content):
+    path = tmp_path / name
+    path.write_bytes(content)
+    return str(path)
+
+def test_scan_directory_uses_file_stem_as_key(tmp_path):
+    (tmp_path / "1234.jpg").write_bytes(b"")
+    (tmp_path / "nested").mkdir()
+    (tmp_path / "nested" / "jane.doe@univ.edu.png").write_bytes(b"")
+    (tmp_path / "notes.txt").write_text("ignored")
+
+    items = scan_directory(str(tmp_path))
+    assert sorted(item.key for item in items) == ["1234", "jane.doe@univ.edu"]
+
+def test_manifest_resolves_relative_paths(tmp_path):
+    manifest = tmp_path / "photos.csv"
+    manifest.write_text("path,email\nphotos/a.jpg,a@univ.edu\n/abs/b.jpg, b@univ.edu \n")
+
+    first, second = read_manifest(str(manifest))
+    assert first.path == str(tmp_path / "photos" / "a.jpg")
+    assert first.key == "a@univ.edu"
+    assert second.path == "/abs/b.jpg"
+    assert second.key == "b@univ.edu"
+
+def test_resolve_users_matches_students_by_id_or_email(db):
+    _add_user(db, 1)
+    _add_user(db, 2)
+    _add_user(db, 3, role=UserRole.TEACHER)
+    items = [
+        EnrollmentItem("1.jpg", "1"),
+        EnrollmentItem("2.jpg", "u2@univ.EDU"),
+        EnrollmentItem("3.jpg", "3"),
+        EnrollmentItem("9.jpg", "9"),
+    ]
+
+    failures = resolve_users(db, items)
+    assert [item.user_id for item in items] == [1, 2, None, None]
+    assert [(failure.key, failure.reason) for failure in failures] == [("3", "unknown student"), ("9", "unknown student")]
+
+def test_write_embeddings_tags_model_version_and_keeps_crop(db):
+    _add_user(db, 1)
+    write_embeddings(db, [(1, encode_embedding(np.ones(3, dtype=np.float32), model_version=4), b"crop")])
+
+    user = db.get(User, 1)
+    assert user.face_embedding_version == 4
+    assert embedding_model_version(user.face_embedding) == 4
+    assert np.allclose(decode_embedding(user.face_embedding), 1.0)
+    assert user.face_crop == b"crop"
+
+def test_embed_photos_reports_each_failure(tmp_path, fake_workers):
+    items = [
+        EnrollmentItem(_photo(tmp_path, "1.jpg", b"face:30"), "1"),
+        EnrollmentItem(_photo(tmp_path, "2.jpg", b"face:8"), "2"),
+        EnrollmentItem(_photo(tmp_path, "3.jpg", b"landscape"), "3"),
+        EnrollmentItem(str(tmp_path / "missing.jpg"), "4"),
+    ]
+
+    results = {item.key: (embedding, crop, reason) for item, embedding, crop, reason in embed_photos(items)}
+    embedding, crop, reason = results["1"]
+    assert reason is None and crop is not None
+    assert np.allclose(decode_embedding(embedding), 30.0, atol=0.1)
+    assert results["2"][2] == "too_dark: Face is too dark"
+    assert results["3"][2] == "No face detected in image"
+    assert results["4"][2].startswith("unreadable file")
+    assert embed_photos(items[1:2], check_quality=False)[0][3] is None
+
+def test_enroll_writes_embeddings_in_batches(db, tmp_path, fake_workers):
+    for user_id in (1, 2, 3):
+        _add_user(db, user_id)
+    items = [
+        EnrollmentItem(_photo(tmp_path, "1.jpg", b"face:100"), "1"),
+        EnrollmentItem(_photo(tmp_path, "2.jpg", b"face:200"), "u2@univ.edu"),
+        EnrollmentItem(_photo(tmp_path, "3.jpg", b"landscape"), "3"),
+        EnrollmentItem(_photo(tmp_path, "9.jpg", b"face:90"), "9"),
+    ]
+    progress = []
+
+    enrolled, failures = enroll(db, items, workers=2, chunk_size=1, commit_every=1,
+                                progress=lambda done, total: progress.append((done, total)))
+    assert enrolled == 2
+    assert sorted(failure.key for failure in failures) == ["3", "9"]
+    assert progress[-1] == (3, 3)
+
+    db.expire_all()
+    stored = {user.user_id: user.face_embedding for user in db.query(User).all()}
+    assert np.allclose(decode_embedding(stored[1]), 100.0, atol=0.1)
+    assert np.allclose(decode_embedding(stored[2]), 200.0, atol=0.1)
+    assert stored[3] is None
+
+def test_enroll_dry_run_writes_nothing(db, tmp_path, fake_workers):
+    _add_user(db, 1)
+    items = [EnrollmentItem(_photo(tmp_path, "1.jpg", b"face:100"), "1")]
+
+    assert enroll(db, items, workers=1, dry_run=True) == (1, [])
+    db.expire_all()
+    assert db.get(User, 1).face_embedding is None
@@ -0,0 +1,42 @@
+import json
+
+import numpy as np
+import pytest
+
+from app.services.embedding_codec import (
+    HEADER,
+    decode_embedding,
+    encode_embedding,
+    embedding_model_version,
+    read_header,
+)
+
+
+def test_float32_round_trip_is_zero_copy():
+    embedding = np.random.default_rng(0).normal(size=128).astype(np.float32)
+    blob = encode_embedding(embedding, model_version=7, dtype='float32')
+
+    assert len(blob) == HEADER.size + 128 * 4
+    decoded = decode_embedding(blob)
+    assert np.array_equal(decoded, embedding)
+    assert not decoded.flags.writeable  # view over the stored bytes
+    assert embedding_model_version(blob) == 7
+
+def test_float16_round_trip():
+    embedding = np.linspace(-1, 1, 128, dtype=np.float32)
+    blob = encode_embedding(embedding, model_version=4, dtype='float16')
+
+    assert read_header(blob).dimension == 128
+    decoded = decode_embedding(blob)
+    assert decoded.dtype == np.float32
+    assert np.allclose(decoded, embedding, atol=1e-3)
+
+def test_legacy_json_is_still_readable():
+    blob = json.dumps([0.25, -0.5, 1.0]).encode('utf-8')
+    assert np.array_equal(decode_embedding(blob), np.array([0.25, -0.5, 1.0], dtype=np.float32))
+    assert embedding_model_version(blob) is None
+
+def test_truncated_blob_is_rejected():
+    blob = encode_embedding(np.ones(16, dtype=np.float32), model_version=4)
+    with pytest.raises(ValueError):
+        decode_embedding(blob[:-4])
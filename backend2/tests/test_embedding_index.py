@@ -0,0 +1,49 @@
+import time
+
+import numpy as np
+
+from app.services.embedding_index import ClassEmbeddingIndex
+
+
+def _make_index(matrix):
+    matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+    return ClassEmbeddingIndex(
+        class_id=1,
+        user_ids=np.arange(100, 100 + len(matrix), dtype=np.int64),
+        names=[f"Student {i}" for i in range(len(matrix))],
+        matrix=matrix,
+        sq_norms=np.einsum('ij,ij->i', matrix, matrix),
+        loaded_at=time.monotonic()
+    )
+
+def test_nearest_matches_brute_force():
+    rng = np.random.default_rng(0)
+    matrix = rng.normal(size=(300, 128)).astype(np.float32)
+    matrix /= np.linalg.norm(matrix, axis=1, keepdims=True)
+    index = _make_index(matrix)
+
+    query = matrix[42] + rng.normal(scale=0.01, size=128).astype(np.float32)
+    row, distance = index.nearest(query)
+
+    expected = np.linalg.norm(matrix - query, axis=1)
+    assert row == int(np.argmin(expected))
+    assert abs(distance - float(expected.min())) < 1e-4
+
+def test_nearest_on_empty_index():
+    index = _make_index(np.empty((0, 0)))
+    row, distance = index.nearest(np.zeros(128, dtype=np.float32))
+    assert row is None
+    assert distance == float('inf')
+
+def test_nearest_many_matches_single_queries():
+    rng = np.random.default_rng(1)
+    matrix = rng.normal(size=(500, 64)).astype(np.float32)
+    index = _make_index(matrix)
+    queries = matrix[[3, 250, 499]] + rng.normal(scale=0.01, size=(3, 64)).astype(np.float32)
+
+    rows, distances = index.nearest_many(queries)
+
+    for query, row, distance in zip(queries, rows, distances):
+        expected_row, expected_distance = index.nearest(query)
+        assert row == expected_row
+        assert abs(distance - expected_distance) < 1e-4
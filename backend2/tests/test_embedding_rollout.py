@@ -0,0 +1,109 @@
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base
+from app.models.user import User
+from app.services.embedding_codec import decode_embedding, encode_embedding
+from app.services.embedding_rollout import EmbeddingRollout, encode_face_crop
+from app.services.reembedding import reembed_all
+
+
+class FakeService:
+    """Embeds a crop as its mean colour, so results are easy to check."""
+
+    def embed_faces(self, crops):
+        return np.stack([crop.reshape(-1, 3).mean(axis=0) for crop in crops]).astype(np.float32)
+
+
+@pytest.fixture
+def db():
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    yield session
+    session.close()
+
+def _enroll(db, rollout, user_id, value, version=4):
+    user = User(user_id=user_id, name=f"N{user_id}", prenom="P", email=f"u{user_id}@univ.edu", password_hash="x")
+    crop = np.full((40, 40, 3), value, dtype=np.uint8)
+    rollout.store(user, encode_embedding(np.full(3, value, dtype=np.float32), model_version=version), version,
+                  encode_face_crop(crop))
+    db.add(user)
+    db.commit()
+
+def _served(db, rollout):
+    column = rollout.embedding_column().label("embedding")
+    rows = db.query(User.user_id, column).filter(rollout.has_embedding()).order_by(User.user_id).all()
+    return {row.user_id: decode_embedding(row.embedding) for row in rows}
+
+def test_rollout_serves_old_model_until_reembedded(db, tmp_path):
+    rollout = EmbeddingRollout(current_version=4, next_version=5)
+    for user_id in (1, 2, 3):
+        _enroll(db, rollout, user_id, 10 * user_id)
+
+    assert rollout.remaining(db) == 3
+    assert not rollout.check_complete(db, force=True)
+
+    checkpoint_path = str(tmp_path / "checkpoint.json")
+    checkpoint = reembed_all(db, FakeService(), rollout, checkpoint_path, batch_size=2, sleep_seconds=0, max_batches=1)
+    assert checkpoint.reembedded == 2
+    assert rollout.remaining(db) == 1
+    # Still serving v4 embeddings for everyone
+    assert set(_served(db, rollout)) == {1, 2, 3}
+
+    # Resumes after the checkpoint
+    checkpoint = reembed_all(db, FakeService(), rollout, checkpoint_path, batch_size=2, sleep_seconds=0)
+    assert checkpoint.reembedded == 3
+    assert rollout.check_complete(db, force=True)
+
+    rollout.serving_version = 5
+    served = _served(db, rollout)
+    assert set(served) == {1, 2, 3}
+    assert np.allclose(served[2], 20, atol=1)
+
+def test_enrollment_with_old_model_clears_stale_next_embedding(db, tmp_path):
+    rollout = EmbeddingRollout(current_version=4, next_version=5)
+    _enroll(db, rollout, 1, 10)
+    reembed_all(db, FakeService(), rollout, str(tmp_path / "checkpoint.json"), sleep_seconds=0)
+    assert rollout.remaining(db) == 0
+
+    user = db.get(User, 1)
+    rollout.store(user, encode_embedding(np.zeros(3), model_version=4), 4, encode_face_crop(np.zeros((40, 40, 3), np.uint8)))
+    db.commit()
+    assert user.face_embedding_next is None
+    assert rollout.remaining(db) == 1
+
+def test_promote_moves_next_embeddings(db, tmp_path):
+    rollout = EmbeddingRollout(current_version=4, next_version=5)
+    _enroll(db, rollout, 1, 10)
+    reembed_all(db, FakeService(), rollout, str(tmp_path / "checkpoint.json"), sleep_seconds=0)
+
+    assert rollout.promote(db, 5) == 1
+    db.expire_all()
+    user = db.get(User, 1)
+    assert user.face_embedding_version == 5
+    assert user.face_embedding_next is None
+
+    promoted = EmbeddingRollout(current_version=5, next_version=None)
+    assert set(_served(db, promoted)) == {1}
+
+def test_legacy_user_without_crop_blocks_the_switch(db, tmp_path):
+    rollout = EmbeddingRollout(current_version=4, next_version=5)
+    _enroll(db, rollout, 1, 10)
+    legacy = User(user_id=2, name="N2", prenom="P", email="u2@univ.edu", password_hash="x")
+    rollout.store(legacy, encode_embedding(np.full(3, 20, dtype=np.float32), model_version=4), 4)
+    db.add(legacy)
+    db.commit()
+
+    reembed_all(db, FakeService(), rollout, str(tmp_path / "checkpoint.json"), batch_size=10, sleep_seconds=0)
+    assert rollout.remaining(db) == 0
+    assert rollout.status(db)["missing_crops"] == 1
+    assert not rollout.check_complete(db, force=True)
+    # Still matched with the old model
+    assert set(_served(db, rollout)) == {1, 2}
+
+    forced = EmbeddingRollout(current_version=4, next_version=5, allow_missing_crops=True)
+    assert forced.check_complete(db, force=True)
@@ -0,0 +1,32 @@
+import cv2
+import numpy as np
+
+from app.services.face_preprocessing import preprocess_faces, preprocess_faces_blob
+
+
+def _crops():
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 256, size=shape, dtype=np.uint8) for shape in [(90, 80, 3), (200, 210, 3), (160, 160, 3)]]
+
+def test_matches_per_crop_preprocessing():
+    crops = _crops()
+    expected = np.stack([cv2.resize(crop, (160, 160)).astype('float32') / 255.0 for crop in crops])
+
+    batch = preprocess_faces(crops)
+    assert batch.shape == (3, 160, 160, 3)
+    assert batch.dtype == np.float32
+    assert np.allclose(batch, expected, atol=1e-6)
+    assert np.allclose(preprocess_faces_blob(crops), expected, atol=1e-6)
+
+def test_reuses_thread_buffer():
+    crops = _crops()
+    first = preprocess_faces(crops)
+    second = preprocess_faces(crops[:1])
+    assert np.shares_memory(first, second)
+
+def test_explicit_output_is_owned():
+    crops = _crops()
+    out = np.empty((3, 160, 160, 3), dtype=np.float32)
+    batch = preprocess_faces(crops, out=out)
+    assert np.shares_memory(batch, out)
+    assert not np.shares_memory(batch, preprocess_faces(crops))
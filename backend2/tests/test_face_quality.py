@@ -0,0 +1,34 @@
+import cv2
+import numpy as np
+
+from app.services.face_recognition_service import FaceRecognitionService
+
+
+def _service():
+    return FaceRecognitionService(load_models=False)
+
+def _textured_face(size=(120, 120), level=128):
+    rng = np.random.default_rng(0)
+    noise = rng.integers(-60, 60, size=size + (3,))
+    return np.clip(level + noise, 0, 255).astype(np.uint8)
+
+def test_sharp_well_lit_face_passes():
+    assert _service().assess_face_quality(_textured_face()) is None
+
+def test_rejects_small_face():
+    issue = _service().assess_face_quality(_textured_face(size=(20, 20)))
+    assert issue['reason'] == 'too_small'
+
+def test_rejects_dark_face():
+    issue = _service().assess_face_quality(np.full((120, 120, 3), 10, dtype=np.uint8))
+    assert issue['reason'] == 'too_dark'
+
+def test_rejects_blurry_face():
+    blurred = cv2.GaussianBlur(_textured_face(), (31, 31), 10)
+    issue = _service().assess_face_quality(blurred)
+    assert issue['reason'] == 'blurry'
+    assert issue['value'] < issue['threshold']
+
+def test_rejects_turned_face():
+    issue = _service().assess_face_quality(_textured_face(size=(160, 60)))
+    assert issue['reason'] == 'pose'
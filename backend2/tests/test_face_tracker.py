@@ -0,0 +1,78 @@
+import numpy as np
+
+from app.services.face_tracker import FaceTracker, iou_matrix
+
+
+def _tracker(**overrides):
+    options = dict(iou_threshold=0.3, max_idle_seconds=60.0, confident_distance=0.45, reverify_frames=30)
+    options.update(overrides)
+    return FaceTracker(**options)
+
+def test_iou_matrix():
+    boxes = np.array([[0, 0, 10, 10], [100, 100, 10, 10]])
+    overlaps = iou_matrix(boxes, np.array([[0, 0, 10, 10], [5, 0, 10, 10]]))
+    assert overlaps.shape == (2, 2)
+    assert abs(overlaps[0, 0] - 1.0) < 1e-6
+    assert abs(overlaps[0, 1] - 50 / 150) < 1e-6
+    assert overlaps[1].max() == 0.0
+
+def test_confident_track_is_not_embedded_again():
+    tracker = _tracker()
+    [track] = tracker.update(np.array([[100, 100, 80, 80]]))
+    assert tracker.needs_embedding(track)
+    tracker.assign(track, 7, "Student 7", 0.3)
+
+    # Same person moved slightly
+    [same] = tracker.update(np.array([[104, 102, 80, 80]]))
+    assert same is track
+    assert not tracker.needs_embedding(same)
+
+def test_new_and_unconfident_tracks_need_embedding():
+    tracker = _tracker()
+    [first] = tracker.update(np.array([[100, 100, 80, 80]]))
+    tracker.assign(first, None, None, 0.9)
+
+    moved, newcomer = tracker.update(np.array([[102, 100, 80, 80], [400, 100, 80, 80]]))
+    assert moved is first and tracker.needs_embedding(moved)
+    assert newcomer is not first and tracker.needs_embedding(newcomer)
+
+def test_confident_track_is_reverified_periodically():
+    tracker = _tracker(reverify_frames=2)
+    [track] = tracker.update(np.array([[100, 100, 80, 80]]))
+    tracker.assign(track, 7, "Student 7", 0.3)
+    tracker.update(np.array([[100, 100, 80, 80]]))
+    assert not tracker.needs_embedding(track)
+    tracker.update(np.array([[100, 100, 80, 80]]))
+    assert tracker.needs_embedding(track)
+
+def test_idle_tracks_expire():
+    tracker = _tracker(max_idle_seconds=-1.0)
+    [track] = tracker.update(np.array([[100, 100, 80, 80]]))
+    tracker.assign(track, 7, "Student 7", 0.3)
+    [again] = tracker.update(np.array([[100, 100, 80, 80]]))
+    assert again is not track
+
+def test_face_swap_at_same_box_after_gap_is_reembedded():
+    tracker = _tracker()
+    [track] = tracker.update(np.array([[100, 100, 80, 80]]))
+    tracker.assign(track, 7, "Student 7", 0.3)
+
+    # Student 7 walks away, the next one steps into the same spot
+    tracker.update(np.empty((0, 4)))
+    [newcomer] = tracker.update(np.array([[102, 100, 80, 80]]))
+    assert newcomer is track
+    assert tracker.needs_embedding(newcomer)
+    tracker.assign(newcomer, 8, "Student 8", 0.3)
+    [same] = tracker.update(np.array([[102, 100, 80, 80]]))
+    assert not tracker.needs_embedding(same)
+
+def test_face_swap_without_gap_is_caught_by_scene_change():
+    tracker = _tracker(scene_change_threshold=12.0)
+    first_scene = np.full((16, 16), 80, dtype=np.int16)
+    [track] = tracker.update(np.array([[100, 100, 80, 80]]), first_scene)
+    tracker.assign(track, 7, "Student 7", 0.3)
+
+    [same] = tracker.update(np.array([[100, 100, 80, 80]]), first_scene + 3)
+    assert not tracker.needs_embedding(same)
+    [swapped] = tracker.update(np.array([[100, 100, 80, 80]]), first_scene + 40)
+    assert swapped is track and tracker.needs_embedding(swapped)
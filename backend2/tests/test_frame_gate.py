@@ -0,0 +1,40 @@
+import numpy as np
+
+from app.services.frame_gate import FrameGate
+
+
+def _signature(value):
+    return np.full((16, 16), value, dtype=np.int16)
+
+def test_replays_result_for_unchanged_frame():
+    gate = FrameGate(diff_threshold=6.0, hold_seconds=60.0)
+    assert gate.check("kiosk", 1, _signature(100)) is None
+    gate.record("kiosk", "attendance_no_match", {"message": "No matching student found"})
+
+    assert gate.check("kiosk", 1, _signature(102)) == (
+        "attendance_no_match", {"message": "No matching student found"}
+    )
+
+def test_changed_scene_runs_pipeline():
+    gate = FrameGate(diff_threshold=6.0, hold_seconds=60.0)
+    gate.check("kiosk", 1, _signature(100))
+    gate.record("kiosk", "attendance_no_match", {})
+
+    assert gate.check("kiosk", 1, _signature(140)) is None
+    # The new frame is the reference now and has no result yet
+    assert gate.check("kiosk", 1, _signature(140)) is None
+
+def test_result_expires_and_is_scoped_to_session():
+    gate = FrameGate(diff_threshold=6.0, hold_seconds=0.0)
+    gate.check("kiosk", 1, _signature(100))
+    gate.record("kiosk", "attendance_no_match", {})
+    assert gate.check("kiosk", 1, _signature(100)) is None
+
+    gate = FrameGate(diff_threshold=6.0, hold_seconds=60.0)
+    gate.check("kiosk", 1, _signature(100))
+    gate.record("kiosk", "attendance_no_match", {})
+    assert gate.check("kiosk", 2, _signature(100)) is None
+
+def test_undecodable_frame_is_never_gated():
+    gate = FrameGate(diff_threshold=6.0, hold_seconds=60.0)
+    assert gate.check("kiosk", 1, None) is None
@@ -0,0 +1,43 @@
+import asyncio
+
+import numpy as np
+
+from app.services.inference_batcher import EmbeddingBatcher
+
+
+def test_concurrent_submissions_share_one_model_call():
+    calls = []
+
+    def predict_batch(batch):
+        calls.append(len(batch))
+        return batch.reshape(len(batch), -1)[:, :2] * 2
+
+    async def scenario():
+        batcher = EmbeddingBatcher(predict_batch, max_batch_size=16, max_wait_ms=20)
+        faces = [np.full((4, 4, 3), i, dtype=np.float32) for i in range(10)]
+        results = await asyncio.gather(*(batcher.submit(face) for face in faces))
+        await batcher.close()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert calls == [10]
+    for i, result in enumerate(results):
+        assert np.array_equal(result, [2 * i, 2 * i])
+
+def test_model_errors_reach_every_caller():
+    def predict_batch(batch):
+        raise RuntimeError("model failed")
+
+    async def scenario():
+        batcher = EmbeddingBatcher(predict_batch, max_wait_ms=5)
+        results = await asyncio.gather(
+            batcher.submit(np.zeros((2, 2, 3))),
+            batcher.submit(np.zeros((2, 2, 3))),
+            return_exceptions=True
+        )
+        await batcher.close()
+        return results
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(result, RuntimeError) for result in results)
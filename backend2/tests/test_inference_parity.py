@@ -0,0 +1,57 @@
+"""
+Accuracy parity of the exported TFLite/ONNX models against the Keras model.
+
+Skipped when TensorFlow or the trained Keras model are not available.
+"""
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from app.services.inference_backend import KerasBackend, OnnxBackend, TFLiteBackend, default_model_path
+from app.services.model_export import export_onnx, export_tflite, load_face_crops, preprocess_crops
+
+KERAS_MODEL = default_model_path("keras")
+SAMPLE_DIR = Path(__file__).parent.parent.parent / "backend" / "ai" / "dataset"
+
+pytestmark = pytest.mark.skipif(not KERAS_MODEL.exists(), reason="trained Keras model not available")
+
+
+@pytest.fixture(scope="module")
+def sample_faces():
+    crops = load_face_crops(str(SAMPLE_DIR), limit=16)
+    # Pad with deterministic synthetic crops so batching is exercised too
+    rng = np.random.default_rng(0)
+    crops += [rng.integers(0, 256, size=(120, 100, 3), dtype=np.uint8) for _ in range(8 - min(len(crops), 8))]
+    return preprocess_crops(crops)
+
+@pytest.fixture(scope="module")
+def keras_embeddings(sample_faces):
+    return KerasBackend(str(KERAS_MODEL)).predict(sample_faces)
+
+def _cosine(a, b):
+    return np.sum(a * b, axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+@pytest.mark.parametrize("quantize, min_cosine", [("none", 0.9999), ("float16", 0.999), ("dynamic", 0.98)])
+def test_tflite_matches_keras(tmp_path, sample_faces, keras_embeddings, quantize, min_cosine):
+    path = export_tflite(str(KERAS_MODEL), str(tmp_path / "model.tflite"), quantize=quantize)
+    embeddings = TFLiteBackend(str(path)).predict(sample_faces)
+
+    assert embeddings.shape == keras_embeddings.shape
+    assert _cosine(embeddings, keras_embeddings).min() >= min_cosine
+
+def test_tflite_int8_matches_keras(tmp_path, sample_faces, keras_embeddings):
+    path = export_tflite(str(KERAS_MODEL), str(tmp_path / "model.tflite"), quantize="int8", calibration_faces=sample_faces)
+    embeddings = TFLiteBackend(str(path)).predict(sample_faces)
+
+    assert _cosine(embeddings, keras_embeddings).min() >= 0.95
+
+def test_onnx_matches_keras(tmp_path, sample_faces, keras_embeddings):
+    pytest.importorskip("tf2onnx")
+    pytest.importorskip("onnxruntime")
+    path = export_onnx(str(KERAS_MODEL), str(tmp_path / "model.onnx"))
+    embeddings = OnnxBackend(str(path)).predict(sample_faces)
+
+    assert np.allclose(embeddings, keras_embeddings, atol=1e-4)
@@ -0,0 +1,101 @@
+"""
+Data pipeline, losses and export of the training pipeline.
+
+Skipped when TensorFlow is not installed.
+"""
+import cv2
+import numpy as np
+import pytest
+
+tf = pytest.importorskip("tensorflow")
+
+from app.services.model_handler import load_face_model
+from app.services.model_training import (
+    batch_hard_triplet_loss,
+    build_embedding_model,
+    cache_fingerprint,
+    export_embedding_model,
+    parse_batch_schedule,
+    pk_batches,
+    scan_identities,
+    split_identities,
+    verification_scores,
+)
+
+
+@pytest.fixture
+def face_dir(tmp_path):
+    rng = np.random.default_rng(0)
+    for person, photos in (("alice", 3), ("bob", 2), ("carol", 1), ("dave", 2)):
+        (tmp_path / person).mkdir()
+        for i in range(photos):
+            image = rng.integers(0, 256, size=(120, 100, 3), dtype=np.uint8)
+            cv2.imwrite(str(tmp_path / person / f"{i}.jpg"), image)
+    return tmp_path
+
+def test_scan_and_split_by_identity(face_dir):
+    dataset = scan_identities(str(face_dir), min_images=2)
+    assert dataset.identities == ["alice", "bob", "dave"]
+    assert len(dataset.paths) == 7
+
+    train, val = split_identities(dataset, validation_fraction=0.34, seed=1)
+    assert train.num_classes == 2 and val.num_classes == 1
+    assert not set(train.identities) & set(val.identities)
+    assert set(train.labels) == {0, 1}
+
+def test_pk_batches_hold_k_photos_per_identity(face_dir):
+    dataset = scan_identities(str(face_dir))
+    images, labels = next(iter(pk_batches(dataset, identities_per_batch=2, images_per_identity=3, seed=0)))
+    assert images.shape == (6, 160, 160, 3)
+    assert images.dtype == tf.float32
+    # Identities with fewer photos than K are repeated to fill their slots
+    for start in (0, 3):
+        assert len(set(labels.numpy()[start:start + 3])) == 1
+
+def test_cache_names_change_with_the_photos_behind_them(face_dir):
+    dataset = scan_identities(str(face_dir))
+    fingerprint = cache_fingerprint(dataset.paths)
+    assert cache_fingerprint(list(dataset.paths)) == fingerprint
+
+    # Another split or labelling reorders or changes the files of a cache
+    assert cache_fingerprint(dataset.paths[::-1]) != fingerprint
+    assert cache_fingerprint(dataset.paths[1:]) != fingerprint
+
+    # A new student directory shifts every later label
+    (face_dir / "aaron").mkdir()
+    cv2.imwrite(str(face_dir / "aaron" / "0.jpg"), np.zeros((120, 100, 3), dtype=np.uint8))
+    relabelled = scan_identities(str(face_dir))
+    first = relabelled.paths_by_class()[0]
+    assert cache_fingerprint(first) != cache_fingerprint(dataset.paths_by_class()[0])
+
+def test_batch_hard_triplet_loss_uses_hardest_pairs():
+    embeddings = tf.constant([[1.0, 0.0], [0.0, 1.0], [1.0, 0.0], [0.6, 0.8]])
+    labels = tf.constant([0, 0, 1, 1])
+    # Anchor 0: hardest positive at sqrt(2), hardest negative at 0 -> loss sqrt(2) + margin
+    loss = batch_hard_triplet_loss(labels, embeddings, margin=0.2)
+    assert float(loss) > 1.0
+
+    separated = tf.constant([[1.0, 0.0], [1.0, 0.0], [-1.0, 0.0], [-1.0, 0.0]])
+    assert float(batch_hard_triplet_loss(labels, separated, margin=0.2)) == pytest.approx(0.0, abs=1e-4)
+
+def test_verification_scores_find_separating_threshold():
+    embeddings = np.array([[1, 0], [0.99, 0.14], [0, 1], [0.14, 0.99]], dtype=np.float32)
+    scores = verification_scores(embeddings, np.array([0, 0, 1, 1]))
+    assert scores["accuracy"] == pytest.approx(1.0)
+    assert 0.14 <= scores["threshold"] < 1.0
+
+def test_parse_batch_schedule():
+    phases = parse_batch_schedule("16x4:10, 32x2:5")
+    assert [(p.identities_per_batch, p.images_per_identity, p.epochs) for p in phases] == [(16, 4, 10), (32, 2, 5)]
+    assert phases[1].batch_size == 64
+
+def test_exported_model_loads_like_the_service_model(tmp_path):
+    model = build_embedding_model(embedding_dim=32, width=0.35)
+    path = export_embedding_model(model, str(tmp_path / "model.keras"))
+
+    faces = np.random.default_rng(0).random((2, 160, 160, 3), dtype=np.float32)
+    loaded = load_face_model(str(path))
+    embeddings = loaded.predict(faces, verbose=0)
+    assert embeddings.shape == (2, 32)
+    assert np.allclose(np.linalg.norm(embeddings, axis=1), 1.0, atol=1e-4)
+    assert np.allclose(embeddings, model.predict(faces, verbose=0), atol=1e-5)
@@ -0,0 +1,50 @@
+import base64
+import re
+
+import pytest
+
+pytest.importorskip("qrcode")
+
+from app.services.qr_rendering import (  # noqa: E402
+    BORDER, QrRenderCache, qr_matrix, qr_version, render_qr, render_qr_matrix, render_qr_svg
+)
+from app.services.qr_tokens import new_random_token, qr_signer  # noqa: E402
+
+
+def test_compact_tokens_fit_small_versions():
+    legacy = str({"session_id": 12345, "token": "x" * 43, "expires_at": "2024-01-01T08:15:00.123456"})
+    assert qr_version(qr_signer.issue(12345)) <= 2
+    assert qr_version(new_random_token()) <= 2
+    assert qr_version(legacy) > 4
+
+def test_matrix_and_svg_describe_the_same_modules():
+    token = qr_signer.issue(7)
+    matrix = qr_matrix(token)
+    rows = render_qr_matrix(token).split("\n")
+    assert rows == ["".join("1" if dark else "0" for dark in row) for row in matrix]
+
+    svg = render_qr_svg(token)
+    size = len(matrix) + 2 * BORDER
+    assert f'viewBox="0 0 {size} {size}"' in svg
+    runs = re.findall(r"M(\d+) (\d+)h(\d+)", svg)
+    assert sum(int(length) for _, _, length in runs) == sum(row.count("1") for row in rows)
+    for x, y, length in runs:
+        x, y, length = int(x) - BORDER, int(y) - BORDER, int(length)
+        assert rows[y][x:x + length] == "1" * length
+
+def test_render_qr_formats():
+    assert base64.b64decode(render_qr("ABC", "png")).startswith(b"\x89PNG")
+    assert render_qr("ABC", "svg").startswith("<svg")
+    with pytest.raises(ValueError):
+        render_qr("ABC", "gif")
+
+def test_render_cache_evicts_least_recently_used():
+    cache = QrRenderCache(max_entries=2)
+    cache.put("a", "png", "A")
+    cache.put("b", "png", "B")
+    assert cache.get("a", "png") == "A"
+    cache.put("c", "png", "C")
+    assert cache.get("b", "png") is None
+    assert cache.get("a", "svg") is None
+    assert (cache.get("a", "png"), cache.get("c", "png")) == ("A", "C")
+    assert (cache.hits, cache.misses, len(cache)) == (3, 2, 2)
@@ -0,0 +1,149 @@
+import asyncio
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.database import Base
+from app.models.session import QRCodeStatus, Session
+from app.services import qr_rotation as rotation
+from app.services.qr_rendering import render_cache
+from app.services.qr_tokens import qr_signer
+
+
+@pytest.fixture
+def db(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(engine)
+    factory = sessionmaker(bind=engine)
+    monkeypatch.setattr(rotation, "SessionLocal", factory)
+
+    async def run_inline(func, *args, **kwargs):
+        return func(*args, **kwargs)
+    monkeypatch.setattr(rotation, "run_in_db_executor", run_inline)
+    monkeypatch.setattr(rotation, "run_in_qr_executor", run_inline)
+    monkeypatch.setattr(rotation, "render_qr", lambda data, fmt: f"{fmt}:{data}")
+    render_cache.clear()
+
+    session = factory()
+    yield session
+    session.close()
+
+def _add_session(db, session_id, expires_in, session_date=None):
+    db.add(Session(
+        session_id=session_id,
+        class_id=1,
+        session_date=session_date or datetime.utcnow().date(),
+        qr_status=QRCodeStatus.ACTIVE,
+        qr_expires_at=datetime.utcnow() + expires_in
+    ))
+    db.commit()
+
+def _statuses(db):
+    db.expire_all()
+    return {s.session_id: s.qr_status for s in db.query(Session).all()}
+
+def test_expire_sessions_is_one_bulk_update(db):
+    _add_session(db, 1, timedelta(minutes=5))
+    _add_session(db, 2, timedelta(minutes=-1))
+    _add_session(db, 3, timedelta(minutes=5), session_date=datetime.utcnow().date() - timedelta(days=1))
+
+    assert rotation.expire_sessions(db) == 2
+    assert _statuses(db) == {1: QRCodeStatus.ACTIVE, 2: QRCodeStatus.EXPIRED, 3: QRCodeStatus.EXPIRED}
+
+def test_session_days_follow_utc(db, monkeypatch):
+    # Just past midnight UTC, while a server east or west of UTC may still be on another day
+    now = datetime(2030, 1, 2, 0, 10)
+
+    class FrozenDatetime(datetime):
+        @classmethod
+        def utcnow(cls):
+            return now
+    monkeypatch.setattr(rotation, "datetime", FrozenDatetime)
+    for session_id, day in ((1, date(2030, 1, 1)), (2, date(2030, 1, 2))):
+        db.add(Session(session_id=session_id, class_id=1, session_date=day, qr_status=QRCodeStatus.ACTIVE,
+                       qr_expires_at=now))
+    db.commit()
+
+    assert rotation.keep_alive(db, [1, 2]) == 1
+    assert rotation.expire_sessions(db) == 1
+    assert _statuses(db) == {1: QRCodeStatus.EXPIRED, 2: QRCodeStatus.ACTIVE}
+
+def test_tick_pushes_codes_and_keeps_displayed_sessions_alive(db):
+    _add_session(db, 1, timedelta(seconds=-1))  # ran out, but on a screen
+    _add_session(db, 2, timedelta(seconds=-1))  # ran out, nobody watching
+    _add_session(db, 3, timedelta(minutes=5))
+
+    emitted = []
+    async def emit(event, payload, room):
+        emitted.append((event, payload, room))
+
+    scheduler = rotation.QrRotationScheduler()
+    scheduler.bind(emit)
+    scheduler.watch("screen-a", 1)
+    scheduler.watch("screen-b", 1)
+    asyncio.run(scheduler.tick())
+
+    assert _statuses(db) == {1: QRCodeStatus.ACTIVE, 2: QRCodeStatus.EXPIRED, 3: QRCodeStatus.ACTIVE}
+    assert len(emitted) == 1
+    event, payload, room = emitted[0]
+    assert (event, room) == ("session_qr", rotation.qr_room(1, "png"))
+    assert qr_signer.verify(payload["token"]) == 1
+    assert payload["qr_code"] == f"png:{payload['token']}"
+
+def test_tick_renders_each_watched_format_once(db, monkeypatch):
+    _add_session(db, 1, timedelta(minutes=5))
+    renders = []
+    async def render(func, data, fmt):
+        renders.append(fmt)
+        return f"{fmt}:{data}"
+    monkeypatch.setattr(rotation, "run_in_qr_executor", render)
+
+    rooms = []
+    async def emit(event, payload, room):
+        rooms.append(room)
+
+    scheduler = rotation.QrRotationScheduler()
+    scheduler.bind(emit)
+    scheduler.watch("screen-a", 1, "svg")
+    scheduler.watch("screen-b", 1, "svg")
+    scheduler.watch("screen-c", 1, "matrix")
+    asyncio.run(scheduler.tick())
+    asyncio.run(scheduler.current_payload(1, "svg"))  # API poll in the same window
+
+    assert sorted(rooms) == [rotation.qr_room(1, "matrix"), rotation.qr_room(1, "svg")]
+    assert sorted(renders) == ["matrix", "svg"]
+
+def test_tick_closes_sessions_that_ended(db):
+    _add_session(db, 1, timedelta(minutes=5))
+    db.query(Session).update({Session.qr_status: QRCodeStatus.EXPIRED})
+    db.commit()
+
+    emitted = []
+    async def emit(event, payload, room):
+        emitted.append(event)
+
+    scheduler = rotation.QrRotationScheduler()
+    scheduler.bind(emit)
+    scheduler.watch("screen-a", 1)
+    asyncio.run(scheduler.tick())
+
+    assert emitted == ["session_qr_closed"]
+    assert scheduler.watched_sessions == []
+
+def test_forget_drops_screen_from_all_sessions():
+    scheduler = rotation.QrRotationScheduler()
+    scheduler.watch("screen-a", 1)
+    scheduler.watch("screen-a", 2)
+    scheduler.watch("screen-b", 2)
+    scheduler.forget("screen-a")
+    assert scheduler.watched_sessions == [2]
+
+def test_unwatch_returns_watched_format():
+    scheduler = rotation.QrRotationScheduler()
+    scheduler.watch("screen-a", 1, "svg")
+    assert scheduler.unwatch("screen-a", 1) == "svg"
+    assert scheduler.unwatch("screen-a", 1) is None
@@ -0,0 +1,126 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+import app.models  # noqa: F401  (registers every table on Base.metadata)
+from app.crud import session as crud_session
+from app.crud.session import create_session, end_session, mark_attendance, refresh_qr_code
+from app.database import Base
+from app.models.session import Session
+from app.models.user import User
+from app.schemas import SessionCreate
+from app.services.attendance_buffer import AttendanceBuffer
+from app.services.qr_tokens import (
+    SIGNED_PREFIX, ActiveQrTokens, QrTokenSigner, _b32decode, _b32encode, active_qr_tokens, extract_qr_token,
+    new_random_token, qr_signer
+)
+
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    monkeypatch.setattr(crud_session, "attendance_buffer", AttendanceBuffer(journal_dir=str(tmp_path), fsync=False))
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(engine)
+    session = sessionmaker(bind=engine)()
+    session.add(User(user_id=1, name="N", prenom="P", email="s@univ.edu", password_hash="x"))
+    session.commit()
+    active_qr_tokens.clear()
+    yield session
+    session.close()
+
+def _scan_text(session):
+    return str({"session_id": session.session_id, "token": session.qr_token, "expires_at": "..."})
+
+def test_extract_qr_token():
+    legacy = "{'session_id': 3, 'token': 'ab-c_9', 'expires_at': '2024-01-01T08:15:00.123456'}"
+    assert extract_qr_token(legacy) == "ab-c_9"
+    assert extract_qr_token("  abc ") == "abc"
+    assert extract_qr_token("{not a dict") is None
+    assert extract_qr_token("") is None
+
+@pytest.mark.parametrize("scanned", [
+    "{[1]: 2}",                        # unhashable key
+    "{'token': 'abc'}",                # not a payload we printed
+    "{'session_id': 3, 'token': 'abc', 'expires_at': 'x'}",
+    "{'session_id': 3, 'token': 7, 'expires_at': '2024-01-01T08:15:00'}",
+    "{" * 100000 + "}" * 100000,       # deeply nested
+    "A" * 10000,
+])
+def test_extract_qr_token_rejects_malformed_input(scanned):
+    assert extract_qr_token(scanned) is None
+
+def test_scan_marks_attendance_through_token(db):
+    session = create_session(db, SessionCreate(class_id=1, session_date=date.today()), creator_id=1)
+    assert session.qr_token and session.qr_code
+
+    attendance = mark_attendance(db, session.qr_token, user_id=1)
+    assert attendance.session_id == session.session_id
+    # Codes printed before the compact format still scan
+    assert mark_attendance(db, _scan_text(session), user_id=1) is not None
+    # The PNG itself is not a valid scan
+    assert mark_attendance(db, session.qr_code, user_id=1) is None
+
+def test_refreshed_and_ended_sessions_stop_resolving(db):
+    session = create_session(db, SessionCreate(class_id=1, session_date=date.today()), creator_id=1)
+    old_scan = _scan_text(session)
+
+    session = refresh_qr_code(db, session.session_id)
+    assert mark_attendance(db, old_scan, user_id=1) is None
+    new_scan = _scan_text(session)
+    assert mark_attendance(db, new_scan, user_id=1) is not None
+
+    end_session(db, session.session_id)
+    assert mark_attendance(db, new_scan, user_id=1) is None
+
+def test_cold_map_falls_back_to_index_and_honours_expiry(db):
+    session = create_session(db, SessionCreate(class_id=1, session_date=date.today()), creator_id=1)
+    tokens = ActiveQrTokens(cache_seconds=60)  # another worker, nothing cached
+    assert tokens.resolve(db, session.qr_token) == session.session_id
+
+    db.query(Session).update({Session.qr_expires_at: datetime.utcnow() - timedelta(seconds=1)})
+    db.commit()
+    assert ActiveQrTokens().resolve(db, session.qr_token) is None
+
+def test_signed_tokens_verify_within_skew_window():
+    signer = QrTokenSigner(secret_key="test", rotation_seconds=10, skew_windows=1)
+    token = signer.issue(42, now=1000.0)
+    assert signer.is_signed(token)
+    assert signer.verify(token, now=1005.0) == 42
+    assert signer.verify(token, now=1015.0) == 42   # previous window, still scanning
+    assert signer.verify(token, now=1025.0) is None  # shared screenshot, too late
+    assert signer.verify(token, now=995.0) == 42    # verifier clock slightly behind
+
+def test_tokens_are_short_and_qr_alphanumeric():
+    alphanumeric = set("0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ $%*+-./:")
+    for token in (new_random_token(), qr_signer.issue(123456)):
+        assert set(token) <= alphanumeric
+        assert len(token) <= 32
+
+def test_signed_tokens_reject_forgery():
+    signer = QrTokenSigner(secret_key="test", rotation_seconds=10)
+    token = signer.issue(42, now=1000.0)
+    raw = bytearray(_b32decode(token[len(SIGNED_PREFIX):]))
+    raw[3] = 43  # same window and MAC, other session
+    assert signer.verify(SIGNED_PREFIX + _b32encode(bytes(raw)), now=1000.0) is None
+    assert QrTokenSigner(secret_key="other", rotation_seconds=10).verify(token, now=1000.0) is None
+    assert signer.verify(token[:-2], now=1000.0) is None
+    assert signer.verify(SIGNED_PREFIX + "not base32!", now=1000.0) is None
+    assert signer.verify("not-a-token", now=1000.0) is None
+
+def test_scan_of_rotating_code_needs_no_session_row(db):
+    attendance = mark_attendance(db, qr_signer.issue(7), user_id=1)  # no session 7 in the database
+    assert attendance.session_id == 7
+
+def test_rotating_code_of_ended_session_is_refused(db):
+    session = create_session(db, SessionCreate(class_id=1, session_date=date.today()), creator_id=1)
+    screenshot = qr_signer.issue(session.session_id)
+    end_session(db, session.session_id)
+    assert qr_signer.verify(screenshot) == session.session_id  # still within its window
+    assert mark_attendance(db, screenshot, user_id=1) is None
+
+def test_ended_sessions_are_forgotten_after_last_window():
+    tokens = ActiveQrTokens(ended_seconds=-1.0)
+    tokens.revoke_session(3)
+    assert not tokens.is_ended(3)
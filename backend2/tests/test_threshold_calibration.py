@@ -0,0 +1,70 @@
+import numpy as np
+import pytest
+
+from app.core.config import settings
+from app.services.match_threshold import MatchThresholds
+from app.services.threshold_calibration import distance_histograms, recommend_threshold, roc_curve
+
+
+def _labelled_embeddings(people=12, photos=4, dim=16, noise=0.15, seed=0):
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(people, dim))
+    embeddings = np.repeat(centres, photos, axis=0) + noise * rng.normal(size=(people * photos, dim))
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings.astype(np.float32), np.repeat(np.arange(people), photos)
+
+def _brute_force(embeddings, labels):
+    genuine, impostor = [], []
+    for i in range(len(embeddings)):
+        for j in range(i + 1, len(embeddings)):
+            distance = np.linalg.norm(embeddings[i] - embeddings[j])
+            (genuine if labels[i] == labels[j] else impostor).append(distance)
+    return np.array(genuine), np.array(impostor)
+
+@pytest.mark.parametrize("block_size", [5, 16, 1000])
+def test_blocked_histograms_count_every_pair_once(block_size):
+    embeddings, labels = _labelled_embeddings()
+    histograms = distance_histograms(embeddings, labels, block_size=block_size, bins=200, max_distance=2.0)
+
+    genuine, impostor = _brute_force(embeddings, labels)
+    assert histograms.genuine.sum() == len(genuine)
+    assert histograms.impostor.sum() == len(impostor)
+    expected, _ = np.histogram(genuine, bins=histograms.edges)
+    # Binning of the matrix form may differ from the direct distance at bin edges
+    assert np.abs(histograms.genuine - expected).sum() <= 2
+
+def test_roc_rates_and_recommended_threshold():
+    embeddings, labels = _labelled_embeddings()
+    roc = roc_curve(distance_histograms(embeddings, labels, block_size=7, bins=400))
+    assert np.all(np.diff(roc.far) >= 0) and np.all(np.diff(roc.frr) <= 0)
+
+    genuine, impostor = _brute_force(embeddings, labels)
+    recommendation = recommend_threshold(roc, target_far=0.0)
+    assert np.mean(impostor < recommendation["threshold"]) == 0.0
+    assert recommendation["frr"] == pytest.approx(np.mean(genuine >= recommendation["threshold"]), abs=0.05)
+    assert recommendation["genuine_pairs"] == len(genuine)
+
+def test_roc_needs_genuine_pairs():
+    embeddings, _ = _labelled_embeddings(people=5, photos=1)
+    with pytest.raises(ValueError):
+        roc_curve(distance_histograms(embeddings, np.arange(5)))
+
+def test_thresholds_persist_per_model_with_fallback(tmp_path):
+    thresholds = MatchThresholds(str(tmp_path / "thresholds.json"))
+    assert thresholds.get(4) == settings.FACE_RECOGNITION_THRESHOLD
+
+    thresholds.save(4, 0.52, far=1e-5)
+    thresholds.save(5, 0.71)
+    reloaded = MatchThresholds(str(tmp_path / "thresholds.json"))
+    assert reloaded.get(4) == pytest.approx(0.52)
+    assert reloaded.get(5) == pytest.approx(0.71)
+    assert reloaded.entry(4)["far"] == 1e-5
+    assert reloaded.get(6) == settings.FACE_RECOGNITION_THRESHOLD
+
+def test_unreachable_target_far_raises():
+    # Two people with identical embeddings: even the strictest threshold accepts them
+    embeddings = np.array([[1.0, 0.0], [1.0, 0.0], [0.0, 1.0], [0.0, 1.0]], dtype=np.float32)
+    labels = np.array([0, 1, 2, 2])
+    roc = roc_curve(distance_histograms(embeddings, labels, bins=100))
+    with pytest.raises(ValueError):
+        recommend_threshold(roc, target_far=0.0)